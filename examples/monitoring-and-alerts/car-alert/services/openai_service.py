@@ -1,50 +1,115 @@
 """
 OpenAI service for text processing and embeddings
 """
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, APIConnectionError, InternalServerError, RateLimitError
+import asyncio
+import base64
+import hashlib
+import httpx
 import os
-from typing import List, Dict, Any
+import numpy as np
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
 
-class OpenAIService:
-    def __init__(self):
+# Optional native ANN backend (SIMD inner-product search)
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+# Shared client (one HTTP connection pool per process)
+_openai_client = None
+
+# Static agent system prompt. It is kept byte-identical and first in every
+# request so OpenAI's automatic prefix caching can reuse it (and the history
+# that follows) across turns; per-query context goes after the history.
+_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": (
+        "You are a helpful assistant for connected car alerts. "
+        "Use the context provided with each question to answer it."
+    )
+}
+_CONTEXT_PREFIX = "Context for the current question:\n\n"
+
+# Cap in-flight OpenAI requests so fan-out doesn't turn into a 429 storm
+_OPENAI_SEM = asyncio.Semaphore(int(os.getenv("OPENAI_CONCURRENCY", "20")))
+_MAX_ATTEMPTS = 5
+_RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
+async def _with_backoff(request):
+    """
+    Run an OpenAI request under the shared concurrency limit,
+    retrying rate limits and transient failures with exponential backoff
+    """
+    for attempt in range(_MAX_ATTEMPTS):
+        async with _OPENAI_SEM:
+            try:
+                return await request()
+            except _RETRYABLE_ERRORS as e:
+                if attempt == _MAX_ATTEMPTS - 1:
+                    raise
+                response = getattr(e, "response", None)
+                retry_after = response.headers.get("retry-after") if response is not None else None
+        
+        # Sleep outside the semaphore so waiting retries don't hold a slot
+        try:
+            delay = float(retry_after) if retry_after else 2 ** attempt
+        except ValueError:
+            delay = 2 ** attempt
+        await asyncio.sleep(delay)
+
+def get_openai_client() -> AsyncOpenAI:
+    """Get or create the shared AsyncOpenAI client"""
+    global _openai_client
+    if _openai_client is None:
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable is required")
-        self.client = AsyncOpenAI(api_key=api_key)
+        _openai_client = AsyncOpenAI(
+            api_key=api_key,
+            max_retries=0,  # retries are handled by _with_backoff
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+            )
+        )
+    return _openai_client
+
+# Max FAISS indexes kept in memory (one per distinct embedding index)
+_FAISS_CACHE_SIZE = 128
+
+class OpenAIService:
+    def __init__(self):
+        self.client = get_openai_client()
+        self._faiss_indexes: "OrderedDict[str, Any]" = OrderedDict()
     
     async def create_embedding(self, text: str) -> List[float]:
         """Create embedding for text"""
-        response = await self.client.embeddings.create(
+        response = await _with_backoff(lambda: self.client.embeddings.create(
             model="text-embedding-ada-002",
             input=text
-        )
+        ))
         return response.data[0].embedding
     
     async def create_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
         """Create embeddings for multiple texts"""
-        response = await self.client.embeddings.create(
+        response = await _with_backoff(lambda: self.client.embeddings.create(
             model="text-embedding-ada-002",
             input=texts
-        )
+        ))
         return [item.embedding for item in response.data]
     
     def chunk_text(self, text: str, chunk_size: int = 400, overlap: int = 40) -> List[str]:
         """Split text into overlapping chunks"""
-        chunks = []
-        start = 0
-        text_length = len(text)
+        step = chunk_size - overlap
         
-        while start < text_length:
-            end = start + chunk_size
-            chunk = text[start:end]
-            chunks.append(chunk)
-            start = end - overlap
-            
-            # Prevent infinite loop
-            if start <= 0 or chunk_size <= overlap:
-                break
+        # Prevent infinite loop: without a positive step, return a single chunk
+        if step <= 0:
+            return [text[:chunk_size]] if text else []
         
-        return chunks
+        # Window starts are a plain arithmetic range, so build every slice in one comprehension
+        return [text[start:start + chunk_size] for start in range(0, len(text), step)]
     
     async def chat_completion(
         self, 
@@ -54,32 +119,108 @@ class OpenAIService:
         """
         Generate chat completion with optional context from stored chunks
         """
-        # If we have context chunks, add them to the system message
+        # Stable prefix first (system prompt + history), then the per-query
+        # context right before the current user message
         if context_chunks:
-            context_text = "\n\n".join([f"Context {i+1}: {chunk}" for i, chunk in enumerate(context_chunks)])
-            system_message = {
+            context_text = "\n\n".join(f"Context {i+1}: {chunk}" for i, chunk in enumerate(context_chunks))
+            context_message = {
                 "role": "system",
-                "content": f"You are a helpful assistant for connected car alerts. Use the following context to answer questions:\n\n{context_text}"
+                "content": _CONTEXT_PREFIX + context_text
             }
-            messages = [system_message] + messages
+            messages = [_SYSTEM_MESSAGE] + messages[:-1] + [context_message] + messages[-1:]
+        else:
+            messages = [_SYSTEM_MESSAGE] + messages
         
-        response = await self.client.chat.completions.create(
+        response = await _with_backoff(lambda: self.client.chat.completions.create(
             model="gpt-4",
             messages=messages
-        )
+        ))
         
         return response.choices[0].message.content
     
     def cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
         """Calculate cosine similarity between two vectors"""
-        dot_product = sum(a * b for a, b in zip(vec1, vec2))
-        magnitude1 = sum(a * a for a in vec1) ** 0.5
-        magnitude2 = sum(b * b for b in vec2) ** 0.5
+        a = np.asarray(vec1, dtype=np.float32)
+        b = np.asarray(vec2, dtype=np.float32)
+        magnitude = float(np.linalg.norm(a) * np.linalg.norm(b))
         
-        if magnitude1 == 0 or magnitude2 == 0:
+        if magnitude == 0:
             return 0.0
         
-        return dot_product / (magnitude1 * magnitude2)
+        return float(a @ b) / magnitude
+    
+    def build_embedding_index(self, embeddings: List[List[float]]) -> np.ndarray:
+        """Stack embeddings into an L2-normalized float32 matrix (one row per chunk)"""
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+    
+    def serialize_embedding_index(self, matrix: np.ndarray) -> Dict[str, Any]:
+        """Encode an embedding matrix as a JSON-safe dict for Motia state"""
+        raw = matrix.tobytes()
+        return {
+            "vectors": base64.b64encode(raw).decode("ascii"),
+            "shape": list(matrix.shape),
+            "dtype": "float32",
+            # Content digest: identifies this exact index (e.g. as a FAISS cache key)
+            "digest": hashlib.blake2b(raw, digest_size=16).hexdigest()
+        }
+    
+    def deserialize_embedding_index(self, payload: Dict[str, Any]) -> np.ndarray:
+        """Decode an embedding matrix stored by serialize_embedding_index"""
+        raw = base64.b64decode(payload["vectors"])
+        return np.frombuffer(raw, dtype=np.float32).reshape(payload["shape"])
+    
+    def _get_faiss_index(self, index_key: str, matrix: np.ndarray):
+        """Get or build an inner-product FAISS index over normalized rows (keyed by content digest)"""
+        faiss_index = self._faiss_indexes.get(index_key)
+        if faiss_index is None:
+            faiss_index = faiss.IndexFlatIP(matrix.shape[1])
+            faiss_index.add(np.ascontiguousarray(matrix, dtype=np.float32))
+            self._faiss_indexes[index_key] = faiss_index
+            if len(self._faiss_indexes) > _FAISS_CACHE_SIZE:
+                self._faiss_indexes.popitem(last=False)
+        else:
+            self._faiss_indexes.move_to_end(index_key)
+        return faiss_index
+    
+    async def search_embedding_index(
+        self,
+        query: str,
+        texts: List[str],
+        matrix: np.ndarray,
+        top_k: int = 5,
+        index_key: Optional[str] = None
+    ) -> List[str]:
+        """
+        Return the top_k texts most similar to the query
+        matrix rows must be L2-normalized and aligned with texts
+        index_key (the matrix's content digest) lets a FAISS index built from
+        matrix be reused across queries
+        """
+        if not texts or matrix.size == 0:
+            return []
+        
+        query_vec = np.asarray(await self.create_embedding(query), dtype=np.float32)
+        norm = np.linalg.norm(query_vec)
+        if norm > 0:
+            query_vec /= norm
+        
+        k = min(top_k, len(texts))
+        
+        if FAISS_AVAILABLE and index_key is not None:
+            faiss_index = self._get_faiss_index(index_key, matrix)
+            _, ids = faiss_index.search(query_vec.reshape(1, -1), k)
+            return [texts[i] for i in ids[0] if i >= 0]
+        
+        scores = matrix @ query_vec
+        if k < len(texts):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(texts))
+        top = top[np.argsort(-scores[top])]
+        return [texts[i] for i in top]
     
     async def find_relevant_chunks(
         self, 
@@ -91,21 +232,12 @@ class OpenAIService:
         Find most relevant chunks for a query using embeddings
         stored_chunks should be a list of dicts with 'text' and 'embedding' keys
         """
-        # Create embedding for query
-        query_embedding = await self.create_embedding(query)
-        
-        # Calculate similarity scores
-        similarities = []
-        for chunk_data in stored_chunks:
-            similarity = self.cosine_similarity(query_embedding, chunk_data['embedding'])
-            similarities.append({
-                'text': chunk_data['text'],
-                'similarity': similarity
-            })
+        if not stored_chunks:
+            return []
         
-        # Sort by similarity and return top k
-        similarities.sort(key=lambda x: x['similarity'], reverse=True)
-        return [item['text'] for item in similarities[:top_k]]
+        texts = [chunk_data['text'] for chunk_data in stored_chunks]
+        matrix = self.build_embedding_index([chunk_data['embedding'] for chunk_data in stored_chunks])
+        return await self.search_embedding_index(query, texts, matrix, top_k)
 
 # Singleton instance
 _openai_service = None
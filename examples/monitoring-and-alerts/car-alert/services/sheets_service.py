@@ -5,6 +5,7 @@ from google.oauth2.credentials import Credentials
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+import asyncio
 import os
 import json
 from typing import List, Any, Dict
@@ -64,13 +65,15 @@ class SheetsService:
                 'values': [values]
             }
             
-            result = self.service.spreadsheets().values().append(
+            request = self.service.spreadsheets().values().append(
                 spreadsheetId=spreadsheet_id,
                 range=range_name,
                 valueInputOption='RAW',
                 insertDataOption='INSERT_ROWS',
                 body=body
-            ).execute()
+            )
+            # execute() does blocking HTTP I/O, keep it off the event loop
+            result = await asyncio.to_thread(request.execute)
             
             return {
                 'success': True,
@@ -108,13 +111,15 @@ class SheetsService:
                 'values': rows
             }
             
-            result = self.service.spreadsheets().values().append(
+            request = self.service.spreadsheets().values().append(
                 spreadsheetId=spreadsheet_id,
                 range=range_name,
                 valueInputOption='RAW',
                 insertDataOption='INSERT_ROWS',
                 body=body
-            ).execute()
+            )
+            # execute() does blocking HTTP I/O, keep it off the event loop
+            result = await asyncio.to_thread(request.execute)
             
             return {
                 'success': True,
@@ -125,7 +130,9 @@ class SheetsService:
         except HttpError as error:
             return {
                 'success': False,
-                'error': str(error)
+                'error': str(error),
+                'status': error.resp.status,
+                'retry_after': error.resp.get('retry-after')
             }
 
 # Singleton instance
@@ -2,19 +2,34 @@
 Agent Event Step for Connected Car Alerts
 Processes queries using stored embeddings and OpenAI chat with memory
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Dict, Any
+import asyncio
 
 # Import services
-import sys
 from services.openai_service import get_openai_service
 
 class AgentInput(BaseModel):
     """Input for agent processing"""
+    model_config = ConfigDict(frozen=True)
+    
     session_id: str = Field(..., description="Session ID for the conversation")
     query: str = Field(..., description="Query to process")
     state_group: str = Field(..., description="State group ID where chunks are stored")
 
+# Turns sent to the model as memory, and ring-buffer slots kept in state
+HISTORY_WINDOW_TURNS = 5
+HISTORY_MAX_TURNS = 10
+
+def _turn_key(seq: int) -> str:
+    return f"turn_{seq % HISTORY_MAX_TURNS}"
+
+def _unwrap_state(value: Any) -> Any:
+    """Motia state wraps data in {'data': actual_value}"""
+    if isinstance(value, dict) and 'data' in value:
+        return value['data']
+    return value
+
 config = {
     "type": "event",
     "name": "ProcessAlertAgent",
@@ -28,14 +43,14 @@ config = {
 async def handler(input_data, context):
     """
     Process car alert with AI agent
-    - Retrieve relevant chunks from state
+    - Retrieve relevant chunks from state via the precomputed embedding index
     - Load conversation memory
     - Use OpenAI chat to generate response
     - Store updated memory
     - Emit result for logging
     """
     try:
-        agent_input = AgentInput(**input_data)
+        agent_input = AgentInput.model_validate(input_data)
         
         context.logger.info("Agent processing started", {
             "session_id": agent_input.session_id,
@@ -45,20 +60,15 @@ async def handler(input_data, context):
         # Initialize OpenAI service
         openai_service = get_openai_service()
         
-        # Retrieve all chunks from state (limit to 50 chunks max to prevent memory issues)
-        stored_chunks = []
-        chunk_index = 0
-        max_chunks = 50
-        
-        while chunk_index < max_chunks:
-            chunk_key = f"chunk_{chunk_index}"
-            chunk_data = await context.state.get(agent_input.state_group, chunk_key)
-            
-            if chunk_data is None:
-                break
-            
-            stored_chunks.append(chunk_data)
-            chunk_index += 1
+        # Retrieve the chunk list and the embedding index stored at ingestion
+        chunks_raw, index_raw = await asyncio.gather(
+            context.state.get(agent_input.state_group, "chunks"),
+            context.state.get(agent_input.state_group, "embedding_index")
+        )
+        stored_chunks = _unwrap_state(chunks_raw)
+        if not isinstance(stored_chunks, list):
+            stored_chunks = []
+        index_raw = _unwrap_state(index_raw)
         
         context.logger.info("Retrieved chunks from state", {
             "num_chunks": len(stored_chunks),
@@ -66,75 +76,77 @@ async def handler(input_data, context):
             "first_chunk_sample": str(stored_chunks[0])[:100] if stored_chunks else "none"
         })
         
-        # Use all chunks as context (simplified - no embeddings/semantic search)
-        # For small/medium alerts this is efficient and avoids memory issues
-        relevant_chunks = []
+        # Collect chunk texts in stored order so they line up with the embedding index rows
+        chunk_texts = []
         for chunk in stored_chunks:
-            # Motia state wraps data in {'data': actual_value}
-            # Unwrap it first
-            if isinstance(chunk, dict) and 'data' in chunk:
-                chunk_data = chunk['data']
-                if isinstance(chunk_data, dict) and 'text' in chunk_data:
-                    relevant_chunks.append(chunk_data['text'])
-                elif isinstance(chunk_data, str):
-                    relevant_chunks.append(chunk_data)
-            elif isinstance(chunk, dict) and 'text' in chunk:
-                # Fallback: direct text access (if not wrapped)
-                relevant_chunks.append(chunk['text'])
+            if isinstance(chunk, dict) and 'text' in chunk:
+                chunk_texts.append(chunk['text'])
             elif isinstance(chunk, str):
-                # If state returns string directly
-                relevant_chunks.append(chunk)
+                chunk_texts.append(chunk)
             else:
                 context.logger.error("Unexpected chunk format", {
                     "chunk_type": type(chunk).__name__,
                     "chunk_value": str(chunk)[:200]
                 })
         
-        # If too many chunks, use only first 10 to stay within token limits
-        if len(relevant_chunks) > 10:
-            relevant_chunks = relevant_chunks[:10]
+        embedding_index = None
+        if isinstance(index_raw, dict) and 'vectors' in index_raw:
+            embedding_index = openai_service.deserialize_embedding_index(index_raw)
+            if embedding_index.shape[0] != len(chunk_texts):
+                context.logger.warn("Embedding index does not match stored chunks, skipping semantic search", {
+                    "index_rows": embedding_index.shape[0],
+                    "num_chunks": len(chunk_texts)
+                })
+                embedding_index = None
+        
+        if embedding_index is not None:
+            # Semantic top-k: one query embedding + one matrix product
+            relevant_chunks = await openai_service.search_embedding_index(
+                agent_input.query,
+                chunk_texts,
+                embedding_index,
+                top_k=5,
+                # Keyed by content, not session: a re-posted alert for the same
+                # session must never search the previous alert's vectors
+                index_key=index_raw.get('digest')
+            )
+        else:
+            # No index available, use the first 10 chunks to stay within token limits
+            relevant_chunks = chunk_texts[:10]
         
         context.logger.info("Using chunks as context", {
             "num_chunks": len(relevant_chunks)
         })
         
-        # Load conversation memory from state
+        # Load conversation memory from state: a head pointer plus one key per turn
         memory_group = f"memory_{agent_input.session_id}"
-        conversation_history_raw = await context.state.get(memory_group, "history")
-        
-        # Unwrap Motia state format {'data': actual_value}
-        if conversation_history_raw is None:
-            conversation_history = []
-        elif isinstance(conversation_history_raw, dict) and 'data' in conversation_history_raw:
-            conversation_history = conversation_history_raw['data']
-            if not isinstance(conversation_history, list):
-                # This is expected on first conversation when no history exists yet
-                context.logger.info("No conversation history found, starting fresh", {
-                    "type": type(conversation_history).__name__
+        head = _unwrap_state(await context.state.get(memory_group, "head"))
+        if not isinstance(head, int):
+            # This is expected on first conversation when no history exists yet
+            head = -1
+        
+        turn_seqs = range(max(0, head - HISTORY_WINDOW_TURNS + 1), head + 1)
+        turns = await asyncio.gather(*(
+            context.state.get(memory_group, _turn_key(seq)) for seq in turn_seqs
+        ))
+        
+        conversation_history = []
+        for turn in turns:
+            turn = _unwrap_state(turn)
+            if isinstance(turn, dict) and "user" in turn and "assistant" in turn:
+                conversation_history.append({"role": "user", "content": turn["user"]})
+                conversation_history.append({"role": "assistant", "content": turn["assistant"]})
+            elif turn is not None:
+                context.logger.error("Unexpected conversation turn format", {
+                    "type": type(turn).__name__,
+                    "value": str(turn)[:200]
                 })
-                conversation_history = []
-        elif isinstance(conversation_history_raw, list):
-            # Direct list (if not wrapped)
-            conversation_history = conversation_history_raw
-        else:
-            context.logger.error("Unexpected conversation history format", {
-                "type": type(conversation_history_raw).__name__,
-                "value": str(conversation_history_raw)[:200]
-            })
-            conversation_history = []
         
-        # Build messages for chat completion
-        messages = []
-        
-        # Add conversation history (last 10 messages for buffer window)
-        for msg in conversation_history[-10:]:
-            messages.append(msg)
-        
-        # Add current user query
-        messages.append({
+        # Build messages for chat completion: history (buffer window) + current user query
+        messages = conversation_history + [{
             "role": "user",
             "content": agent_input.query
-        })
+        }]
         
         # Get AI response with relevant chunks as context
         ai_response = await openai_service.chat_completion(
@@ -146,25 +158,16 @@ async def handler(input_data, context):
             "response_length": len(ai_response)
         })
         
-        # Update conversation memory - ensure it's a list before appending
-        if not isinstance(conversation_history, list):
-            conversation_history = []
-        
-        conversation_history.append({
-            "role": "user",
-            "content": agent_input.query
-        })
-        conversation_history.append({
-            "role": "assistant",
-            "content": ai_response
-        })
-        
-        # Store updated memory (keep last 20 messages for buffer window)
+        # Store this turn in its ring-buffer slot and advance the head pointer.
+        # Each write is O(1) instead of re-serializing the whole history window.
+        seq = head + 1
         try:
-            await context.state.set(
-                memory_group,
-                "history",
-                conversation_history[-20:]
+            await asyncio.gather(
+                context.state.set(memory_group, _turn_key(seq), {
+                    "user": agent_input.query,
+                    "assistant": ai_response
+                }),
+                context.state.set(memory_group, "head", seq)
             )
         except Exception as e:
             context.logger.error("Failed to store conversation history", {
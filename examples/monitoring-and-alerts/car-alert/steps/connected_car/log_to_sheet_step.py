@@ -1,18 +1,34 @@
 """
 Logger Event Step
-Logs agent results to local JSON file (or Google Sheets if configured)
+Logs agent results to a local JSONL file (or Google Sheets if configured)
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
+import asyncio
 import os
-import json
-from datetime import datetime
+import random
+import orjson
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Any, Dict, List, Optional
 
-# Import services (optional for Google Sheets)
-import sys
+# Google Sheets is optional: resolve the configuration and import its
+# (heavy, google-auth based) service once at load instead of per call
+USE_SHEETS = bool(
+    os.getenv("GOOGLE_SHEETS_ID") and
+    os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON")
+)
+
+if USE_SHEETS:
+    try:
+        from services.sheets_service import get_sheets_service
+    except ImportError:
+        # Google client libraries not installed, log to the local file only
+        USE_SHEETS = False
 
 class LogInput(BaseModel):
     """Input for logging to sheets"""
+    model_config = ConfigDict(frozen=True)
+    
     session_id: str = Field(..., description="Session ID")
     query: str = Field(..., description="User query")
     response: str = Field(..., description="AI response")
@@ -28,106 +44,211 @@ config = {
     "flows": ["connected-car-alert"]
 }
 
+# Google Sheets batching: concurrent handlers queue their rows and the flush
+# task appends them in one values.append call per batch (Sheets allows ~60
+# write requests/min/user). Each handler awaits the outcome for its own row,
+# so nothing is left queued when the handler returns.
+SHEETS_BATCH_SIZE = 500
+SHEETS_FLUSH_INTERVAL = 2.0
+SHEETS_MAX_ATTEMPTS = 5
+SHEETS_MAX_RETRY_DELAY = 30.0  # seconds; every handler in the batch waits on it
+
+_sheets_queue: Optional[asyncio.Queue] = None
+_sheets_flush_task: Optional[asyncio.Task] = None
+
+async def _log_to_sheets(log_entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Queue a log entry for the next Google Sheets batch and wait for its result"""
+    global _sheets_queue, _sheets_flush_task
+    if _sheets_queue is None:
+        _sheets_queue = asyncio.Queue()
+    if _sheets_flush_task is None or _sheets_flush_task.done():
+        _sheets_flush_task = asyncio.create_task(_flush_sheets_loop())
+    
+    done = asyncio.get_running_loop().create_future()
+    _sheets_queue.put_nowait((log_entry, done))
+    return await done
+
+async def _flush_sheets_loop() -> None:
+    """Drain queued entries, append them in batches and report each batch's result"""
+    loop = asyncio.get_running_loop()
+    
+    while True:
+        batch = [await _sheets_queue.get()]
+        deadline = loop.time() + SHEETS_FLUSH_INTERVAL
+        
+        while len(batch) < SHEETS_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_sheets_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        
+        try:
+            result = await _append_to_sheets([entry for entry, _ in batch])
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        
+        for _, done in batch:
+            if not done.done():
+                done.set_result(result)
+
+def _retry_delay(retry_after: Optional[str], attempt: int) -> float:
+    """Seconds to wait before the next append: Retry-After (in seconds, capped) or jittered backoff"""
+    try:
+        return min(float(retry_after), SHEETS_MAX_RETRY_DELAY)
+    except (TypeError, ValueError):
+        # Missing, or an HTTP-date we don't parse
+        return min(2 ** attempt + random.uniform(0, 1), SHEETS_MAX_RETRY_DELAY)
+
+async def _append_to_sheets(entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Append a batch of entries, backing off on 429/5xx; returns the last API result"""
+    sheets_service = get_sheets_service()
+    rows = [
+        [
+            entry["timestamp"].isoformat(),
+            entry["session_id"],
+            entry["query"],
+            entry["response"],
+            entry["num_chunks_used"]
+        ]
+        for entry in entries
+    ]
+    
+    for attempt in range(SHEETS_MAX_ATTEMPTS):
+        result = await sheets_service.append_rows(
+            spreadsheet_id=os.getenv("GOOGLE_SHEETS_ID"),
+            sheet_name=os.getenv("GOOGLE_SHEETS_TAB_NAME", "Log"),
+            rows=rows
+        )
+        
+        # Retry rate limits and server errors; anything else is permanent
+        status = result.get("status") or 0
+        if result.get("success") or not (status == 429 or status >= 500) or attempt == SHEETS_MAX_ATTEMPTS - 1:
+            break
+        
+        await asyncio.sleep(_retry_delay(result.get("retry_after"), attempt))
+    
+    return {**result, "rows": len(rows)}
+
+# Local logging: concurrent handlers queue their entries and a single writer
+# task appends each batch to disk off the event loop thread. Each handler
+# awaits the write containing its entry, so nothing is left unflushed.
+LOCAL_LOG_QUEUE_SIZE = 10_000
+LOCAL_LOG_BATCH_SIZE = 256
+LOCAL_LOG_FILE = Path("logs") / "car_alerts.jsonl"
+
+_local_log_queue: Optional[asyncio.Queue] = None
+_local_writer_task: Optional[asyncio.Task] = None
+
+# Entries written to the local log by this process (the file itself is never re-read)
+_local_log_count = 0
+
+async def _log_to_local_file(log_entry: Dict[str, Any]) -> int:
+    """Queue an entry for the local log file and wait until its batch is written"""
+    global _local_log_queue, _local_writer_task
+    if _local_log_queue is None:
+        _local_log_queue = asyncio.Queue(maxsize=LOCAL_LOG_QUEUE_SIZE)
+    if _local_writer_task is None or _local_writer_task.done():
+        _local_writer_task = asyncio.create_task(_local_writer_loop())
+    
+    done = asyncio.get_running_loop().create_future()
+    await _local_log_queue.put((log_entry, done))
+    return await done
+
+async def _local_writer_loop() -> None:
+    """Drain queued entries, append each batch with a single write and report back"""
+    global _local_log_count
+    
+    while True:
+        batch = [await _local_log_queue.get()]
+        while len(batch) < LOCAL_LOG_BATCH_SIZE and not _local_log_queue.empty():
+            batch.append(_local_log_queue.get_nowait())
+        
+        try:
+            await asyncio.to_thread(_write_local_logs, [entry for entry, _ in batch])
+            _local_log_count += len(batch)
+        except Exception as e:
+            for _, done in batch:
+                if not done.done():
+                    done.set_exception(e)
+            continue
+        
+        for _, done in batch:
+            if not done.done():
+                done.set_result(_local_log_count)
+
+# Reused serialization buffer; only the single writer task touches it
+_write_buffer = bytearray(64 * 1024)
+
+def _write_local_logs(entries: List[Dict[str, Any]]) -> None:
+    """Append entries to the local newline-delimited JSON log file"""
+    # Serialize the batch into the preallocated buffer, growing it only on overflow
+    offset = 0
+    for entry in entries:
+        line = orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE)
+        end = offset + len(line)
+        if end > len(_write_buffer):
+            _write_buffer.extend(bytes(max(end, 2 * len(_write_buffer)) - len(_write_buffer)))
+        _write_buffer[offset:end] = line
+        offset = end
+    
+    # Create logs directory if it doesn't exist
+    LOCAL_LOG_FILE.parent.mkdir(exist_ok=True)
+    
+    # Append-only: cost is proportional to the new entries, not the whole log
+    with open(LOCAL_LOG_FILE, "ab") as f, memoryview(_write_buffer) as view:
+        f.write(view[:offset])
+
 async def handler(input_data, context):
     """
-    Log results to local JSON file or Google Sheets
+    Log results to local JSONL file or Google Sheets
     - Format the log entry
-    - Append to local JSON file (default)
-    - Or append to Google Sheets if configured
+    - Append to local JSONL file (default)
+    - Or append to Google Sheets (batched with concurrent calls) if configured
     """
     try:
-        log_input = LogInput(**input_data)
+        log_input = LogInput.model_validate(input_data)
         
-        # Prepare log entry
-        timestamp = datetime.utcnow().isoformat()
+        # Prepare log entry (orjson serializes the datetime natively for the local file)
         log_entry = {
-            "timestamp": timestamp,
+            "timestamp": datetime.now(timezone.utc),
             "session_id": log_input.session_id,
             "query": log_input.query,
             "response": log_input.response,
             "num_chunks_used": log_input.num_chunks_used
         }
         
-        # Check if Google Sheets is configured
-        use_sheets = (
-            os.getenv("GOOGLE_SHEETS_ID") and 
-            os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON")
-        )
-        
-        if use_sheets:
-            # Try Google Sheets logging
+        if USE_SHEETS:
+            # Batched with concurrent handlers; failures fall back to the local file below
             try:
-                from services.sheets_service import get_sheets_service
-                
-                context.logger.info("Logging to Google Sheets", {
-                    "session_id": log_input.session_id
-                })
-                
-                sheets_service = get_sheets_service()
-                sheet_name = os.getenv("GOOGLE_SHEETS_TAB_NAME", "Log")
-                
-                row_data = [
-                    timestamp,
-                    log_input.session_id,
-                    log_input.query,
-                    log_input.response,
-                    log_input.num_chunks_used
-                ]
-                
-                result = await sheets_service.append_row(
-                    spreadsheet_id=os.getenv("GOOGLE_SHEETS_ID"),
-                    sheet_name=sheet_name,
-                    values=row_data
-                )
+                result = await _log_to_sheets(log_entry)
                 
                 if result.get("success"):
                     context.logger.info("Successfully logged to Google Sheets", {
                         "session_id": log_input.session_id,
+                        "batch_rows": result.get("rows"),
                         "updated_range": result.get("updated_range")
                     })
                     return
-                else:
-                    context.logger.error("Failed to log to Google Sheets, falling back to local file", {
-                        "error": result.get("error")
-                    })
+                
+                context.logger.error("Failed to log to Google Sheets, falling back to local file", {
+                    "error": result.get("error"),
+                    "session_id": log_input.session_id
+                })
             except Exception as e:
                 context.logger.error("Google Sheets logging failed, using local file", {
                     "error": str(e)
                 })
         
-        # Local JSON file logging (default or fallback)
-        context.logger.info("Logging to local JSON file", {
-            "session_id": log_input.session_id
-        })
-        
-        # Create logs directory if it doesn't exist
-        log_dir = Path("logs")
-        log_dir.mkdir(exist_ok=True)
-        
-        # Log file path
-        log_file = log_dir / "car_alerts.json"
-        
-        # Read existing logs
-        logs = []
-        if log_file.exists():
-            try:
-                with open(log_file, "r") as f:
-                    logs = json.load(f)
-            except json.JSONDecodeError:
-                context.logger.error("Existing log file is corrupted, starting fresh")
-                logs = []
-        
-        # Append new log
-        logs.append(log_entry)
-        
-        # Write back to file
-        with open(log_file, "w") as f:
-            json.dump(logs, f, indent=2)
+        # Local JSONL file logging (default or fallback)
+        total_logs = await _log_to_local_file(log_entry)
         
         context.logger.info("Successfully logged to local file", {
             "session_id": log_input.session_id,
-            "log_file": str(log_file),
-            "total_logs": len(logs)
+            "log_file": str(LOCAL_LOG_FILE),
+            "total_logs": total_logs
         })
         
     except Exception as e:
@@ -136,4 +257,3 @@ async def handler(input_data, context):
             "session_id": input_data.get("session_id")
         })
         # Don't raise - logging failure shouldn't break the workflow
-
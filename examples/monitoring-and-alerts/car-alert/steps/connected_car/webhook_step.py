@@ -2,17 +2,19 @@
 Webhook API Step for Connected Car Alerts
 Receives car alert data, chunks text, creates embeddings, and stores in state
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, Dict, Any
+import asyncio
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 
 # Import services
-import sys
 from services.openai_service import get_openai_service
 
 class CarAlertRequest(BaseModel):
     """Request body for car alert webhook"""
+    model_config = ConfigDict(frozen=True)
+    
     text: str = Field(..., description="The car alert text to process")
     query: Optional[str] = Field(None, description="Optional query to ask about the alert")
     session_id: Optional[str] = Field(None, description="Optional session ID for conversation continuity")
@@ -48,7 +50,7 @@ async def handler(req, context):
     """
     try:
         body = req.get("body", {})
-        car_alert = CarAlertRequest(**body)
+        car_alert = CarAlertRequest.model_validate(body)
         
         context.logger.info("Received car alert", {
             "text_length": len(car_alert.text),
@@ -66,25 +68,36 @@ async def handler(req, context):
         
         context.logger.info("Text chunked", {"num_chunks": len(chunks)})
         
-        # Store chunks (text only) in state - no embeddings to save memory
-        # We'll use simple text context instead of semantic search
         state_group = f"car_alerts_{session_id}"
         
-        # Store each chunk (just text, no embeddings)
-        for i, chunk in enumerate(chunks):
-            await context.state.set(state_group, f"chunk_{i}", {
-                "text": chunk,
-                "index": i,
-                "timestamp": datetime.utcnow().isoformat()
-            })
+        # Embed all chunks in one batch and store a normalized index once per session,
+        # so the agent only has to embed the query and run a single matrix product.
+        # Empty text yields no chunks; the embeddings API rejects an empty batch, so
+        # store no index (overwriting any stale one) and let the agent fall back
+        index_payload = None
+        if chunks:
+            embeddings = await openai_service.create_embeddings_batch(chunks)
+            embedding_index = openai_service.build_embedding_index(embeddings)
+            index_payload = openai_service.serialize_embedding_index(embedding_index)
         
-        # Store metadata
-        await context.state.set(state_group, "metadata", {
-            "session_id": session_id,
-            "total_chunks": len(chunks),
-            "created_at": datetime.utcnow().isoformat(),
-            "original_text": car_alert.text
-        })
+        # All chunk texts go under a single key (embeddings live in the index);
+        # the three writes are independent, so issue them concurrently
+        timestamp = datetime.now(timezone.utc).isoformat()
+        chunks_payload = [
+            {"text": chunk, "index": i, "timestamp": timestamp}
+            for i, chunk in enumerate(chunks)
+        ]
+        
+        await asyncio.gather(
+            context.state.set(state_group, "chunks", chunks_payload),
+            context.state.set(state_group, "embedding_index", index_payload),
+            context.state.set(state_group, "metadata", {
+                "session_id": session_id,
+                "total_chunks": len(chunks),
+                "created_at": timestamp,
+                "original_text": car_alert.text
+            })
+        )
         
         context.logger.info("Chunks stored in state", {
             "session_id": session_id,
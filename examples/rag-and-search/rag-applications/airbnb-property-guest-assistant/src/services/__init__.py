@@ -5,6 +5,7 @@ from .email_service import EmailService, get_email_service
 from .document_parser import DocumentParser, get_document_parser
 from .chunking_service import ChunkingService, get_chunking_service
 from .llm_service import LLMService, get_llm_service
+from .blob_store import BlobStore, get_blob_store
 
 __all__ = [
     "LanceDBService",
@@ -18,6 +19,8 @@ __all__ = [
     "ChunkingService",
     "get_chunking_service",
     "LLMService",
-    "get_llm_service"
+    "get_llm_service",
+    "BlobStore",
+    "get_blob_store"
 ]
 
@@ -0,0 +1,65 @@
+"""
+Document Blob Store for Airbnb Guest Assistant
+
+Holds raw document bytes between the discovery and parse steps so only a
+small reference travels through event payloads (Motia state and events are
+JSON, which would otherwise require base64-encoding every document).
+"""
+
+import functools
+import os
+import shutil
+from typing import Optional
+import aiofiles
+import aiofiles.os
+
+
+class BlobStore:
+    """Local filesystem store for raw document bytes."""
+    
+    BLOB_DIR = os.getenv("DOCUMENT_BLOB_DIR", "./data/blobs")
+    
+    def __init__(self, blob_dir: Optional[str] = None):
+        """
+        Initialize the blob store.
+        
+        Args:
+            blob_dir: Root directory for blobs (defaults to DOCUMENT_BLOB_DIR env var)
+        """
+        self.blob_dir = blob_dir or self.BLOB_DIR
+    
+    async def save(self, ingestion_id: str, index: int, content: bytes) -> str:
+        """
+        Store document bytes for an ingestion.
+        
+        Args:
+            ingestion_id: Ingestion job identifier
+            index: Document index within the ingestion
+            content: Raw document bytes
+        
+        Returns:
+            Blob reference to pass to load()
+        """
+        directory = os.path.join(self.blob_dir, ingestion_id)
+        await aiofiles.os.makedirs(directory, exist_ok=True)
+        
+        path = os.path.join(directory, f"{index}.bin")
+        async with aiofiles.open(path, "wb") as f:
+            await f.write(content)
+        return path
+    
+    async def load(self, blob_ref: str) -> bytes:
+        """Read document bytes by reference."""
+        async with aiofiles.open(blob_ref, "rb") as f:
+            return await f.read()
+    
+    async def delete_ingestion(self, ingestion_id: str):
+        """Remove all blobs stored for an ingestion."""
+        directory = os.path.join(self.blob_dir, ingestion_id)
+        await aiofiles.os.wrap(shutil.rmtree)(directory, ignore_errors=True)
+
+
+@functools.cache
+def get_blob_store() -> BlobStore:
+    """Get or create the blob store singleton."""
+    return BlobStore()
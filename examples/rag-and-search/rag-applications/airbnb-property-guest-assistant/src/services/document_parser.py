@@ -5,14 +5,214 @@ Parses various document formats (PDF, Word, HTML, Markdown) into
 a normalized structure preserving headings and sections.
 """
 
+import asyncio
+import codecs
+import io
 import os
 import re
+import hashlib
+import pickle
+import sqlite3
+import threading
 import httpx
-from typing import Optional, List, Dict, Any, Tuple
+from itertools import chain
+from typing import Optional, List, Dict, Any, Tuple, Iterator, Iterable, Union
+from urllib.parse import urlsplit
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
+from functools import cache, lru_cache
 from enum import Enum
 import chardet
 
+# Format parsers are imported once; each is only required for its format
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+try:
+    from docx import Document as DocxDocument
+except ImportError:
+    DocxDocument = None
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+try:
+    from charset_normalizer import from_bytes as detect_charset
+    CHARSET_NORMALIZER_AVAILABLE = True
+except ImportError:
+    CHARSET_NORMALIZER_AVAILABLE = False
+
+try:
+    import lxml.html
+    from lxml import etree
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+# Compiled once and shared by all parser instances
+_MD_HEADING_RE = re.compile(r'^(#{1,6})\s+(.+)$', re.MULTILINE)
+_MD_H1_RE = re.compile(r'^#\s+(.+)$', re.MULTILINE)
+# Bold, italic and links stripped in a single pass
+_MD_INLINE_RE = re.compile(r'\*\*([^*]+)\*\*|\*([^*]+)\*|\[([^\]]+)\]\([^)]+\)')
+# Section header lines: short and ending in a colon, numbered ("1. Title"),
+# or a capitalized label ending in a colon
+_HEADER_RE = re.compile(r'.{0,78}:$|\d+[\.\)]\s+[A-Z]|[A-Z][A-Za-z\s]+:$')
+
+_HTML_HEADINGS = frozenset({"h1", "h2", "h3", "h4", "h5", "h6"})
+_HTML_PARSER = "lxml" if LXML_AVAILABLE else "html.parser"
+
+# Document classifications keyed by a short content digest
+_CLASSIFY_CACHE_SIZE = 256
+
+# Detected encodings keyed by a digest of the detection sample
+_ENCODING_CACHE_SIZE = 256
+
+# Byte-order marks, longest first (the UTF-32 LE mark starts with the UTF-16 LE one)
+_BOM_ENCODINGS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+
+# Bytes sampled for statistical detection when the content isn't UTF-8
+_ENCODING_SAMPLE_SIZE = 64 * 1024
+
+# Parsed documents cached by URL with their ETag/Last-Modified validators
+DOCUMENT_CACHE_PATH = os.getenv("DOCUMENT_CACHE_PATH", "./data/document_cache.sqlite3")
+
+# Max documents fetched and parsed at once by parse_urls, overall and per host
+PARSE_URLS_CONCURRENCY = 10
+PARSE_URLS_PER_HOST = 4
+
+# PDF/Word parsing is CPU-bound and runs in worker processes, off the event loop
+_parse_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _strip_inline_markdown(match: re.Match) -> str:
+    """Return the text of whichever inline markdown construct matched."""
+    return match.group(1) or match.group(2) or match.group(3)
+
+
+def _element_text(element) -> str:
+    """Concatenated stripped text of an lxml element (like BeautifulSoup's get_text(strip=True))."""
+    return "".join(text.strip() for text in element.itertext())
+
+
+class _KeywordMatcher:
+    """
+    Finds all keyword occurrences in one pass over the text.
+    
+    Uses an Aho-Corasick automaton when pyahocorasick is installed,
+    otherwise a single regex alternation (and C-level str.count for counting).
+    """
+    
+    def __init__(self, keywords: Dict[str, Any]):
+        """
+        Args:
+            keywords: Mapping of keyword to the value reported when it occurs
+        """
+        # Longer, more specific phrases first
+        self._by_length = sorted(keywords.items(), key=lambda item: len(item[0]), reverse=True)
+        
+        self._values = dict(keywords)
+        
+        if AHOCORASICK_AVAILABLE:
+            self._automaton = ahocorasick.Automaton()
+            for keyword, value in keywords.items():
+                self._automaton.add_word(keyword, (keyword, value))
+            self._automaton.make_automaton()
+        else:
+            self._automaton = None
+            # Lookahead so overlapping keywords are all reported, as with the automaton
+            alternation = "|".join(re.escape(keyword) for keyword, _ in self._by_length)
+            self._pattern = re.compile(f"(?=({alternation}))")
+    
+    def iter(self, text: str) -> Iterator[Tuple[str, Any]]:
+        """Yield (keyword, value) for every occurrence in text."""
+        if self._automaton is not None:
+            for _, item in self._automaton.iter(text):
+                yield item
+        else:
+            for match in self._pattern.finditer(text):
+                keyword = match.group(1)
+                yield keyword, self._values[keyword]
+    
+    def search(self, text: str) -> bool:
+        """Check whether any keyword occurs in text."""
+        return next(self.iter(text), None) is not None
+    
+    def counts(self, text: str) -> List[Tuple[str, Any, int]]:
+        """Return (keyword, value, occurrences) for each keyword found in text."""
+        if self._automaton is not None:
+            found = Counter(keyword for _, (keyword, _value) in self._automaton.iter(text))
+            return [(keyword, self._values[keyword], count) for keyword, count in found.items()]
+        
+        return [
+            (keyword, value, count)
+            for keyword, value in self._by_length
+            if (count := text.count(keyword))
+        ]
+
+
+class _DocumentCache:
+    """SQLite-backed cache of parsed documents keyed by URL and language."""
+    
+    def __init__(self, path: str):
+        self._path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+    
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self._path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self._path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "key TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, document BLOB)"
+            )
+        return self._conn
+    
+    @staticmethod
+    def key(url: str, language: str) -> str:
+        return hashlib.sha256(f"{language}\n{url}".encode()).hexdigest()
+    
+    def get(self, key: str) -> Optional[Tuple[Optional[str], Optional[str], bytes]]:
+        """Return (etag, last_modified, pickled document) or None."""
+        with self._lock:
+            return self._connection().execute(
+                "SELECT etag, last_modified, document FROM documents WHERE key = ?", (key,)
+            ).fetchone()
+    
+    def put(self, key: str, etag: Optional[str], last_modified: Optional[str], document: "ParsedDocument"):
+        blob = pickle.dumps(document, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock, self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)",
+                (key, etag, last_modified, blob)
+            )
+
+
+def _keywords_by_doc_type(doc_type_keywords: Dict["DocType", List[str]]) -> Dict[str, Tuple["DocType", ...]]:
+    """Invert a doc type -> keywords table into keyword -> doc types."""
+    index: Dict[str, Tuple[DocType, ...]] = {}
+    for doc_type, keywords in doc_type_keywords.items():
+        for keyword in keywords:
+            index[keyword] = index.get(keyword, ()) + (doc_type,)
+    return index
+
 
 class DocType(str, Enum):
     """Document type classification."""
@@ -23,7 +223,7 @@ class DocType(str, Enum):
     UNKNOWN = "unknown"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ParsedSection:
     """A section extracted from a document."""
     title: str
@@ -32,7 +232,7 @@ class ParsedSection:
     is_critical: bool  # Safety, rules, emergency info
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ParsedDocument:
     """A fully parsed document."""
     title: str
@@ -85,10 +285,25 @@ class DocumentParser:
         ]
     }
     
+    # Keyword matchers built once from the tables above
+    _CRITICAL_MATCHER = _KeywordMatcher(dict.fromkeys(CRITICAL_KEYWORDS))
+    _DOC_TYPE_MATCHER = _KeywordMatcher(_keywords_by_doc_type(DOC_TYPE_KEYWORDS))
+    
     def __init__(self):
         """Initialize the parser."""
+        self._classify_cache: "OrderedDict[bytes, DocType]" = OrderedDict()
+        self._encoding_cache: "OrderedDict[bytes, str]" = OrderedDict()
+        self._document_cache = _DocumentCache(DOCUMENT_CACHE_PATH)
+        # Pooled keep-alive connections (HTTP/2 where the host supports it)
+        # so repeat fetches from the same host skip the TLS handshake
         self.http_client = httpx.AsyncClient(
-            timeout=60.0,
+            http2=True,
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=100,
+                max_keepalive_connections=20,
+                keepalive_expiry=30.0
+            ),
             follow_redirects=True,
             headers={"User-Agent": "AirbnbAssistant/1.0"}
         )
@@ -97,17 +312,22 @@ class DocumentParser:
         """Close the HTTP client."""
         await self.http_client.aclose()
     
-    async def fetch_url(self, url: str) -> Tuple[bytes, str, Dict[str, str]]:
+    async def fetch_url(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[bytes, str, Dict[str, str]]:
         """
         Fetch content from a URL.
         
         Args:
             url: The URL to fetch
+            headers: Extra request headers
             
         Returns:
             Tuple of (content_bytes, content_type, headers)
         """
-        response = await self.http_client.get(url)
+        response = await self.http_client.get(url, headers=headers)
         response.raise_for_status()
         
         content_type = response.headers.get("content-type", "").lower()
@@ -115,14 +335,64 @@ class DocumentParser:
     
     def detect_encoding(self, content: bytes) -> str:
         """Detect text encoding."""
-        result = chardet.detect(content)
-        return result.get("encoding", "utf-8") or "utf-8"
+        for bom, encoding in _BOM_ENCODINGS:
+            if content.startswith(bom):
+                return encoding
+        
+        # Most documents are ASCII/UTF-8: validating is far cheaper than detection
+        if content.isascii():
+            return "utf-8"
+        try:
+            codecs.decode(content, "utf-8")
+            return "utf-8"
+        except UnicodeDecodeError:
+            pass
+        
+        return self._detect_sampled_encoding(content)
+    
+    def decode_text(self, content: bytes) -> str:
+        """
+        Decode document bytes to text, detecting the encoding.
+        
+        Unlike decode(detect_encoding(...)), UTF-8 content is decoded
+        only once: the validating decode is the result.
+        """
+        for bom, encoding in _BOM_ENCODINGS:
+            if content.startswith(bom):
+                return content.decode(encoding, errors="replace")
+        
+        try:
+            return content.decode("utf-8")
+        except UnicodeDecodeError:
+            return content.decode(self._detect_sampled_encoding(content), errors="replace")
+    
+    def _detect_sampled_encoding(self, content: bytes) -> str:
+        """Statistical encoding detection on a sample of the content (cached per sample)."""
+        sample = content[:_ENCODING_SAMPLE_SIZE]
+        
+        key = hashlib.blake2b(sample, digest_size=16).digest()
+        encoding = self._encoding_cache.get(key)
+        if encoding is not None:
+            self._encoding_cache.move_to_end(key)
+            return encoding
+        
+        if CHARSET_NORMALIZER_AVAILABLE:
+            best = detect_charset(sample).best()
+            encoding = best.encoding if best else "utf-8"
+        else:
+            encoding = chardet.detect(sample).get("encoding", "utf-8") or "utf-8"
+        
+        self._encoding_cache[key] = encoding
+        if len(self._encoding_cache) > _ENCODING_CACHE_SIZE:
+            self._encoding_cache.popitem(last=False)
+        return encoding
     
     async def parse_url(
         self, 
         url: str, 
         property_id: str,
-        language: str = "en"
+        language: str = "en",
+        use_cache: bool = True
     ) -> ParsedDocument:
         """
         Parse a document from URL.
@@ -131,34 +401,99 @@ class DocumentParser:
             url: URL to fetch and parse
             property_id: Property identifier
             language: Document language
+            use_cache: Revalidate and reuse a previously parsed copy
             
         Returns:
             ParsedDocument with extracted content
         """
-        content, content_type, headers = await self.fetch_url(url)
+        if not use_cache:
+            content, content_type, _ = await self.fetch_url(url)
+            return await self._parse_fetched(content, content_type, url, property_id, language)
+        
+        cache_key = _DocumentCache.key(url, language)
+        cached = await asyncio.to_thread(self._document_cache.get, cache_key)
+        
+        # Conditional GET: an unchanged document costs a 304 and no parsing
+        request_headers = {}
+        if cached:
+            etag, last_modified, _ = cached
+            if etag:
+                request_headers["If-None-Match"] = etag
+            if last_modified:
+                request_headers["If-Modified-Since"] = last_modified
         
+        response = await self.http_client.get(url, headers=request_headers)
+        if cached and response.status_code == 304:
+            return pickle.loads(cached[2])
+        response.raise_for_status()
+        
+        content_type = response.headers.get("content-type", "").lower()
+        document = await self._parse_fetched(response.content, content_type, url, property_id, language)
+        
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        if etag or last_modified:
+            await asyncio.to_thread(self._document_cache.put, cache_key, etag, last_modified, document)
+        return document
+    
+    async def _parse_fetched(
+        self,
+        content: bytes,
+        content_type: str,
+        url: str,
+        property_id: str,
+        language: str
+    ) -> ParsedDocument:
+        """Parse fetched content based on its content type and URL."""
         # Determine format and parse
         if "pdf" in content_type or url.lower().endswith(".pdf"):
             return await self._parse_pdf(content, url, "", property_id, language)
         elif "html" in content_type or url.lower().endswith(".html"):
-            encoding = self.detect_encoding(content)
-            text = content.decode(encoding, errors="replace")
+            text = self.decode_text(content)
             return self._parse_html(text, url, "", property_id, language)
         elif any(ext in url.lower() for ext in [".md", ".markdown"]):
-            encoding = self.detect_encoding(content)
-            text = content.decode(encoding, errors="replace")
+            text = self.decode_text(content)
             return self._parse_markdown(text, url, "", property_id, language)
         elif any(ext in url.lower() for ext in [".doc", ".docx"]):
             return await self._parse_docx(content, url, "", property_id, language)
         else:
             # Try to parse as HTML or plain text
-            encoding = self.detect_encoding(content)
-            text = content.decode(encoding, errors="replace")
+            text = self.decode_text(content)
             if "<html" in text.lower() or "<body" in text.lower():
                 return self._parse_html(text, url, "", property_id, language)
             else:
                 return self._parse_plain_text(text, url, "", property_id, language)
     
+    async def parse_urls(
+        self,
+        urls: List[str],
+        property_id: str,
+        language: str = "en",
+        concurrency: int = PARSE_URLS_CONCURRENCY
+    ) -> List[Union[ParsedDocument, Exception]]:
+        """
+        Fetch and parse several documents concurrently.
+        
+        Args:
+            urls: URLs to fetch and parse
+            property_id: Property identifier
+            language: Document language
+            concurrency: Max documents in flight (at most PARSE_URLS_PER_HOST per host)
+            
+        Returns:
+            ParsedDocument, or the exception raised, for each URL in order
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        
+        async def parse_one(url: str) -> ParsedDocument:
+            host = urlsplit(url).netloc.lower()
+            host_semaphore = host_semaphores.setdefault(host, asyncio.Semaphore(PARSE_URLS_PER_HOST))
+            async with host_semaphore, semaphore:
+                return await self.parse_url(url, property_id, language)
+        
+        return await asyncio.gather(*(parse_one(url) for url in urls), return_exceptions=True)
+    
     async def parse_file(
         self,
         file_path: str,
@@ -186,18 +521,15 @@ class DocumentParser:
         if ext == ".pdf":
             return await self._parse_pdf(content, "", filename, property_id, language)
         elif ext in [".html", ".htm"]:
-            encoding = self.detect_encoding(content)
-            text = content.decode(encoding, errors="replace")
+            text = self.decode_text(content)
             return self._parse_html(text, "", filename, property_id, language)
         elif ext in [".md", ".markdown"]:
-            encoding = self.detect_encoding(content)
-            text = content.decode(encoding, errors="replace")
+            text = self.decode_text(content)
             return self._parse_markdown(text, "", filename, property_id, language)
         elif ext in [".doc", ".docx"]:
             return await self._parse_docx(content, "", filename, property_id, language)
         elif ext == ".txt":
-            encoding = self.detect_encoding(content)
-            text = content.decode(encoding, errors="replace")
+            text = self.decode_text(content)
             return self._parse_plain_text(text, "", filename, property_id, language)
         else:
             raise ValueError(f"Unsupported file format: {ext}")
@@ -209,22 +541,54 @@ class DocumentParser:
         filename: str,
         property_id: str,
         language: str
+    ) -> ParsedDocument:
+        """Parse PDF content in the parse process pool."""
+        return await asyncio.get_running_loop().run_in_executor(
+            _get_parse_pool(), _parse_in_worker, "pdf",
+            content, url, filename, property_id, language
+        )
+    
+    async def _parse_docx(
+        self,
+        content: bytes,
+        url: str,
+        filename: str,
+        property_id: str,
+        language: str
+    ) -> ParsedDocument:
+        """Parse Word document in the parse process pool."""
+        return await asyncio.get_running_loop().run_in_executor(
+            _get_parse_pool(), _parse_in_worker, "docx",
+            content, url, filename, property_id, language
+        )
+    
+    def _parse_pdf_sync(
+        self,
+        content: bytes,
+        url: str,
+        filename: str,
+        property_id: str,
+        language: str
     ) -> ParsedDocument:
         """Parse PDF content."""
         try:
-            from pypdf import PdfReader
-            import io
+            if PdfReader is None:
+                raise ValueError("pypdf is not installed")
             
             reader = PdfReader(io.BytesIO(content))
             
-            full_text = ""
+            pages = []
             for page in reader.pages:
                 text = page.extract_text()
                 if text:
-                    full_text += text + "\n\n"
+                    pages.append(text)
+            full_text = "\n\n".join(pages)
             
-            # Extract sections from PDF text
-            sections = self._extract_sections_from_text(full_text)
+            # Extract sections from the page lines (no re-split of the joined text)
+            sections = self._extract_sections_from_text(
+                full_text,
+                lines=chain.from_iterable(page.split("\n") for page in pages)
+            )
             doc_type = self._classify_document(full_text)
             
             title = filename or url.split("/")[-1] or "Untitled Document"
@@ -244,7 +608,7 @@ class DocumentParser:
         except Exception as e:
             raise ValueError(f"Failed to parse PDF: {str(e)}")
     
-    async def _parse_docx(
+    def _parse_docx_sync(
         self,
         content: bytes,
         url: str,
@@ -254,22 +618,26 @@ class DocumentParser:
     ) -> ParsedDocument:
         """Parse Word document."""
         try:
-            from docx import Document
-            import io
+            if DocxDocument is None:
+                raise ValueError("python-docx is not installed")
+            
+            doc = DocxDocument(io.BytesIO(content))
             
-            doc = Document(io.BytesIO(content))
+            # Read each paragraph's style and text from the XML once
+            paragraphs = [(para.style.name, para.text) for para in doc.paragraphs]
+            full_text = "\n".join(text for _, text in paragraphs)
             
             sections = []
             current_section = None
             current_content = []
             
-            for para in doc.paragraphs:
-                text = para.text.strip()
+            for style_name, text in paragraphs:
+                text = text.strip()
                 if not text:
                     continue
                 
                 # Check if this is a heading
-                if para.style.name.startswith("Heading"):
+                if style_name.startswith("Heading"):
                     # Save previous section
                     if current_section is not None:
                         sections.append(ParsedSection(
@@ -294,10 +662,8 @@ class DocumentParser:
             
             # If no sections found, create one from all text
             if not sections:
-                full_text = "\n".join([p.text for p in doc.paragraphs])
                 sections = self._extract_sections_from_text(full_text)
             
-            full_text = "\n".join([p.text for p in doc.paragraphs])
             doc_type = self._classify_document(full_text)
             
             title = filename or url.split("/")[-1] or "Untitled Document"
@@ -327,50 +693,29 @@ class DocumentParser:
     ) -> ParsedDocument:
         """Parse HTML content."""
         try:
-            from bs4 import BeautifulSoup
-            from markdownify import markdownify
-            
-            soup = BeautifulSoup(html, "html.parser")
+            extracted = None
+            if LXML_AVAILABLE:
+                try:
+                    extracted = self._extract_html_lxml(html)
+                except (ValueError, etree.ParserError):
+                    # Empty documents, XHTML with an encoding declaration, etc.
+                    extracted = None
+            if extracted is None:
+                extracted = self._extract_html_soup(html)
+            page_title, headings, full_text = extracted
             
-            # Remove script and style elements
-            for script in soup(["script", "style", "nav", "footer", "header"]):
-                script.decompose()
-            
-            # Extract title
-            title = filename or "Untitled"
-            if soup.title:
-                title = soup.title.string or title
-            
-            # Find main content
-            main = soup.find("main") or soup.find("article") or soup.body or soup
-            
-            # Extract sections from headings
-            sections = []
-            headings = main.find_all(["h1", "h2", "h3", "h4", "h5", "h6"])
-            
-            for i, heading in enumerate(headings):
-                heading_text = heading.get_text(strip=True)
-                level = int(heading.name[1])
-                
-                # Get content until next heading
-                content_parts = []
-                for sibling in heading.find_next_siblings():
-                    if sibling.name in ["h1", "h2", "h3", "h4", "h5", "h6"]:
-                        break
-                    text = sibling.get_text(strip=True)
-                    if text:
-                        content_parts.append(text)
-                
-                if content_parts:
-                    sections.append(ParsedSection(
-                        title=heading_text,
-                        content="\n".join(content_parts),
-                        level=level,
-                        is_critical=self._is_critical_section(heading_text)
-                    ))
+            title = page_title or filename or "Untitled"
             
-            # Get full text
-            full_text = main.get_text(separator="\n", strip=True)
+            sections = [
+                ParsedSection(
+                    title=heading_text,
+                    content="\n".join(content_parts),
+                    level=level,
+                    is_critical=self._is_critical_section(heading_text)
+                )
+                for heading_text, level, content_parts in headings
+                if content_parts
+            ]
             
             # If no sections, extract from text
             if not sections:
@@ -391,6 +736,104 @@ class DocumentParser:
         except Exception as e:
             raise ValueError(f"Failed to parse HTML: {str(e)}")
     
+    def _extract_html_lxml(self, html: str) -> Tuple[Optional[str], List[Tuple[str, int, List[str]]], str]:
+        """
+        Extract the title, heading sections and full text using lxml.
+        
+        Walks the tree once in document order: a section collects the
+        heading's following siblings until the next heading under the
+        same parent.
+        
+        Returns:
+            Tuple of (page_title, [(heading_text, level, content_parts)], full_text)
+        """
+        tree = lxml.html.document_fromstring(html)
+        
+        # Remove non-content elements (their tail text stays, as with decompose())
+        etree.strip_elements(
+            tree, etree.Comment, "script", "style", "nav", "footer", "header",
+            with_tail=False
+        )
+        
+        page_title = tree.findtext(".//title")
+        
+        # Find main content
+        main = next(
+            (el for el in (tree.find(".//main"), tree.find(".//article"), tree.find(".//body")) if el is not None),
+            tree
+        )
+        
+        headings = []  # (title, level, content_parts) in document order
+        open_sections = {}  # parent element -> content_parts of its current heading
+        
+        for el in main.iter():
+            tag = el.tag
+            if not isinstance(tag, str):
+                continue  # Entities, processing instructions
+            
+            if tag in _HTML_HEADINGS:
+                content_parts = []
+                headings.append((_element_text(el), int(tag[1]), content_parts))
+                open_sections[el.getparent()] = content_parts
+                continue
+            
+            content_parts = open_sections.get(el.getparent())
+            if content_parts is not None:
+                text = _element_text(el)
+                if text:
+                    content_parts.append(text)
+        
+        full_text = "\n".join(text for text in map(str.strip, main.itertext()) if text)
+        return page_title, headings, full_text
+    
+    def _extract_html_soup(self, html: str) -> Tuple[Optional[str], List[Tuple[str, int, List[str]]], str]:
+        """
+        Extract the title, heading sections and full text using BeautifulSoup.
+        
+        Returns:
+            Tuple of (page_title, [(heading_text, level, content_parts)], full_text)
+        """
+        if BeautifulSoup is None:
+            raise ValueError("beautifulsoup4 is not installed")
+        
+        soup = BeautifulSoup(html, _HTML_PARSER)
+        
+        # Remove script and style elements
+        for script in soup(["script", "style", "nav", "footer", "header"]):
+            script.decompose()
+        
+        # Extract title
+        page_title = soup.title.string if soup.title else None
+        
+        # Find main content
+        main = soup.find("main") or soup.find("article") or soup.body or soup
+        
+        # Extract sections from headings in one walk of the tree: a section
+        # collects the heading's following siblings until the next heading
+        # under the same parent
+        headings = []  # (title, level, content_parts) in document order
+        open_sections = {}  # id(parent) -> content_parts of its current heading
+        
+        for node in main.descendants:
+            if node.name is None:
+                continue  # Text node
+            
+            if node.name in _HTML_HEADINGS:
+                content_parts = []
+                headings.append((node.get_text(strip=True), int(node.name[1]), content_parts))
+                open_sections[id(node.parent)] = content_parts
+                continue
+            
+            content_parts = open_sections.get(id(node.parent))
+            if content_parts is not None:
+                text = node.get_text(strip=True)
+                if text:
+                    content_parts.append(text)
+        
+        # Get full text
+        full_text = main.get_text(separator="\n", strip=True)
+        return page_title, headings, full_text
+    
     def _parse_markdown(
         self,
         text: str,
@@ -402,11 +845,8 @@ class DocumentParser:
         """Parse Markdown content."""
         sections = []
         
-        # Split by headings
-        heading_pattern = re.compile(r'^(#{1,6})\s+(.+)$', re.MULTILINE)
-        
         # Find all headings
-        matches = list(heading_pattern.finditer(text))
+        matches = list(_MD_HEADING_RE.finditer(text))
         
         for i, match in enumerate(matches):
             level = len(match.group(1))
@@ -417,10 +857,8 @@ class DocumentParser:
             end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
             content = text[start:end].strip()
             
-            # Remove markdown formatting from content
-            content = re.sub(r'\*\*([^*]+)\*\*', r'\1', content)  # Bold
-            content = re.sub(r'\*([^*]+)\*', r'\1', content)      # Italic
-            content = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', content)  # Links
+            # Remove markdown formatting (bold, italic, links) from content
+            content = _MD_INLINE_RE.sub(_strip_inline_markdown, content)
             
             if content:
                 sections.append(ParsedSection(
@@ -437,7 +875,7 @@ class DocumentParser:
         title = filename or "Untitled"
         
         # Try to get title from first h1
-        h1_match = re.search(r'^#\s+(.+)$', text, re.MULTILINE)
+        h1_match = _MD_H1_RE.search(text)
         if h1_match:
             title = h1_match.group(1).strip()
         
@@ -476,12 +914,26 @@ class DocumentParser:
             metadata={}
         )
     
-    def _extract_sections_from_text(self, text: str) -> List[ParsedSection]:
-        """Extract sections from unstructured text using heuristics."""
+    def _extract_sections_from_text(
+        self,
+        text: str,
+        lines: Optional[Iterable[str]] = None
+    ) -> List[ParsedSection]:
+        """
+        Extract sections from unstructured text using heuristics.
+        
+        Args:
+            text: The full text
+            lines: Lines of text, if the caller already has them split
+            
+        Returns:
+            List of ParsedSection
+        """
         sections = []
         
         # Try to find section-like patterns (all caps lines, numbered sections, etc.)
-        lines = text.split("\n")
+        if lines is None:
+            lines = text.split("\n")
         current_section = "General"
         current_content = []
         
@@ -492,19 +944,12 @@ class DocumentParser:
             
             # Detect section headers (all caps, ends with colon, numbered)
             is_header = (
-                (line.isupper() and len(line) > 3 and len(line) < 100) or
-                (line.endswith(":") and len(line) < 80) or
-                (re.match(r'^\d+[\.\)]\s+[A-Z]', line)) or
-                (re.match(r'^[A-Z][A-Za-z\s]+:$', line))
+                (3 < len(line) < 100 and line.isupper()) or
+                _HEADER_RE.match(line)
             )
             
             if is_header and current_content:
-                sections.append(ParsedSection(
-                    title=current_section,
-                    content="\n".join(current_content),
-                    level=1,
-                    is_critical=self._is_critical_section(current_section)
-                ))
+                sections.append(self._text_section(current_section, "\n".join(current_content)))
                 current_section = line.rstrip(":")
                 current_content = []
             else:
@@ -512,26 +957,24 @@ class DocumentParser:
         
         # Add last section
         if current_content:
-            sections.append(ParsedSection(
-                title=current_section,
-                content="\n".join(current_content),
-                level=1,
-                is_critical=self._is_critical_section(current_section)
-            ))
+            sections.append(self._text_section(current_section, "\n".join(current_content)))
         
         # If only one section with "General" title, break into paragraphs
         if len(sections) == 1 and sections[0].title == "General":
             paragraphs = text.split("\n\n")
             sections = []
-            for i, para in enumerate(paragraphs):
+            for para in paragraphs:
                 para = para.strip()
-                if para and len(para) > 50:
-                    first_line = para.split("\n")[0][:50]
+                if len(para) > 50:
+                    first_line = para.split("\n", 1)[0]
+                    title = first_line[:50] + "..." if len(first_line) > 50 else first_line
+                    # The critical check runs on the first line (where safety/rules
+                    # headings appear), not the whole paragraph body
                     sections.append(ParsedSection(
-                        title=first_line + "..." if len(para.split("\n")[0]) > 50 else para.split("\n")[0],
+                        title=title,
                         content=para,
                         level=1,
-                        is_critical=self._is_critical_section(para)
+                        is_critical=self._is_critical_section(first_line)
                     ))
         
         return sections if sections else [ParsedSection(
@@ -541,21 +984,47 @@ class DocumentParser:
             is_critical=False
         )]
     
-    def _is_critical_section(self, text: str) -> bool:
+    def _text_section(self, title: str, content: str) -> ParsedSection:
+        """Build a top-level section found in unstructured text."""
+        return ParsedSection(
+            title=title,
+            content=content,
+            level=1,
+            is_critical=self._is_critical_section(title)
+        )
+    
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _is_critical_section(text: str) -> bool:
         """Check if section contains critical information."""
-        text_lower = text.lower()
-        return any(keyword in text_lower for keyword in self.CRITICAL_KEYWORDS)
+        return DocumentParser._CRITICAL_MATCHER.search(text.lower())
     
     def _classify_document(self, text: str) -> DocType:
-        """Classify document type based on content."""
+        """Classify document type based on content (cached per document text)."""
+        # A 32-byte digest is collision-safe on its own, so the (possibly
+        # multi-MB) text itself is never kept
+        key = hashlib.blake2b(text.encode(), digest_size=32).digest()
+        cached = self._classify_cache.get(key)
+        if cached is not None:
+            self._classify_cache.move_to_end(key)
+            return cached
+        
+        doc_type = self._score_document(text)
+        self._classify_cache[key] = doc_type
+        if len(self._classify_cache) > _CLASSIFY_CACHE_SIZE:
+            self._classify_cache.popitem(last=False)
+        return doc_type
+    
+    def _score_document(self, text: str) -> DocType:
+        """Score document text against each doc type's keywords."""
         text_lower = text.lower()
         
         scores = {doc_type: 0 for doc_type in DocType}
         
-        for doc_type, keywords in self.DOC_TYPE_KEYWORDS.items():
-            for keyword in keywords:
-                if keyword in text_lower:
-                    scores[doc_type] += 1
+        # Weight each keyword by how often it occurs, not just whether it does
+        for _, doc_types, count in self._DOC_TYPE_MATCHER.counts(text_lower):
+            for doc_type in doc_types:
+                scores[doc_type] += count
         
         # Get highest scoring type
         best_type = max(scores, key=scores.get)
@@ -565,14 +1034,37 @@ class DocumentParser:
         return DocType.UNKNOWN
 
 
-# Singleton instance
-_instance: Optional[DocumentParser] = None
+# Parser used inside each pool worker process
+_worker_parser: Optional[DocumentParser] = None
+
+
+def _get_parse_pool() -> ProcessPoolExecutor:
+    """Get or create the process pool for CPU-bound parsing."""
+    global _parse_pool
+    if _parse_pool is None:
+        _parse_pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _parse_pool
+
+
+def _parse_in_worker(
+    doc_format: str,
+    content: bytes,
+    url: str,
+    filename: str,
+    property_id: str,
+    language: str
+) -> ParsedDocument:
+    """Parse a PDF or Word document (runs in a pool worker process)."""
+    global _worker_parser
+    if _worker_parser is None:
+        _worker_parser = DocumentParser()
+    
+    parse = _worker_parser._parse_pdf_sync if doc_format == "pdf" else _worker_parser._parse_docx_sync
+    return parse(content, url, filename, property_id, language)
 
 
+@cache
 def get_document_parser() -> DocumentParser:
     """Get or create the document parser singleton."""
-    global _instance
-    if _instance is None:
-        _instance = DocumentParser()
-    return _instance
+    return DocumentParser()
 
@@ -4,9 +4,163 @@ Resend Email Service for Airbnb Guest Assistant
 Handles sending email notifications using Resend API.
 """
 
+import asyncio
+import functools
 import os
-from typing import List, Optional, Dict, Any
+import random
+import time
+import uuid
+from typing import List, Mapping, Optional, Dict, Any, Tuple
+import httpx
 import resend
+from jinja2 import DictLoader, Environment, FileSystemBytecodeCache
+
+# Resend accepts up to 100 emails per batch call and ~2 requests/second
+RESEND_BATCH_SIZE = 100
+RESEND_MIN_INTERVAL = 0.5  # seconds between API calls
+RESEND_MAX_ATTEMPTS = 5
+RESEND_TIMEOUT = 30.0
+
+# Email bodies, compiled once per process (bytecode cached on disk across restarts)
+_TEMPLATES = {
+    "ingestion_started.html": """
+        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+            <h2 style="color: #1a73e8;">📥 Document Ingestion Started</h2>
+            <div style="background: #f8f9fa; padding: 20px; border-radius: 8px; margin: 20px 0;">
+                <p><strong>Property ID:</strong> {{ property_id }}</p>
+                <p><strong>Ingestion ID:</strong> {{ ingestion_id }}</p>
+                <p><strong>Documents to process:</strong> {{ document_count }}</p>
+            </div>
+            <p style="color: #5f6368;">You will receive another notification when processing is complete.</p>
+        </div>
+    """,
+    "ingestion_complete.html": """
+        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+            {% if errors %}
+            <h2 style="color: #ea4335;">⚠️ Completed with Errors</h2>
+            {% else %}
+            <h2 style="color: #34a853;">✅ Completed Successfully</h2>
+            {% endif %}
+            <div style="background: #f8f9fa; padding: 20px; border-radius: 8px; margin: 20px 0;">
+                <p><strong>Property ID:</strong> {{ property_id }}</p>
+                <p><strong>Ingestion ID:</strong> {{ ingestion_id }}</p>
+                <p><strong>Documents processed:</strong> {{ documents_processed }}</p>
+                <p><strong>Knowledge chunks created:</strong> {{ chunks_created }}</p>
+            </div>
+            {% if errors %}
+            <div style="background: #fce8e6; padding: 15px; border-radius: 8px; margin: 15px 0;">
+                <strong style="color: #c5221f;">Errors:</strong>
+                <ul style="color: #c5221f;">{% for e in errors[:10] %}<li>{{ e }}</li>{% endfor %}</ul>
+                {% if errors|length > 10 %}<p><em>...and {{ errors|length - 10 }} more errors</em></p>{% endif %}
+            </div>
+            {% endif %}
+            <p style="color: #5f6368;">The property knowledge base is now ready for guest Q&amp;A.</p>
+        </div>
+    """,
+    "guest_answer.html": """
+        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+            <h2 style="color: #1a73e8;">Your Question Answered</h2>
+            
+            <div style="background: #e8f0fe; padding: 15px; border-radius: 8px; margin: 15px 0;">
+                <p style="color: #1967d2;"><strong>Your question:</strong></p>
+                <p style="color: #202124;">{{ question }}</p>
+            </div>
+            
+            <div style="background: #f8f9fa; padding: 20px; border-radius: 8px; margin: 20px 0;">
+                <p style="color: #202124; line-height: 1.6;">{{ answer }}</p>
+            </div>
+            
+            {% if sources %}
+            <div style="margin-top: 20px; padding-top: 15px; border-top: 1px solid #e0e0e0;">
+                <p style="color: #5f6368; font-size: 12px;"><strong>Sources:</strong></p>
+                <ul style="color: #5f6368; font-size: 12px;">{% for s in sources %}<li>{{ s }}</li>{% endfor %}</ul>
+            </div>
+            {% endif %}
+            
+            <p style="color: #5f6368; font-size: 12px; margin-top: 30px;">
+                If you have more questions, feel free to reply or ask our assistant.
+            </p>
+        </div>
+    """,
+}
+
+# autoescape: guest questions, LLM answers and error messages are untrusted text
+_ENV = Environment(
+    loader=DictLoader(_TEMPLATES),
+    autoescape=True,
+    auto_reload=False,
+    cache_size=-1,
+    bytecode_cache=FileSystemBytecodeCache()
+)
+
+_throttle_lock: Optional[asyncio.Lock] = None
+_next_call_at = 0.0
+
+
+async def _throttle():
+    """Space Resend API calls to stay under the account rate limit."""
+    global _throttle_lock, _next_call_at
+    if _throttle_lock is None:
+        _throttle_lock = asyncio.Lock()
+    
+    async with _throttle_lock:
+        delay = _next_call_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        _next_call_at = time.monotonic() + RESEND_MIN_INTERVAL
+
+
+def _retry_delay(error: Exception, attempt: int) -> Optional[float]:
+    """Backoff before retrying a failed Resend call, or None if the error is permanent."""
+    try:
+        code = int(getattr(error, "code", None))
+    except (TypeError, ValueError):
+        return None
+    
+    # Only rate limits and server errors are transient
+    if code != 429 and code < 500:
+        return None
+    
+    retry_after = getattr(error, "retry_after", None)
+    return float(retry_after) if retry_after else 2 ** attempt + random.uniform(0, 1)
+
+
+class _PooledHTTPClient(resend.HTTPClient):
+    """Resend transport over one keep-alive connection pool.
+    
+    The SDK's default client opens a new connection (and TLS handshake)
+    for every API call.
+    """
+    
+    def __init__(self, timeout: float = RESEND_TIMEOUT):
+        self._client = httpx.Client(
+            http2=True,
+            timeout=timeout,
+            limits=httpx.Limits(max_keepalive_connections=4, max_connections=8)
+        )
+    
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: Mapping[str, str],
+        json: Optional[Any] = None,
+        files: Optional[Dict[str, Any]] = None,
+        data: Optional[Dict[str, str]] = None
+    ) -> Tuple[bytes, int, Mapping[str, str]]:
+        try:
+            response = self._client.request(
+                method,
+                url,
+                headers=headers,
+                json=json if data is None and files is None else None,
+                data=data,
+                files=files
+            )
+        except httpx.HTTPError as e:
+            # Surfaced by the SDK as a ResendError, like its own client's failures
+            raise RuntimeError(f"Request failed: {e}") from e
+        return response.content, response.status_code, response.headers
 
 
 class EmailService:
@@ -33,6 +187,12 @@ class EmailService:
             raise ValueError("Resend API key not found. Set RESEND_API_KEY environment variable.")
         
         resend.api_key = self.api_key
+        resend.default_http_client = _PooledHTTPClient()
+        
+        # Parsed once; read on every notification without a recipient list
+        self._alert_recipients = tuple(
+            email.strip() for email in os.getenv("ALERT_RECIPIENTS", "").split(",") if email.strip()
+        )
     
     def send_email(
         self,
@@ -59,6 +219,35 @@ class EmailService:
         Returns:
             Response from Resend API
         """
+        params = self.message(to, subject, html, text, from_email, reply_to, tags)
+        response = self._send(params)
+        return response
+    
+    def _send(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Send one email, retrying rate limits and server errors with backoff."""
+        # One key for all attempts: if a failed attempt actually reached Resend
+        # (e.g. the connection dropped after the POST), the retry isn't sent twice
+        options = {"idempotency_key": str(uuid.uuid4())}
+        for attempt in range(RESEND_MAX_ATTEMPTS):
+            try:
+                return resend.Emails.send(params, options)
+            except Exception as e:
+                delay = _retry_delay(e, attempt)
+                if delay is None or attempt == RESEND_MAX_ATTEMPTS - 1:
+                    raise
+                time.sleep(delay)
+    
+    def message(
+        self,
+        to: List[str],
+        subject: str,
+        html: str,
+        text: Optional[str] = None,
+        from_email: Optional[str] = None,
+        reply_to: Optional[str] = None,
+        tags: Optional[List[Dict[str, str]]] = None
+    ) -> Dict[str, Any]:
+        """Build the Resend params for one email (see send_email)."""
         params = {
             "from": from_email or self.from_email,
             "to": to,
@@ -73,8 +262,40 @@ class EmailService:
         if tags:
             params["tags"] = tags
         
-        response = resend.Emails.send(params)
-        return response
+        return params
+    
+    async def send_batch(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Send many emails with as few API calls as possible.
+        
+        Messages are sent RESEND_BATCH_SIZE per call, throttled to the
+        Resend rate limit and retried with backoff on rate limits and
+        server errors (under an idempotency key, so retries never duplicate).
+        
+        Args:
+            messages: Params dicts, e.g. from message() or the *_message builders
+            
+        Returns:
+            Resend API response for each batch call
+        """
+        responses = []
+        for start in range(0, len(messages), RESEND_BATCH_SIZE):
+            batch = messages[start:start + RESEND_BATCH_SIZE]
+            # Retries of this batch reuse its key, so Resend never delivers it twice
+            options = {"idempotency_key": str(uuid.uuid4())}
+            
+            for attempt in range(RESEND_MAX_ATTEMPTS):
+                await _throttle()
+                try:
+                    responses.append(await asyncio.to_thread(resend.Batch.send, batch, options))
+                    break
+                except Exception as e:
+                    delay = _retry_delay(e, attempt)
+                    if delay is None or attempt == RESEND_MAX_ATTEMPTS - 1:
+                        raise
+                    await asyncio.sleep(delay)
+        
+        return responses
     
     def send_ingestion_started(
         self,
@@ -84,21 +305,27 @@ class EmailService:
         recipients: Optional[List[str]] = None
     ) -> Dict[str, Any]:
         """Send notification that ingestion has started."""
+        return self._send(self.ingestion_started_message(
+            property_id, ingestion_id, document_count, recipients
+        ))
+    
+    def ingestion_started_message(
+        self,
+        property_id: str,
+        ingestion_id: str,
+        document_count: int,
+        recipients: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Build the ingestion started email."""
         to = recipients or self._get_alert_recipients()
         
-        html = f"""
-        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-            <h2 style="color: #1a73e8;">📥 Document Ingestion Started</h2>
-            <div style="background: #f8f9fa; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                <p><strong>Property ID:</strong> {property_id}</p>
-                <p><strong>Ingestion ID:</strong> {ingestion_id}</p>
-                <p><strong>Documents to process:</strong> {document_count}</p>
-            </div>
-            <p style="color: #5f6368;">You will receive another notification when processing is complete.</p>
-        </div>
-        """
+        html = _ENV.get_template("ingestion_started.html").render(
+            property_id=property_id,
+            ingestion_id=ingestion_id,
+            document_count=document_count
+        )
         
-        return self.send_email(
+        return self.message(
             to=to,
             subject=f"🏠 Ingestion Started - Property {property_id}",
             html=html,
@@ -118,37 +345,31 @@ class EmailService:
         recipients: Optional[List[str]] = None
     ) -> Dict[str, Any]:
         """Send notification that ingestion is complete."""
+        return self._send(self.ingestion_complete_message(
+            property_id, ingestion_id, chunks_created, documents_processed, errors, recipients
+        ))
+    
+    def ingestion_complete_message(
+        self,
+        property_id: str,
+        ingestion_id: str,
+        chunks_created: int,
+        documents_processed: int,
+        errors: List[str],
+        recipients: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Build the ingestion complete email."""
         to = recipients or self._get_alert_recipients()
         
-        status_color = "#34a853" if not errors else "#ea4335"
-        status_text = "✅ Completed Successfully" if not errors else "⚠️ Completed with Errors"
-        
-        errors_html = ""
-        if errors:
-            errors_list = "".join([f"<li>{e}</li>" for e in errors[:10]])
-            errors_html = f"""
-            <div style="background: #fce8e6; padding: 15px; border-radius: 8px; margin: 15px 0;">
-                <strong style="color: #c5221f;">Errors:</strong>
-                <ul style="color: #c5221f;">{errors_list}</ul>
-                {f'<p><em>...and {len(errors) - 10} more errors</em></p>' if len(errors) > 10 else ''}
-            </div>
-            """
-        
-        html = f"""
-        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-            <h2 style="color: {status_color};">{status_text}</h2>
-            <div style="background: #f8f9fa; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                <p><strong>Property ID:</strong> {property_id}</p>
-                <p><strong>Ingestion ID:</strong> {ingestion_id}</p>
-                <p><strong>Documents processed:</strong> {documents_processed}</p>
-                <p><strong>Knowledge chunks created:</strong> {chunks_created}</p>
-            </div>
-            {errors_html}
-            <p style="color: #5f6368;">The property knowledge base is now ready for guest Q&A.</p>
-        </div>
-        """
+        html = _ENV.get_template("ingestion_complete.html").render(
+            property_id=property_id,
+            ingestion_id=ingestion_id,
+            documents_processed=documents_processed,
+            chunks_created=chunks_created,
+            errors=errors
+        )
         
-        return self.send_email(
+        return self.message(
             to=to,
             subject=f"🏠 Ingestion Complete - Property {property_id}",
             html=html,
@@ -167,38 +388,26 @@ class EmailService:
         sources: List[str]
     ) -> Dict[str, Any]:
         """Send an answer to a guest's question."""
-        sources_html = ""
-        if sources:
-            sources_list = "".join([f"<li>{s}</li>" for s in sources])
-            sources_html = f"""
-            <div style="margin-top: 20px; padding-top: 15px; border-top: 1px solid #e0e0e0;">
-                <p style="color: #5f6368; font-size: 12px;"><strong>Sources:</strong></p>
-                <ul style="color: #5f6368; font-size: 12px;">{sources_list}</ul>
-            </div>
-            """
-        
-        html = f"""
-        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-            <h2 style="color: #1a73e8;">Your Question Answered</h2>
-            
-            <div style="background: #e8f0fe; padding: 15px; border-radius: 8px; margin: 15px 0;">
-                <p style="color: #1967d2;"><strong>Your question:</strong></p>
-                <p style="color: #202124;">{question}</p>
-            </div>
-            
-            <div style="background: #f8f9fa; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                <p style="color: #202124; line-height: 1.6;">{answer}</p>
-            </div>
-            
-            {sources_html}
-            
-            <p style="color: #5f6368; font-size: 12px; margin-top: 30px;">
-                If you have more questions, feel free to reply or ask our assistant.
-            </p>
-        </div>
-        """
+        return self._send(self.guest_query_answer_message(
+            guest_email, property_id, question, answer, sources
+        ))
+    
+    def guest_query_answer_message(
+        self,
+        guest_email: str,
+        property_id: str,
+        question: str,
+        answer: str,
+        sources: List[str]
+    ) -> Dict[str, Any]:
+        """Build the guest answer email."""
+        html = _ENV.get_template("guest_answer.html").render(
+            question=question,
+            answer=answer,
+            sources=sources
+        )
         
-        return self.send_email(
+        return self.message(
             to=[guest_email],
             subject=f"🏠 Answer to your question",
             html=html,
@@ -209,21 +418,12 @@ class EmailService:
         )
     
     def _get_alert_recipients(self) -> List[str]:
-        """Get alert recipients from environment variable."""
-        recipients_str = os.getenv("ALERT_RECIPIENTS", "")
-        if not recipients_str:
-            return []
-        return [email.strip() for email in recipients_str.split(",") if email.strip()]
-
-
-# Singleton instance
-_instance: Optional[EmailService] = None
+        """Get alert recipients from the ALERT_RECIPIENTS environment variable."""
+        return list(self._alert_recipients)
 
 
+@functools.cache
 def get_email_service() -> EmailService:
     """Get or create the email service singleton."""
-    global _instance
-    if _instance is None:
-        _instance = EmailService()
-    return _instance
+    return EmailService()
 
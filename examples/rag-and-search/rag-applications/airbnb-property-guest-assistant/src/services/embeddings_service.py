@@ -4,9 +4,21 @@ OpenAI Embeddings Service for Airbnb Guest Assistant
 Handles text embedding generation using OpenAI's embedding models.
 """
 
+import asyncio
+import functools
 import os
-from typing import List, Optional
-from openai import OpenAI
+from typing import Dict, List, Optional, Tuple
+import httpx
+import numpy as np
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+# Keep-alive pool shared by back-to-back embed requests; HTTP/2 multiplexes
+# the concurrent batches of embed_texts_async over one TLS session
+OPENAI_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+OPENAI_TIMEOUT = 30.0
+# The SDK retries 429s, 5xx and connection errors with jittered exponential
+# backoff, honoring Retry-After; raise its default of 2 retries
+OPENAI_MAX_RETRIES = 5
 
 
 class EmbeddingsService:
@@ -14,6 +26,12 @@ class EmbeddingsService:
     
     EMBEDDING_MODEL = "text-embedding-3-small"
     EMBEDDING_DIMENSIONS = 1536
+    # Texts per embeddings request (mini-batch), and max requests in flight
+    # (async path); together they bound the request payloads held in memory
+    BATCH_SIZE = max(1, int(os.getenv("EMBED_MINI_BATCH", "64")))
+    MAX_CONCURRENT_BATCHES = 10
+    # Batch texts shorter than this (stripped) get a zero vector without an API call
+    MIN_TEXT_LENGTH = 3
     
     def __init__(self, api_key: Optional[str] = None):
         """
@@ -26,7 +44,18 @@ class EmbeddingsService:
         if not self.api_key:
             raise ValueError("OpenAI API key not found. Set OPENAI_API_KEY environment variable.")
         
-        self.client = OpenAI(api_key=self.api_key)
+        self.client = OpenAI(
+            api_key=self.api_key,
+            timeout=OPENAI_TIMEOUT,
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=DefaultHttpxClient(http2=True, limits=OPENAI_HTTP_LIMITS)
+        )
+        self.async_client = AsyncOpenAI(
+            api_key=self.api_key,
+            timeout=OPENAI_TIMEOUT,
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=DefaultAsyncHttpxClient(http2=True, limits=OPENAI_HTTP_LIMITS)
+        )
     
     def embed_text(self, text: str) -> List[float]:
         """
@@ -34,7 +63,7 @@ class EmbeddingsService:
         
         Args:
             text: The text to embed
-            
+        
         Returns:
             Vector embedding as list of floats
         """
@@ -49,41 +78,33 @@ class EmbeddingsService:
         
         return response.data[0].embedding
     
-    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+    async def embed_text_async(self, text: str) -> List[float]:
+        """Generate embedding for a single text without blocking the event loop."""
+        if not text or not text.strip():
+            return [0.0] * self.EMBEDDING_DIMENSIONS
+        
+        response = await self.async_client.embeddings.create(
+            model=self.EMBEDDING_MODEL,
+            input=text,
+            dimensions=self.EMBEDDING_DIMENSIONS
+        )
+        
+        return response.data[0].embedding
+    
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
         """
         Generate embeddings for multiple texts in batch.
         
         Args:
             texts: List of texts to embed
-            
+        
         Returns:
-            List of vector embeddings
+            float32 array of shape (len(texts), EMBEDDING_DIMENSIONS);
+            empty or very short texts get zero vectors
         """
-        if not texts:
-            return []
+        all_embeddings = self._empty_embeddings(len(texts))
         
-        # Filter empty texts and track indices
-        valid_texts = []
-        valid_indices = []
-        
-        for i, text in enumerate(texts):
-            if text and text.strip():
-                valid_texts.append(text)
-                valid_indices.append(i)
-        
-        if not valid_texts:
-            return [[0.0] * self.EMBEDDING_DIMENSIONS for _ in texts]
-        
-        # Batch embed (OpenAI supports up to ~8000 tokens per batch)
-        # Split into chunks of 100 texts for safety
-        all_embeddings = [None] * len(texts)
-        
-        batch_size = 100
-        for batch_start in range(0, len(valid_texts), batch_size):
-            batch_end = min(batch_start + batch_size, len(valid_texts))
-            batch_texts = valid_texts[batch_start:batch_end]
-            batch_indices = valid_indices[batch_start:batch_end]
-            
+        for batch_indices, batch_texts in self._batches(texts):
             response = self.client.embeddings.create(
                 model=self.EMBEDDING_MODEL,
                 input=batch_texts,
@@ -91,25 +112,72 @@ class EmbeddingsService:
             )
             
             for j, embedding_data in enumerate(response.data):
-                original_index = batch_indices[j]
-                all_embeddings[original_index] = embedding_data.embedding
+                all_embeddings[batch_indices[j]] = embedding_data.embedding
+        
+        return all_embeddings
+    
+    async def embed_texts_async(self, texts: List[str]) -> np.ndarray:
+        """
+        Generate embeddings for multiple texts, sending batches concurrently.
+        
+        Args:
+            texts: List of texts to embed
+        
+        Returns:
+            float32 array of shape (len(texts), EMBEDDING_DIMENSIONS);
+            empty or very short texts get zero vectors
+        """
+        all_embeddings = self._empty_embeddings(len(texts))
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_BATCHES)
+        
+        async def embed_batch(batch_indices: List[int], batch_texts: List[str]):
+            async with semaphore:
+                response = await self.async_client.embeddings.create(
+                    model=self.EMBEDDING_MODEL,
+                    input=batch_texts,
+                    dimensions=self.EMBEDDING_DIMENSIONS
+                )
+            
+            for j, embedding_data in enumerate(response.data):
+                all_embeddings[batch_indices[j]] = embedding_data.embedding
         
-        # Fill in empty embeddings for empty texts
-        for i in range(len(all_embeddings)):
-            if all_embeddings[i] is None:
-                all_embeddings[i] = [0.0] * self.EMBEDDING_DIMENSIONS
+        await asyncio.gather(*(
+            embed_batch(batch_indices, batch_texts)
+            for batch_indices, batch_texts in self._batches(texts)
+        ))
         
         return all_embeddings
+    
+    def _batches(self, texts: List[str]) -> List[Tuple[List[List[int]], List[str]]]:
+        """
+        Split texts into request batches of unique, non-trivial texts.
+        
+        Each batch pairs, per text sent, the original indices sharing that
+        text with the texts themselves, so duplicates are embedded once.
+        """
+        # Skip empty/very short texts and group duplicates by text
+        indices_by_text: Dict[str, List[int]] = {}
+        
+        for i, text in enumerate(texts):
+            if text and len(text.strip()) >= self.MIN_TEXT_LENGTH:
+                indices_by_text.setdefault(text, []).append(i)
+        
+        valid_texts = list(indices_by_text)
+        valid_indices = list(indices_by_text.values())
+        
+        # Batch embed in mini-batches of BATCH_SIZE texts
+        return [
+            (valid_indices[start:start + self.BATCH_SIZE], valid_texts[start:start + self.BATCH_SIZE])
+            for start in range(0, len(valid_texts), self.BATCH_SIZE)
+        ]
+    
+    def _empty_embeddings(self, count: int) -> np.ndarray:
+        """Allocate zeroed float32 rows (4 bytes per dimension, vs a boxed float per list item)."""
+        return np.zeros((count, self.EMBEDDING_DIMENSIONS), dtype=np.float32)
 
 
-# Singleton instance
-_instance: Optional[EmbeddingsService] = None
-
-
+@functools.cache
 def get_embeddings_service() -> EmbeddingsService:
     """Get or create the embeddings service singleton."""
-    global _instance
-    if _instance is None:
-        _instance = EmbeddingsService()
-    return _instance
+    return EmbeddingsService()
 
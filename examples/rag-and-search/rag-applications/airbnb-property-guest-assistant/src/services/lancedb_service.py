@@ -14,11 +14,19 @@ Manages vector storage for property documents with the following schema:
 - updated_at: timestamp
 """
 
+import functools
 import os
 import lancedb
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+import numpy as np
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Any, Iterable
 import pyarrow as pa
+import pyarrow.compute as pc
+
+
+def _sql_list(values: Iterable[str]) -> str:
+    """Format values as quoted SQL string literals for a filter expression."""
+    return ", ".join("'" + value.replace("'", "''") + "'" for value in values)
 
 
 class LanceDBService:
@@ -27,6 +35,36 @@ class LanceDBService:
     LANCE_DB_PATH = os.getenv("LANCE_DB_PATH", "./data/lancedb")
     TABLE_NAME = "property_docs"
     
+    # int8 scalar-quantized ANN index over the vectors, built once there are
+    # enough rows to train it; searches re-rank candidates on the fp32 vectors
+    VECTOR_INDEX_TYPE = "IVF_HNSW_SQ"
+    VECTOR_INDEX_MIN_ROWS = int(os.getenv("LANCE_VECTOR_INDEX_MIN_ROWS", "10000"))
+    REFINE_FACTOR = 5
+    
+    # Rows per write: one columnar Arrow table each, instead of one huge write
+    LANCE_BATCH = int(os.getenv("LANCE_BATCH", "500"))
+    
+    # Column defaults for documents missing a field
+    FIELD_DEFAULTS = {
+        "id": "",
+        "property_id": "",
+        "content": "",
+        "section_title": "",
+        "doc_type": "house_manual",
+        "language": "en",
+        "is_critical": False,
+        "source_url": "",
+        "source_filename": "",
+        "ingestion_id": "",
+    }
+    
+    # Vector precision for a new table: "fp16" halves storage and read
+    # bandwidth at negligible recall cost; an existing table keeps its own
+    EMBED_DTYPE = os.getenv("EMBED_DTYPE", "fp32")
+    VECTOR_TYPES = {"fp32": pa.float32(), "fp16": pa.float16()}
+    if EMBED_DTYPE not in VECTOR_TYPES:
+        raise ValueError(f"Unsupported EMBED_DTYPE {EMBED_DTYPE!r}, expected one of {sorted(VECTOR_TYPES)}")
+    
     # Schema for property documents
     SCHEMA = pa.schema([
         pa.field("id", pa.string()),
@@ -40,7 +78,7 @@ class LanceDBService:
         pa.field("source_filename", pa.string()),
         pa.field("ingestion_id", pa.string()),
         pa.field("updated_at", pa.string()),
-        pa.field("vector", pa.list_(pa.float32(), 1536)),  # OpenAI ada-002 embedding dimension
+        pa.field("vector", pa.list_(VECTOR_TYPES[EMBED_DTYPE], 1536)),  # OpenAI embedding dimension
     ])
     
     def __init__(self):
@@ -48,6 +86,9 @@ class LanceDBService:
         os.makedirs(self.LANCE_DB_PATH, exist_ok=True)
         self.db = lancedb.connect(self.LANCE_DB_PATH)
         self._ensure_table_exists()
+        
+        # NumPy dtype matching the table's vector column
+        self.vector_dtype = self.get_table().schema.field("vector").type.value_type.to_pandas_dtype()
     
     def _ensure_table_exists(self):
         """Create the property_docs table if it doesn't exist."""
@@ -64,6 +105,30 @@ class LanceDBService:
         """Get the property_docs table."""
         return self.db.open_table(self.TABLE_NAME)
     
+    def ensure_vector_index(self) -> bool:
+        """
+        Create the quantized vector index once the table is large enough.
+        
+        Below VECTOR_INDEX_MIN_ROWS an exact scan is fast and the index
+        could not be trained well, so searches stay brute force.
+        
+        Returns:
+            True if the index was created by this call
+        """
+        table = self.get_table()
+        
+        if any("vector" in index.columns for index in table.list_indices()):
+            return False
+        if table.count_rows() < self.VECTOR_INDEX_MIN_ROWS:
+            return False
+        
+        table.create_index(
+            metric="L2",
+            vector_column_name="vector",
+            index_type=self.VECTOR_INDEX_TYPE
+        )
+        return True
+    
     def add_documents(self, documents: List[Dict[str, Any]]) -> int:
         """
         Add documents to the vector store.
@@ -76,30 +141,58 @@ class LanceDBService:
         """
         if not documents:
             return 0
+        
+        now = datetime.now(timezone.utc).isoformat()
+        columns = {
+            name: [doc.get(name, default) for doc in documents]
+            for name, default in self.FIELD_DEFAULTS.items()
+        }
+        columns["updated_at"] = [doc.get("updated_at", now) for doc in documents]
+        vectors = [doc.get("vector", doc.get("embedding", [])) for doc in documents]
+        
+        return self.add_documents_batch(columns, vectors)
+    
+    def add_documents_batch(self, columns: Dict[str, List[Any]], vectors: Any) -> int:
+        """
+        Add documents given column-wise (one list per schema field).
+        
+        Args:
+            columns: Field name -> values; missing fields take FIELD_DEFAULTS
+                (updated_at defaults to now)
+            vectors: Embeddings, an array of shape (rows, dimensions)
             
+        Returns:
+            Number of documents added
+        """
         table = self.get_table()
+        batch = self._to_arrow(columns, vectors, table.schema)
         
-        # Ensure all documents have required fields
-        processed_docs = []
-        for doc in documents:
-            processed_doc = {
-                "id": doc.get("id", ""),
-                "property_id": doc.get("property_id", ""),
-                "content": doc.get("content", ""),
-                "section_title": doc.get("section_title", ""),
-                "doc_type": doc.get("doc_type", "house_manual"),
-                "language": doc.get("language", "en"),
-                "is_critical": doc.get("is_critical", False),
-                "source_url": doc.get("source_url", ""),
-                "source_filename": doc.get("source_filename", ""),
-                "ingestion_id": doc.get("ingestion_id", ""),
-                "updated_at": doc.get("updated_at", datetime.utcnow().isoformat()),
-                "vector": doc.get("vector", doc.get("embedding", [])),
-            }
-            processed_docs.append(processed_doc)
+        for start in range(0, batch.num_rows, self.LANCE_BATCH):
+            table.add(batch.slice(start, self.LANCE_BATCH))
         
-        table.add(processed_docs)
-        return len(processed_docs)
+        return batch.num_rows
+    
+    def _to_arrow(self, columns: Dict[str, List[Any]], vectors: Any, schema: pa.Schema) -> pa.Table:
+        """Build an Arrow table in the table schema from columns and vectors."""
+        # Vectors go in as one contiguous buffer rather than per-row lists
+        vectors = np.asarray(vectors, dtype=self.vector_dtype)
+        rows = len(vectors)
+        
+        defaults = {**self.FIELD_DEFAULTS, "updated_at": datetime.now(timezone.utc).isoformat()}
+        arrays = []
+        for field in schema:
+            if field.name == "vector":
+                arrays.append(pa.FixedSizeListArray.from_arrays(
+                    pa.array(vectors.reshape(-1)), field.type.list_size
+                ))
+            else:
+                values = columns.get(field.name)
+                arrays.append(pa.array(
+                    values if values is not None else [defaults[field.name]] * rows,
+                    type=field.type
+                ))
+        
+        return pa.Table.from_arrays(arrays, schema=schema)
     
     def delete_by_property_and_source(
         self, 
@@ -139,6 +232,38 @@ class LanceDBService:
         
         return count_before
     
+    def delete_by_property_and_sources(
+        self,
+        property_id: str,
+        source_urls: Iterable[str] = (),
+        source_filenames: Iterable[str] = ()
+    ) -> int:
+        """
+        Delete old chunks for a property from several sources in one call.
+        
+        Args:
+            property_id: The property identifier
+            source_urls: Source URLs to delete
+            source_filenames: Source filenames to delete
+            
+        Returns:
+            Number of documents deleted
+        """
+        source_filters = []
+        if source_urls:
+            source_filters.append(f"source_url IN ({_sql_list(source_urls)})")
+        if source_filenames:
+            source_filters.append(f"source_filename IN ({_sql_list(source_filenames)})")
+        if not source_filters:
+            return 0
+        
+        table = self.get_table()
+        filter_expr = f"property_id = {_sql_list([property_id])} AND ({' OR '.join(source_filters)})"
+        
+        count_before = table.count_rows(filter_expr)
+        table.delete(filter_expr)
+        return count_before
+    
     def delete_by_ingestion_id(self, ingestion_id: str) -> int:
         """Delete all documents from a specific ingestion job."""
         table = self.get_table()
@@ -188,9 +313,10 @@ class LanceDBService:
         # Perform vector search
         results = (
             table
-            .search(query_embedding)
-            .where(filter_expr)
+            .search(np.asarray(query_embedding, dtype=self.vector_dtype))
+            .where(filter_expr, prefilter=True)  # Filter before the ANN search, not after
             .limit(limit * 2 if include_critical_boost else limit)  # Get extra for re-ranking
+            .refine_factor(self.REFINE_FACTOR)  # Exact fp32 distances for indexed candidates
             .to_list()
         )
         
@@ -206,46 +332,57 @@ class LanceDBService:
         
         return results[:limit]
     
+    def optimize(self):
+        """
+        Compact small data files, prune old versions and fold new rows into
+        the vector index, so read latency stays stable as ingestions pile up.
+        """
+        self.get_table().optimize()
+    
     def get_property_stats(self, property_id: str) -> Dict[str, Any]:
         """Get statistics about documents for a property."""
         table = self.get_table()
         
-        filter_expr = f"property_id = '{property_id}'"
+        filter_expr = f"property_id = {_sql_list([property_id])}"
         
+        # One scan of just the three stat columns; aggregate in Arrow
         try:
-            docs = table.search().where(filter_expr).limit(10000).to_list()
+            total = table.count_rows(filter_expr)
+            rows = (
+                table.search()
+                .where(filter_expr)
+                .select(["doc_type", "language", "is_critical"])
+                .limit(total)
+                .to_arrow()
+            ) if total else None
         except Exception:
-            docs = []
+            rows = None
         
-        # Calculate stats
-        doc_types = {}
-        languages = set()
-        critical_count = 0
+        if rows is None or rows.num_rows == 0:
+            return {
+                "property_id": property_id,
+                "total_chunks": 0,
+                "doc_types": {},
+                "languages": [],
+                "critical_sections": 0
+            }
         
-        for doc in docs:
-            doc_type = doc.get("doc_type", "unknown")
-            doc_types[doc_type] = doc_types.get(doc_type, 0) + 1
-            languages.add(doc.get("language", "en"))
-            if doc.get("is_critical"):
-                critical_count += 1
+        doc_types = {
+            entry["values"]: entry["counts"]
+            for entry in pc.value_counts(rows["doc_type"].fill_null("unknown")).to_pylist()
+        }
         
         return {
             "property_id": property_id,
-            "total_chunks": len(docs),
+            "total_chunks": rows.num_rows,
             "doc_types": doc_types,
-            "languages": list(languages),
-            "critical_sections": critical_count
+            "languages": pc.unique(rows["language"].fill_null("en")).to_pylist(),
+            "critical_sections": pc.sum(rows["is_critical"].cast(pa.int64())).as_py() or 0
         }
 
 
-# Singleton instance
-_instance: Optional[LanceDBService] = None
-
-
+@functools.cache
 def get_lancedb_service() -> LanceDBService:
     """Get or create the LanceDB service singleton."""
-    global _instance
-    if _instance is None:
-        _instance = LanceDBService()
-    return _instance
+    return LanceDBService()
 
@@ -4,9 +4,63 @@ LLM Service for Airbnb Guest Assistant
 Handles GPT-based question answering using retrieved context.
 """
 
+import functools
 import os
-from typing import List, Dict, Any, Optional
-from openai import OpenAI
+import re
+import time
+import hashlib
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+import httpx
+import numpy as np
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+# Answer cache: repeat guest questions (checkout time, wifi password, ...)
+# skip embedding, retrieval and the GPT call entirely
+ANSWER_CACHE_SIZE = 1024
+ANSWER_CACHE_TTL = 24 * 60 * 60  # seconds
+# Paraphrased questions reuse an answer above this cosine similarity
+SEMANTIC_CACHE_THRESHOLD = 0.97
+SEMANTIC_CACHE_PER_SCOPE = 64
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Persistent HTTP/2 connection pool for chat completions
+OPENAI_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+OPENAI_TIMEOUT = 60.0
+OPENAI_MAX_RETRIES = 5  # SDK backoff on rate limits and transient errors
+
+_CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+
+@functools.cache
+def _get_encoding():
+    """
+    Load the model's tokenizer once per process.
+    
+    Returns None if tiktoken is missing or its encoding files can't be
+    fetched (e.g. offline); the failure is cached so it isn't retried per call.
+    """
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    try:
+        return tiktoken.encoding_for_model(LLMService.MODEL)
+    except Exception:
+        return None
+
+
+def _count_tokens(text: str) -> int:
+    """Count prompt tokens (estimated at ~4 characters per token without a tokenizer)."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
 
 
 class LLMService:
@@ -39,7 +93,163 @@ Property Context will be provided with each question."""
         if not self.api_key:
             raise ValueError("OpenAI API key not found. Set OPENAI_API_KEY environment variable.")
         
-        self.client = OpenAI(api_key=self.api_key)
+        self.client = OpenAI(
+            api_key=self.api_key,
+            timeout=OPENAI_TIMEOUT,
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=DefaultHttpxClient(http2=True, limits=OPENAI_HTTP_LIMITS)
+        )
+        self.async_client = AsyncOpenAI(
+            api_key=self.api_key,
+            timeout=OPENAI_TIMEOUT,
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=DefaultAsyncHttpxClient(http2=True, limits=OPENAI_HTTP_LIMITS)
+        )
+        
+        # key -> (expires_at, answer result)
+        self._answer_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # scope -> (unit embeddings matrix, [(expires_at, answer result)])
+        self._semantic_cache: Dict[str, Tuple[np.ndarray, List[Tuple[float, Dict[str, Any]]]]] = {}
+    
+    @staticmethod
+    def answer_cache_scope(
+        property_id: str,
+        language: str = "en",
+        doc_types: Optional[List[str]] = None,
+        version: Optional[str] = None
+    ) -> str:
+        """
+        Build the cache scope for a property's answers.
+        
+        Args:
+            property_id: Property identifier
+            language: Response language
+            doc_types: Doc type filter used for retrieval
+            version: Knowledge base version (changes when the property is re-ingested)
+        
+        Returns:
+            Scope string shared by all questions with the same retrieval inputs
+        """
+        return "|".join((property_id, language, ",".join(sorted(doc_types or ())), version or ""))
+    
+    @staticmethod
+    def answer_cache_group(property_id: str) -> str:
+        """
+        State group holding a property's persisted answers.
+        
+        Cleared when the property is re-ingested, so answers for old
+        knowledge base versions don't accumulate.
+        
+        Args:
+            property_id: Property identifier
+        
+        Returns:
+            Motia state group name
+        """
+        return f"qa_cache_{property_id}"
+    
+    @staticmethod
+    def answer_cache_key(scope: str, question: str) -> str:
+        """
+        Build the exact-match cache key for a question within a scope.
+        
+        Args:
+            scope: Scope from answer_cache_scope()
+            question: The guest's question
+        
+        Returns:
+            Hex digest of the scope and the normalized question
+        """
+        normalized = _WHITESPACE_RE.sub(" ", question.strip().lower())
+        return hashlib.blake2b(f"{scope}\0{normalized}".encode(), digest_size=16).hexdigest()
+    
+    def get_cached_answer(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return an unexpired cached answer for an exact-match key."""
+        entry = self._answer_cache.get(key)
+        if entry is None:
+            return None
+        
+        expires_at, result = entry
+        if expires_at <= time.time():
+            del self._answer_cache[key]
+            return None
+        
+        self._answer_cache.move_to_end(key)
+        return result
+    
+    def find_similar_answer(self, scope: str, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """
+        Return a cached answer for a paraphrase of an earlier question.
+        
+        Args:
+            scope: Scope from answer_cache_scope()
+            embedding: Embedding of the new question
+        
+        Returns:
+            The answer of the most similar cached question, if similar enough
+        """
+        cached = self._semantic_cache.get(scope)
+        if cached is None:
+            return None
+        
+        matrix, results = cached
+        query = np.asarray(embedding, dtype=np.float32)
+        similarities = matrix @ (query / (np.linalg.norm(query) or 1.0))
+        
+        best = int(similarities.argmax())
+        expires_at, result = results[best]
+        if similarities[best] < SEMANTIC_CACHE_THRESHOLD or expires_at <= time.time():
+            return None
+        return result
+    
+    def cache_answer(
+        self,
+        key: str,
+        result: Dict[str, Any],
+        expires_at: Optional[float] = None,
+        scope: Optional[str] = None,
+        embedding: Optional[List[float]] = None
+    ) -> float:
+        """
+        Store an answer in the in-memory caches.
+        
+        Args:
+            key: Key from answer_cache_key()
+            result: Result of answer_question()
+            expires_at: Unix expiry time (defaults to now + ANSWER_CACHE_TTL)
+            scope: Scope for the semantic cache (requires embedding)
+            embedding: Embedding of the question
+        
+        Returns:
+            Unix expiry time of the entry
+        """
+        expires_at = expires_at or time.time() + ANSWER_CACHE_TTL
+        
+        self._answer_cache[key] = (expires_at, result)
+        self._answer_cache.move_to_end(key)
+        if len(self._answer_cache) > ANSWER_CACHE_SIZE:
+            self._answer_cache.popitem(last=False)
+        
+        if scope is None or embedding is None:
+            return expires_at
+        
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        
+        cached = self._semantic_cache.get(scope)
+        if cached is None or cached[0].shape[1] != vector.shape[0]:
+            matrix, results = np.empty((0, vector.shape[0]), dtype=np.float32), []
+        else:
+            matrix, results = cached
+        
+        # Keep the most recent questions per scope
+        matrix = np.vstack((matrix, vector))[-SEMANTIC_CACHE_PER_SCOPE:]
+        results = (results + [(expires_at, result)])[-SEMANTIC_CACHE_PER_SCOPE:]
+        self._semantic_cache[scope] = (matrix, results)
+        
+        if len(self._semantic_cache) > ANSWER_CACHE_SIZE:
+            self._semantic_cache.pop(next(iter(self._semantic_cache)))
+        return expires_at
     
     def answer_question(
         self,
@@ -56,12 +266,45 @@ Property Context will be provided with each question."""
             context_chunks: Retrieved document chunks from LanceDB
             property_id: Property identifier
             language: Response language
-            
+        
         Returns:
             Dict with answer, confidence, and sources
         """
-        # Format context from chunks
-        context = self._format_context(context_chunks)
+        # Format context from the best-ranked chunks that fit the token budget
+        prompt_chunks = self._select_context(context_chunks)
+        
+        # Call GPT
+        response = self.client.chat.completions.create(
+            **self._completion_params(question, prompt_chunks, property_id, language)
+        )
+        
+        return self._answer_result(response, context_chunks, prompt_chunks)
+    
+    async def answer_question_async(
+        self,
+        question: str,
+        context_chunks: List[Dict[str, Any]],
+        property_id: str,
+        language: str = "en"
+    ) -> Dict[str, Any]:
+        """Answer a guest question without blocking the event loop (see answer_question)."""
+        prompt_chunks = self._select_context(context_chunks)
+        
+        response = await self.async_client.chat.completions.create(
+            **self._completion_params(question, prompt_chunks, property_id, language)
+        )
+        
+        return self._answer_result(response, context_chunks, prompt_chunks)
+    
+    def _completion_params(
+        self,
+        question: str,
+        prompt_chunks: List[Dict[str, Any]],
+        property_id: str,
+        language: str
+    ) -> Dict[str, Any]:
+        """Build the chat completion request for a question."""
+        context = self._format_context(prompt_chunks)
         
         # Build the prompt
         user_message = f"""Property ID: {property_id}
@@ -78,21 +321,27 @@ Please provide a helpful answer based on the property context above."""
         if language != "en":
             user_message += f"\n\nPlease respond in {self._get_language_name(language)}."
         
-        # Call GPT
-        response = self.client.chat.completions.create(
-            model=self.MODEL,
-            messages=[
+        return {
+            "model": self.MODEL,
+            "messages": [
                 {"role": "system", "content": self.SYSTEM_PROMPT},
                 {"role": "user", "content": user_message}
             ],
-            temperature=0.3,  # Lower temperature for more factual responses
-            max_tokens=1000
-        )
-        
+            "temperature": 0.3,  # Lower temperature for more factual responses
+            "max_tokens": 1000
+        }
+    
+    def _answer_result(
+        self,
+        response,
+        context_chunks: List[Dict[str, Any]],
+        prompt_chunks: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Build the answer dict from a chat completion response."""
         answer = response.choices[0].message.content
         
         # Extract sources from context
-        sources = self._extract_sources(context_chunks)
+        sources = self._extract_sources(prompt_chunks)
         
         # Calculate confidence based on retrieval scores
         confidence = self._calculate_confidence(context_chunks)
@@ -101,31 +350,41 @@ Please provide a helpful answer based on the property context above."""
             "answer": answer,
             "confidence": confidence,
             "sources": sources,
-            "context_chunks_used": len(context_chunks),
+            "context_chunks_used": len(prompt_chunks),
             "model": self.MODEL
         }
     
+    def _select_context(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Keep chunks in retrieval order until MAX_CONTEXT_TOKENS is reached.
+        
+        The first chunk is always kept so the prompt is never empty.
+        """
+        separator_tokens = _count_tokens(_CONTEXT_SEPARATOR)
+        total_tokens = 0
+        
+        for i, chunk in enumerate(chunks, 1):
+            total_tokens += _count_tokens(self._format_chunk(i, chunk)) + separator_tokens
+            if total_tokens > self.MAX_CONTEXT_TOKENS and i > 1:
+                return chunks[:i - 1]
+        return chunks
+    
     def _format_context(self, chunks: List[Dict[str, Any]]) -> str:
         """Format context chunks for the prompt."""
         if not chunks:
             return "No relevant information found in property documents."
         
-        formatted_parts = []
-        
-        for i, chunk in enumerate(chunks, 1):
-            section = chunk.get("section_title", "General")
-            content = chunk.get("content", "")
-            doc_type = chunk.get("doc_type", "")
-            is_critical = chunk.get("is_critical", False)
-            
-            # Add critical marker
-            critical_marker = "⚠️ IMPORTANT: " if is_critical else ""
-            
-            formatted_parts.append(
-                f"[Source {i}: {doc_type} - {section}]\n{critical_marker}{content}"
-            )
-        
-        return "\n\n---\n\n".join(formatted_parts)
+        return _CONTEXT_SEPARATOR.join(
+            self._format_chunk(i, chunk) for i, chunk in enumerate(chunks, 1)
+        )
+    
+    @staticmethod
+    def _format_chunk(index: int, chunk: Dict[str, Any]) -> str:
+        """Format a single chunk, prefixing critical chunks with a marker."""
+        return (
+            f"[Source {index}: {chunk.get('doc_type', '')} - {chunk.get('section_title', 'General')}]\n"
+            f"{'⚠️ IMPORTANT: ' if chunk.get('is_critical') else ''}{chunk.get('content', '')}"
+        )
     
     def _extract_sources(self, chunks: List[Dict[str, Any]]) -> List[str]:
         """Extract source references from chunks."""
@@ -151,10 +410,16 @@ Please provide a helpful answer based on the property context above."""
             return "low"
         
         # Check distances (lower is better)
-        avg_distance = sum(c.get("_distance", 1.0) for c in chunks) / len(chunks)
+        distances = np.fromiter(
+            (c.get("_distance", 1.0) for c in chunks), dtype=np.float32, count=len(chunks)
+        )
+        avg_distance = float(distances.mean())
         
         # Check if we have critical/policy info
-        has_critical = any(c.get("is_critical") for c in chunks)
+        critical = np.fromiter(
+            (bool(c.get("is_critical")) for c in chunks), dtype=np.bool_, count=len(chunks)
+        )
+        has_critical = bool(critical.any())
         
         if avg_distance < 0.3 or (has_critical and avg_distance < 0.5):
             return "high"
@@ -180,14 +445,8 @@ Please provide a helpful answer based on the property context above."""
         return languages.get(code, "English")
 
 
-# Singleton instance
-_instance: Optional[LLMService] = None
-
-
+@functools.cache
 def get_llm_service() -> LLMService:
     """Get or create the LLM service singleton."""
-    global _instance
-    if _instance is None:
-        _instance = LLMService()
-    return _instance
+    return LLMService()
 
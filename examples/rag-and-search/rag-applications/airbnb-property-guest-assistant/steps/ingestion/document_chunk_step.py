@@ -8,7 +8,7 @@ Marks critical sections (safety, house rules, emergency contacts) for higher ret
 
 from pydantic import BaseModel
 from typing import List, Dict, Any
-from datetime import datetime
+from datetime import datetime, timezone
 import os
 import sys
 
@@ -132,7 +132,7 @@ async def handler(input_data, context):
         if job:
             job["documents_chunked"] = len(parsed_documents) - len(errors)
             job["errors"] = job.get("errors", []) + errors
-            job["updated_at"] = datetime.utcnow().isoformat()
+            job["updated_at"] = datetime.now(timezone.utc).isoformat()
             await context.state.set("ingestion_jobs", ingestion_id, job)
         
         context.logger.info("Document chunking complete", {
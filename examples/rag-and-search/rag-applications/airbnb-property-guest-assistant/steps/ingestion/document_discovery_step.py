@@ -8,11 +8,13 @@ Validates size, format, and content-type before passing to parsing.
 
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
-from datetime import datetime
+from datetime import datetime, timezone
+import asyncio
 import os
+import re
 import sys
 import httpx
-import base64
+import aiofiles
 
 # Add src to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
@@ -51,7 +53,11 @@ config = {
 
 # Configuration
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
-SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".doc", ".txt", ".md", ".markdown", ".html", ".htm"}
+MAX_CONCURRENT_DISCOVERIES = 20
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+SUPPORTED_EXTENSIONS = frozenset({".pdf", ".docx", ".doc", ".txt", ".md", ".markdown", ".html", ".htm"})
+# Supported extension at the end of a URL path (before the first "?")
+_EXT_RE = re.compile(r"[^?]*\.(pdf|docx?|txt|md|markdown|html?)(?:\?.*)?$", re.IGNORECASE)
 SUPPORTED_CONTENT_TYPES = {
     "application/pdf",
     "application/msword",
@@ -60,6 +66,27 @@ SUPPORTED_CONTENT_TYPES = {
     "text/markdown",
     "text/html"
 }
+# Single-pass match of any supported type within a content-type header
+_CT_RE = re.compile("|".join(re.escape(ct) for ct in sorted(SUPPORTED_CONTENT_TYPES)))
+
+# Shared across invocations so keep-alive connections to document hosts persist
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Get the pooled HTTP client, recreating it if the event loop changed."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            timeout=60.0,
+            follow_redirects=True,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+        )
+        _client_loop = loop
+    return _client
 
 
 async def handler(input_data, context):
@@ -77,23 +104,40 @@ async def handler(input_data, context):
         discovered_docs = []
         errors = []
         
-        async with httpx.AsyncClient(timeout=60.0, follow_redirects=True) as client:
-            for i, source in enumerate(discovery_input.sources):
-                try:
-                    doc_info = await _discover_source(
-                        source=source,
-                        client=client,
-                        context=context
-                    )
-                    if doc_info:
-                        discovered_docs.append(doc_info)
-                except Exception as e:
-                    error_msg = f"Failed to discover source {i}: {str(e)}"
-                    errors.append(error_msg)
-                    context.logger.error(error_msg, {
-                        "source_url": source.url,
-                        "source_file": source.file_path
-                    })
+        # Sources are fetched concurrently over one pooled client
+        semaphore = asyncio.Semaphore(MAX_CONCURRENT_DISCOVERIES)
+        client = _get_client()
+        results = await asyncio.gather(*(
+            _discover_source(
+                source=source,
+                client=client,
+                context=context,
+                semaphore=semaphore
+            )
+            for source in discovery_input.sources
+        ), return_exceptions=True)
+        
+        for i, (source, result) in enumerate(zip(discovery_input.sources, results)):
+            if isinstance(result, Exception):
+                error_msg = f"Failed to discover source {i}: {str(result)}"
+                errors.append(error_msg)
+                context.logger.error(error_msg, {
+                    "source_url": source.url,
+                    "source_file": source.file_path
+                })
+            elif result:
+                discovered_docs.append(result)
+        
+        # Raw bytes go to the blob store; only the reference is emitted
+        from services.blob_store import get_blob_store
+        blob_store = get_blob_store()
+        
+        blob_refs = await asyncio.gather(*(
+            blob_store.save(discovery_input.ingestion_id, i, doc.pop("content"))
+            for i, doc in enumerate(discovered_docs)
+        ))
+        for doc, blob_ref in zip(discovered_docs, blob_refs):
+            doc["blob_ref"] = blob_ref
         
         # Update job status
         job_state = await context.state.get("ingestion_jobs", discovery_input.ingestion_id)
@@ -102,7 +146,7 @@ async def handler(input_data, context):
         if job:
             job["documents_discovered"] = len(discovered_docs)
             job["errors"] = job.get("errors", []) + errors
-            job["updated_at"] = datetime.utcnow().isoformat()
+            job["updated_at"] = datetime.now(timezone.utc).isoformat()
             await context.state.set("ingestion_jobs", discovery_input.ingestion_id, job)
         
         context.logger.info("Document discovery complete", {
@@ -145,16 +189,17 @@ async def handler(input_data, context):
 async def _discover_source(
     source: DocumentSourceInput,
     client: httpx.AsyncClient,
-    context
+    context,
+    semaphore: asyncio.Semaphore
 ) -> Optional[Dict[str, Any]]:
     """Discover a single document source."""
-    
-    if source.url:
-        return await _discover_url(source, client, context)
-    elif source.file_path:
-        return await _discover_file(source, context)
-    else:
-        return None
+    async with semaphore:
+        if source.url:
+            return await _discover_url(source, client, context)
+        elif source.file_path:
+            return await _discover_file(source, context)
+        else:
+            return None
 
 
 async def _discover_url(
@@ -167,58 +212,41 @@ async def _discover_url(
     
     context.logger.info("Discovering URL", {"url": url})
     
-    # First, do a HEAD request to check size and content type
-    try:
-        head_response = await client.head(url)
-        head_response.raise_for_status()
-    except Exception:
-        # Some servers don't support HEAD, try GET
-        head_response = None
-    
-    # Check content type
-    content_type = ""
-    content_length = 0
-    
-    if head_response:
-        content_type = head_response.headers.get("content-type", "").lower()
-        content_length = int(head_response.headers.get("content-length", 0))
+    # Check extension from URL (None when missing or unsupported)
+    ext = _extract_and_validate_ext(url)
     
-    # Validate file size if known
-    if content_length > MAX_FILE_SIZE:
-        raise ValueError(f"File too large: {content_length} bytes (max {MAX_FILE_SIZE})")
-    
-    # Check extension from URL
-    ext = _get_extension_from_url(url)
-    
-    # Validate content type or extension
-    content_type_valid = any(ct in content_type for ct in SUPPORTED_CONTENT_TYPES)
-    extension_valid = ext in SUPPORTED_EXTENSIONS
-    
-    if not content_type_valid and not extension_valid:
-        raise ValueError(f"Unsupported format: content-type={content_type}, extension={ext}")
-    
-    # Fetch the content
-    response = await client.get(url)
-    response.raise_for_status()
-    
-    content = response.content
-    
-    # Final size check
-    if len(content) > MAX_FILE_SIZE:
-        raise ValueError(f"File too large: {len(content)} bytes (max {MAX_FILE_SIZE})")
+    # A single streamed GET: headers are validated before any body bytes
+    # are read, and leaving the block early closes the response
+    content = bytearray()
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+        content_type = response.headers.get("content-type", "").lower()
+        content_length = int(response.headers.get("content-length") or 0)
+        
+        # Validate file size if known
+        if content_length > MAX_FILE_SIZE:
+            raise ValueError(f"File too large: {content_length} bytes (max {MAX_FILE_SIZE})")
+        
+        # Validate content type or extension
+        content_type_valid = _CT_RE.search(content_type) is not None
+        if not content_type_valid and ext is None:
+            raise ValueError(f"Unsupported format: content-type={content_type}, extension={ext}")
+        
+        # Stream the content, aborting as soon as it exceeds the size limit
+        # (servers may omit or misreport content-length)
+        async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+            content.extend(chunk)
+            if len(content) > MAX_FILE_SIZE:
+                raise ValueError(f"File too large: over {MAX_FILE_SIZE} bytes")
     
     # Determine format
-    actual_content_type = response.headers.get("content-type", "").lower()
-    file_format = _determine_format(actual_content_type, ext)
-    
-    # Encode bytes to base64 string for JSON serialization
-    content_b64 = base64.b64encode(content).decode('utf-8')
+    file_format = _determine_format(content_type, ext)
     
     return {
         "source_type": "url",
         "url": url,
-        "content_b64": content_b64,  # base64 encoded string
-        "content_type": actual_content_type,
+        "content": content,  # raw bytes, moved to the blob store by the handler
+        "content_type": content_type,
         "format": file_format,
         "doc_type": source.doc_type,
         "language": source.language,
@@ -235,12 +263,12 @@ async def _discover_file(
     
     context.logger.info("Discovering file", {"file_path": file_path})
     
-    # Check if file exists
-    if not os.path.exists(file_path):
+    # Check that the file exists and its size (off the event loop)
+    try:
+        file_size = (await asyncio.to_thread(os.stat, file_path)).st_size
+    except FileNotFoundError:
         raise ValueError(f"File not found: {file_path}")
     
-    # Check file size
-    file_size = os.path.getsize(file_path)
     if file_size > MAX_FILE_SIZE:
         raise ValueError(f"File too large: {file_size} bytes (max {MAX_FILE_SIZE})")
     
@@ -250,19 +278,16 @@ async def _discover_file(
         raise ValueError(f"Unsupported file extension: {ext}")
     
     # Read file content
-    with open(file_path, "rb") as f:
-        content = f.read()
+    async with aiofiles.open(file_path, "rb") as f:
+        content = await f.read()
     
     file_format = _determine_format_from_extension(ext)
     
-    # Encode bytes to base64 string for JSON serialization
-    content_b64 = base64.b64encode(content).decode('utf-8')
-    
     return {
         "source_type": "file",
         "file_path": file_path,
         "filename": os.path.basename(file_path),
-        "content_b64": content_b64,  # base64 encoded string
+        "content": content,  # raw bytes, moved to the blob store by the handler
         "format": file_format,
         "doc_type": source.doc_type,
         "language": source.language,
@@ -270,12 +295,10 @@ async def _discover_file(
     }
 
 
-def _get_extension_from_url(url: str) -> str:
-    """Extract file extension from URL."""
-    # Remove query params
-    clean_url = url.split("?")[0]
-    ext = os.path.splitext(clean_url)[1].lower()
-    return ext
+def _extract_and_validate_ext(url: str) -> Optional[str]:
+    """Extract a supported file extension from URL, ignoring query params."""
+    match = _EXT_RE.match(url)
+    return "." + match.group(1).lower() if match else None
 
 
 def _determine_format(content_type: str, extension: str) -> str:
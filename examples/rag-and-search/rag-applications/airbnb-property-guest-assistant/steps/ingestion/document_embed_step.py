@@ -7,8 +7,9 @@ On re-ingest for same property_id + source, soft-deletes old chunks.
 """
 
 from pydantic import BaseModel
-from typing import List, Dict, Any
-from datetime import datetime
+from typing import List, Dict, Any, Optional
+from datetime import datetime, timezone
+import asyncio
 import os
 import sys
 
@@ -31,8 +32,7 @@ config = {
     "description": "Embed chunks and store in LanceDB vector database",
     "subscribes": ["document-embed"],
     "emits": [
-        {"topic": "ingestion-complete", "label": "Ingestion completed"},
-        {"topic": "send-notification", "label": "Send completion notification"},
+        {"topic": "ingestion-complete", "label": "Ingestion completed (also sends the notification)"},
         {"topic": "ingestion-error", "label": "Report embedding errors", "conditional": True}
     ],
     "flows": ["document-ingestion"],
@@ -47,6 +47,7 @@ async def handler(input_data, context):
         property_id = input_data.get("property_id")
         chunks = input_data.get("chunks", [])
         overwrite_existing = input_data.get("overwrite_existing", True)
+        current_time = datetime.now(timezone.utc).isoformat()
         
         context.logger.info("Starting document embedding", {
             "ingestion_id": ingestion_id,
@@ -56,38 +57,32 @@ async def handler(input_data, context):
         # Import services
         from services.embeddings_service import get_embeddings_service
         from services.lancedb_service import get_lancedb_service
+        from services.llm_service import LLMService
         
         embeddings_service = get_embeddings_service()
         lancedb_service = get_lancedb_service()
         
         errors = []
         
+        # Read the job record once; whichever path the handler exits through
+        # writes it back with a single set
+        job_state = await context.state.get("ingestion_jobs", ingestion_id)
+        # Handle nested data structure from Motia state
+        job = job_state.get("data", job_state) if isinstance(job_state, dict) else job_state
+        
         # Delete existing documents if overwriting
         if overwrite_existing:
             try:
-                # Group chunks by source
-                sources = set()
-                for chunk in chunks:
-                    source_url = chunk.get("source_url")
-                    source_filename = chunk.get("source_filename")
-                    if source_url:
-                        sources.add(("url", source_url))
-                    if source_filename:
-                        sources.add(("file", source_filename))
+                # Collect the distinct sources and delete them in one call
+                source_urls = {chunk["source_url"] for chunk in chunks if chunk.get("source_url")}
+                source_filenames = {chunk["source_filename"] for chunk in chunks if chunk.get("source_filename")}
                 
-                deleted_count = 0
-                for source_type, source_value in sources:
-                    if source_type == "url":
-                        count = lancedb_service.delete_by_property_and_source(
-                            property_id=property_id,
-                            source_url=source_value
-                        )
-                    else:
-                        count = lancedb_service.delete_by_property_and_source(
-                            property_id=property_id,
-                            source_filename=source_value
-                        )
-                    deleted_count += count
+                deleted_count = await asyncio.to_thread(
+                    lancedb_service.delete_by_property_and_sources,
+                    property_id=property_id,
+                    source_urls=sorted(source_urls),
+                    source_filenames=sorted(source_filenames)
+                )
                 
                 context.logger.info("Deleted existing documents", {
                     "property_id": property_id,
@@ -98,20 +93,29 @@ async def handler(input_data, context):
                     "error": str(e)
                 })
         
+        # Blank chunks would only be stored with a zero vector; drop them
+        # (after the delete above, so their sources are still replaced)
+        chunk_count = len(chunks)
+        chunks = [chunk for chunk in chunks if (chunk.get("content") or "").strip()]
+        if len(chunks) < chunk_count:
+            context.logger.info("Skipping empty chunks", {
+                "skipped": chunk_count - len(chunks)
+            })
+        
         # Generate embeddings for all chunks
         context.logger.info("Generating embeddings", {"chunk_count": len(chunks)})
         
-        texts = [chunk.get("content", "") for chunk in chunks]
+        texts = [chunk["content"] for chunk in chunks]
         
         try:
-            embeddings = embeddings_service.embed_texts(texts)
+            embeddings = await embeddings_service.embed_texts_async(texts)
         except Exception as e:
             error_msg = f"Failed to generate embeddings: {str(e)}"
             errors.append(error_msg)
             context.logger.error(error_msg)
             
             # Update job status with error
-            await _update_job_error(context, ingestion_id, errors)
+            await _update_job_error(context, ingestion_id, job, errors, now=current_time)
             
             await context.emit({
                 "topic": "ingestion-error",
@@ -124,39 +128,38 @@ async def handler(input_data, context):
             })
             return
         
-        # Prepare documents for storage
-        documents = []
-        current_time = datetime.utcnow().isoformat()
-        
-        for i, chunk in enumerate(chunks):
-            documents.append({
-                "id": chunk.get("id"),
-                "property_id": property_id,
-                "content": chunk.get("content", ""),
-                "section_title": chunk.get("section_title", ""),
-                "doc_type": chunk.get("doc_type", "house_manual"),
-                "language": chunk.get("language", "en"),
-                "is_critical": chunk.get("is_critical", False),
-                "source_url": chunk.get("source_url", ""),
-                "source_filename": chunk.get("source_filename", ""),
-                "ingestion_id": ingestion_id,
-                "updated_at": current_time,
-                "vector": embeddings[i]
-            })
+        # Match the table's vector precision (fp16 tables store half-size vectors)
+        embeddings = embeddings.astype(lancedb_service.vector_dtype, copy=False)
+        
+        # Prepare documents for storage, one list per column; the embeddings
+        # array becomes the vector column as is
+        columns = {
+            "id": [chunk.get("id") for chunk in chunks],
+            "property_id": [property_id] * len(chunks),
+            "content": texts,
+            "section_title": [chunk.get("section_title", "") for chunk in chunks],
+            "doc_type": [chunk.get("doc_type", "house_manual") for chunk in chunks],
+            "language": [chunk.get("language", "en") for chunk in chunks],
+            "is_critical": [chunk.get("is_critical", False) for chunk in chunks],
+            "source_url": [chunk.get("source_url", "") for chunk in chunks],
+            "source_filename": [chunk.get("source_filename", "") for chunk in chunks],
+            "ingestion_id": [ingestion_id] * len(chunks),
+            "updated_at": [current_time] * len(chunks)
+        }
         
         # Store in LanceDB
         context.logger.info("Storing documents in LanceDB", {
-            "document_count": len(documents)
+            "document_count": len(chunks)
         })
         
         try:
-            stored_count = lancedb_service.add_documents(documents)
+            stored_count = await asyncio.to_thread(lancedb_service.add_documents_batch, columns, embeddings)
         except Exception as e:
             error_msg = f"Failed to store documents: {str(e)}"
             errors.append(error_msg)
             context.logger.error(error_msg)
             
-            await _update_job_error(context, ingestion_id, errors)
+            await _update_job_error(context, ingestion_id, job, errors, now=current_time)
             
             await context.emit({
                 "topic": "ingestion-error",
@@ -169,10 +172,23 @@ async def handler(input_data, context):
             })
             return
         
+        # Quantized ANN index, once the table has grown enough to train it
+        try:
+            if await asyncio.to_thread(lancedb_service.ensure_vector_index):
+                context.logger.info("Created vector index", {
+                    "index_type": lancedb_service.VECTOR_INDEX_TYPE
+                })
+        except Exception as e:
+            context.logger.warn("Failed to create vector index", {"error": str(e)})
+        
+        # New knowledge base version: cached guest answers for this property are
+        # stale, so bump the version and drop the persisted answers
+        await asyncio.gather(
+            context.state.set("qa_cache_versions", property_id, ingestion_id),
+            context.state.clear(LLMService.answer_cache_group(property_id))
+        )
+        
         # Update job status - completed!
-        job_state = await context.state.get("ingestion_jobs", ingestion_id)
-        # Handle nested data structure from Motia state
-        job = job_state.get("data", job_state) if isinstance(job_state, dict) else job_state
         if job:
             job["documents_embedded"] = len(chunks)
             job["chunks_created"] = stored_count
@@ -186,30 +202,18 @@ async def handler(input_data, context):
             "stored_count": stored_count
         })
         
-        # Emit completion events
-        await context.emit({
-            "topic": "ingestion-complete",
-            "data": {
-                "ingestion_id": ingestion_id,
-                "property_id": property_id,
-                "chunks_created": stored_count,
-                "documents_processed": job.get("total_documents", 0) if job else 0
-            }
-        })
-        
-        # Send notification - job already extracted from nested structure above
+        # One completion event; the notification step subscribes to it too,
+        # so it carries the email recipients and errors as well
         notify_email = job.get("notify_email") if job and isinstance(job, dict) else None
-        recipients = [notify_email] if notify_email else None
         
         await context.emit({
-            "topic": "send-notification",
+            "topic": "ingestion-complete",
             "data": {
-                "type": "ingestion_complete",
-                "property_id": property_id,
                 "ingestion_id": ingestion_id,
-                "recipients": recipients,
+                "property_id": property_id,
                 "chunks_created": stored_count,
                 "documents_processed": job.get("total_documents", 0) if job else 0,
+                "recipients": [notify_email] if notify_email else None,
                 "errors": job.get("errors", []) if job else []
             }
         })
@@ -222,14 +226,17 @@ async def handler(input_data, context):
         raise
 
 
-async def _update_job_error(context, ingestion_id: str, errors: List[str]):
-    """Update job status with errors."""
-    job_state = await context.state.get("ingestion_jobs", ingestion_id)
-    # Handle nested data structure from Motia state
-    job = job_state.get("data", job_state) if isinstance(job_state, dict) else job_state
+async def _update_job_error(
+    context,
+    ingestion_id: str,
+    job: Optional[Dict[str, Any]],
+    errors: List[str],
+    now: str
+):
+    """Mark the job loaded by the handler as failed and write it back."""
     if job:
         job["status"] = "failed"
         job["errors"] = job.get("errors", []) + errors
-        job["updated_at"] = datetime.utcnow().isoformat()
+        job["updated_at"] = now
         await context.state.set("ingestion_jobs", ingestion_id, job)
 
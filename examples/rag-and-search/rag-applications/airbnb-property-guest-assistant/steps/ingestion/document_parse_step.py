@@ -8,13 +8,18 @@ Normalizes into a common schema with title, section, body_text, etc.
 
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
-from datetime import datetime
+from datetime import datetime, timezone
+import asyncio
+import dataclasses
 import os
 import sys
 
 # Add src to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
 
+# Documents parsed at once (PDF/DOCX parsing runs in the parser's process pool)
+PARSE_CONCURRENCY = int(os.getenv("PARSE_CONCURRENCY", "4"))
+
 
 class DocumentInfo(BaseModel):
     """Info about a discovered document."""
@@ -66,27 +71,38 @@ async def handler(input_data, context):
             "document_count": len(documents)
         })
         
-        # Import parser service
-        from services.document_parser import DocumentParser
+        # Import parser service (shared instance, keeps its HTTP connection pool)
+        from services.document_parser import get_document_parser
+        from services.blob_store import get_blob_store
         
-        parser = DocumentParser()
+        parser = get_document_parser()
+        blob_store = get_blob_store()
         
         parsed_docs = []
         errors = []
         
+        semaphore = asyncio.Semaphore(PARSE_CONCURRENCY)
+        
+        async def parse_one(doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                return await _parse_document(doc, property_id, parser, blob_store, context)
+        
         try:
-            for i, doc in enumerate(documents):
-                try:
-                    parsed = await _parse_document(doc, property_id, parser, context)
-                    if parsed:
-                        parsed_docs.append(parsed)
-                except Exception as e:
-                    source = doc.get("url") or doc.get("file_path") or f"document_{i}"
-                    error_msg = f"Failed to parse {source}: {str(e)}"
-                    errors.append(error_msg)
-                    context.logger.error(error_msg)
+            results = await asyncio.gather(
+                *(parse_one(doc) for doc in documents), return_exceptions=True
+            )
         finally:
-            await parser.close()
+            # Document bytes are no longer needed once parsed (or if parsing aborted)
+            await blob_store.delete_ingestion(ingestion_id)
+        
+        for i, (doc, result) in enumerate(zip(documents, results)):
+            if isinstance(result, Exception):
+                source = doc.get("url") or doc.get("file_path") or f"document_{i}"
+                error_msg = f"Failed to parse {source}: {str(result)}"
+                errors.append(error_msg)
+                context.logger.error(error_msg)
+            elif result:
+                parsed_docs.append(result)
         
         # Update job status
         job_state = await context.state.get("ingestion_jobs", ingestion_id)
@@ -95,7 +111,7 @@ async def handler(input_data, context):
         if job:
             job["documents_parsed"] = len(parsed_docs)
             job["errors"] = job.get("errors", []) + errors
-            job["updated_at"] = datetime.utcnow().isoformat()
+            job["updated_at"] = datetime.now(timezone.utc).isoformat()
             await context.state.set("ingestion_jobs", ingestion_id, job)
         
         context.logger.info("Document parsing complete", {
@@ -139,12 +155,14 @@ async def _parse_document(
     doc: Dict[str, Any],
     property_id: str,
     parser,
+    blob_store,
     context
 ) -> Optional[Dict[str, Any]]:
     """Parse a single document."""
     import base64
     
-    # Content is now base64 encoded as content_b64
+    # Content is in the blob store (content_b64 from older payloads is still accepted)
+    blob_ref = doc.get("blob_ref")
     content_b64 = doc.get("content_b64")
     doc_format = doc.get("format", "text")
     language = doc.get("language", "en")
@@ -152,8 +170,10 @@ async def _parse_document(
     source_url = doc.get("url", "")
     source_filename = doc.get("filename", "")
     
-    # Decode base64 content to bytes
-    if content_b64:
+    if blob_ref:
+        content_bytes = await blob_store.load(blob_ref)
+    elif content_b64:
+        # Decode base64 content to bytes
         try:
             content_bytes = base64.b64decode(content_b64)
         except Exception as e:
@@ -177,21 +197,22 @@ async def _parse_document(
         parsed = await parser._parse_docx(
             content_bytes, source_url, source_filename, property_id, language
         )
-    elif doc_format == "html":
-        text = content_bytes.decode(parser.detect_encoding(content_bytes), errors="replace")
-        parsed = parser._parse_html(text, source_url, source_filename, property_id, language)
-    elif doc_format == "markdown":
-        text = content_bytes.decode(parser.detect_encoding(content_bytes), errors="replace")
-        parsed = parser._parse_markdown(text, source_url, source_filename, property_id, language)
     else:
-        text = content_bytes.decode(parser.detect_encoding(content_bytes), errors="replace")
-        parsed = parser._parse_plain_text(text, source_url, source_filename, property_id, language)
+        # Text formats: detect the encoding and decode exactly once
+        text = parser.decode_text(content_bytes)
+        if doc_format == "html":
+            parse_text = parser._parse_html
+        elif doc_format == "markdown":
+            parse_text = parser._parse_markdown
+        else:
+            parse_text = parser._parse_plain_text
+        parsed = parse_text(text, source_url, source_filename, property_id, language)
     
     # Override doc_type with what was specified in the source
     if doc_type:
         from services.document_parser import DocType
         try:
-            parsed.doc_type = DocType(doc_type)
+            parsed = dataclasses.replace(parsed, doc_type=DocType(doc_type))
         except ValueError:
             pass  # Keep the auto-detected type
     
@@ -212,7 +233,7 @@ async def _parse_document(
         "language": parsed.language,
         "source_url": parsed.source_url,
         "source_filename": parsed.source_filename,
-        "raw_text": parsed.raw_text[:5000] if len(parsed.raw_text) > 5000 else parsed.raw_text,
+        "raw_text": parsed.raw_text[:5000],
         "metadata": parsed.metadata
     }
 
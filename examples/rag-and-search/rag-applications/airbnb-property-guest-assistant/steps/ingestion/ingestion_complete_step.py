@@ -7,7 +7,16 @@ Can trigger follow-up actions if needed.
 """
 
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+import asyncio
+import os
+import sys
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+# Run LanceDB table maintenance after this many completed ingestions
+LANCE_OPTIMIZE_EVERY = int(os.getenv("LANCE_OPTIMIZE_EVERY", "50"))
 
 
 class CompleteInput(BaseModel):
@@ -16,6 +25,9 @@ class CompleteInput(BaseModel):
     property_id: str
     chunks_created: int
     documents_processed: int
+    # Read by the notification step, which also subscribes to this topic
+    recipients: Optional[List[str]] = None
+    errors: Optional[List[str]] = None
 
 
 # Motia Configuration
@@ -45,15 +57,12 @@ async def handler(input_data, context):
             "documents_processed": documents_processed
         })
         
+        # Shared service instance (cached factory, table opened once per process)
+        from services.lancedb_service import get_lancedb_service
+        lancedb_service = get_lancedb_service()
+        
         # Log final statistics
         try:
-            import sys
-            import os
-            sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
-            
-            from services.lancedb_service import get_lancedb_service
-            
-            lancedb_service = get_lancedb_service()
             stats = lancedb_service.get_property_stats(property_id)
             
             context.logger.info("Property knowledge base stats", {
@@ -66,6 +75,19 @@ async def handler(input_data, context):
         except Exception as e:
             context.logger.warn("Failed to get property stats", {"error": str(e)})
         
+        # Many small ingests fragment the table; compact it periodically
+        try:
+            meta_state = await context.state.get("lance_meta", "ingest_count")
+            ingest_count = meta_state.get("data", meta_state) if isinstance(meta_state, dict) else meta_state
+            ingest_count = (ingest_count or 0) + 1
+            await context.state.set("lance_meta", "ingest_count", ingest_count)
+            
+            if ingest_count % LANCE_OPTIMIZE_EVERY == 0:
+                await asyncio.to_thread(lancedb_service.optimize)
+                context.logger.info("Optimized LanceDB table", {"ingest_count": ingest_count})
+        except Exception as e:
+            context.logger.warn("Failed to optimize LanceDB table", {"error": str(e)})
+        
     except Exception as e:
         context.logger.error("Failed to handle ingestion completion", {
             "error": str(e),
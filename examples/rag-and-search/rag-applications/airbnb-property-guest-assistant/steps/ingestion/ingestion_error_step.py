@@ -8,8 +8,12 @@ Updates job status and optionally sends error notifications.
 
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timezone
 import os
+import sys
+
+# Add src to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
 
 
 class ErrorInput(BaseModel):
@@ -56,6 +60,10 @@ async def handler(input_data, context):
                 "ingestion_id": ingestion_id
             })
         
+        # Drop any document bytes the failed run left behind
+        from services.blob_store import get_blob_store
+        await get_blob_store().delete_ingestion(ingestion_id)
+        
         # Update job status
         job_state = await context.state.get("ingestion_jobs", ingestion_id)
         # Handle nested data structure from Motia state
@@ -64,7 +72,7 @@ async def handler(input_data, context):
             job["status"] = "failed"
             job["errors"] = job.get("errors", []) + errors
             job["failed_stage"] = stage
-            job["updated_at"] = datetime.utcnow().isoformat()
+            job["updated_at"] = datetime.now(timezone.utc).isoformat()
             await context.state.set("ingestion_jobs", ingestion_id, job)
             
             # Send notification about failure
@@ -7,7 +7,7 @@ Accepts a list of URLs and/or files for a specific property_id.
 
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
-from datetime import datetime
+from datetime import datetime, timezone
 import uuid
 
 # Request Schema
@@ -86,7 +86,7 @@ async def handler(req, context):
         
         # Generate ingestion ID
         ingestion_id = f"ing_{uuid.uuid4().hex[:12]}"
-        created_at = datetime.utcnow().isoformat()
+        created_at = datetime.now(timezone.utc).isoformat()
         
         context.logger.info("Starting ingestion", {
             "ingestion_id": ingestion_id,
@@ -1,15 +1,16 @@
 """
 Send Notification Event Step
 
-Subscribes to: send-notification
+Subscribes to: send-notification, ingestion-complete
 Sends email notifications via Resend for various events:
 - Ingestion started
-- Ingestion completed
+- Ingestion completed (ingestion-complete events, which carry no type)
 - Guest query answered
 """
 
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
+import asyncio
 import os
 import sys
 
@@ -19,7 +20,7 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
 
 class NotificationInput(BaseModel):
     """Input for notification."""
-    type: str  # ingestion_started, ingestion_complete, guest_answer
+    type: Optional[str] = None  # ingestion_started, ingestion_complete, guest_answer
     property_id: str
     recipients: Optional[List[str]] = None
     # For ingestion_started
@@ -41,7 +42,7 @@ config = {
     "name": "SendNotification",
     "type": "event",
     "description": "Send email notifications via Resend",
-    "subscribes": ["send-notification"],
+    "subscribes": ["send-notification", "ingestion-complete"],
     "emits": [],
     "flows": ["document-ingestion", "guest-assistant"],
     "input": NotificationInput.model_json_schema()
@@ -52,6 +53,8 @@ async def handler(input_data, context):
     """Handle sending notifications."""
     try:
         notification_type = input_data.get("type")
+        if notification_type is None and input_data.get("chunks_created") is not None:
+            notification_type = "ingestion_complete"
         property_id = input_data.get("property_id", "")
         
         context.logger.info("Sending notification", {
@@ -99,7 +102,9 @@ async def _send_ingestion_started(input_data: Dict[str, Any], email_service, con
     recipients = input_data.get("recipients")
     
     try:
-        result = email_service.send_ingestion_started(
+        # Sends retry with blocking backoff, so keep them off the event loop
+        result = await asyncio.to_thread(
+            email_service.send_ingestion_started,
             property_id=property_id,
             ingestion_id=ingestion_id,
             document_count=document_count,
@@ -125,7 +130,8 @@ async def _send_ingestion_complete(input_data: Dict[str, Any], email_service, co
     recipients = input_data.get("recipients")
     
     try:
-        result = email_service.send_ingestion_complete(
+        result = await asyncio.to_thread(
+            email_service.send_ingestion_complete,
             property_id=property_id,
             ingestion_id=ingestion_id,
             chunks_created=chunks_created,
@@ -156,7 +162,8 @@ async def _send_guest_answer(input_data: Dict[str, Any], email_service, context)
         return
     
     try:
-        result = email_service.send_guest_query_answer(
+        result = await asyncio.to_thread(
+            email_service.send_guest_query_answer,
             guest_email=guest_email,
             property_id=property_id,
             question=question,
@@ -8,8 +8,10 @@ policy-aligned answers.
 
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
+import asyncio
 import sys
 import os
+import time
 
 # Add src to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
@@ -105,81 +107,14 @@ async def handler(req, context):
         lancedb_service = get_lancedb_service()
         llm_service = get_llm_service()
         
-        # Generate query embedding
-        context.logger.info("Generating query embedding")
-        query_embedding = embeddings_service.embed_text(query_req.question)
-        
-        # Search for relevant documents
-        context.logger.info("Searching knowledge base", {
-            "property_id": query_req.property_id,
-            "doc_types": query_req.doc_types
-        })
-        
-        results = lancedb_service.search(
-            query_embedding=query_embedding,
-            property_id=query_req.property_id,
-            language=query_req.language,
-            doc_types=query_req.doc_types,
-            limit=5,
-            include_critical_boost=True
-        )
-        
-        if not results:
-            context.logger.warn("No documents found for property", {
-                "property_id": query_req.property_id
-            })
-            return {
-                "status": 404,
-                "body": {
-                    "error": "No property documents found",
-                    "details": {
-                        "message": f"No documents have been ingested for property {query_req.property_id}. Please ingest documents first."
-                    }
-                }
-            }
-        
-        # Generate answer using LLM
-        context.logger.info("Generating answer with LLM", {
-            "context_chunks": len(results)
-        })
-        
-        answer_result = llm_service.answer_question(
-            question=query_req.question,
-            context_chunks=results,
-            property_id=query_req.property_id,
-            language=query_req.language
-        )
-        
-        # Optionally email the answer to guest
-        if query_req.guest_email:
-            await context.emit({
-                "topic": "send-notification",
-                "data": {
-                    "type": "guest_answer",
-                    "guest_email": query_req.guest_email,
-                    "property_id": query_req.property_id,
-                    "question": query_req.question,
-                    "answer": answer_result["answer"],
-                    "sources": answer_result["sources"]
-                }
-            })
-        
-        context.logger.info("Query answered successfully", {
-            "property_id": query_req.property_id,
-            "confidence": answer_result["confidence"],
-            "sources_count": len(answer_result["sources"])
-        })
-        
-        return {
-            "status": 200,
-            "body": {
-                "answer": answer_result["answer"],
-                "confidence": answer_result["confidence"],
-                "sources": answer_result["sources"],
-                "property_id": query_req.property_id
-            }
-        }
-        
+        # Embed the question while the answer cache is checked; the request
+        # is only cancelled if the answer turns out to be cached
+        embedding_task = asyncio.create_task(embeddings_service.embed_text_async(query_req.question))
+        try:
+            return await _answer(context, query_req, embedding_task, lancedb_service, llm_service)
+        finally:
+            embedding_task.cancel()
+    
     except Exception as e:
         context.logger.error("Failed to process query", {"error": str(e)})
         return {
@@ -187,3 +122,132 @@ async def handler(req, context):
             "body": {"error": "Failed to process query", "details": {"message": str(e)}}
         }
 
+
+async def _answer(
+    context,
+    query_req: QueryRequest,
+    embedding_task: "asyncio.Task[List[float]]",
+    lancedb_service,
+    llm_service
+) -> Dict[str, Any]:
+    """Answer from cache, or retrieve and generate."""
+    # Repeat questions are answered from cache; the version changes on
+    # every re-ingest so answers never outlive the documents they came from
+    version_state = await context.state.get("qa_cache_versions", query_req.property_id)
+    version = version_state.get("data", version_state) if isinstance(version_state, dict) else version_state
+    cache_scope = llm_service.answer_cache_scope(
+        query_req.property_id, query_req.language, query_req.doc_types, version
+    )
+    cache_key = llm_service.answer_cache_key(cache_scope, query_req.question)
+    cache_group = llm_service.answer_cache_group(query_req.property_id)
+    
+    answer_result = llm_service.get_cached_answer(cache_key)
+    if answer_result is None:
+        cached_state = await context.state.get(cache_group, cache_key)
+        cached = cached_state.get("data", cached_state) if isinstance(cached_state, dict) else cached_state
+        if cached and cached.get("expires_at", 0) > time.time():
+            answer_result = cached["result"]
+            llm_service.cache_answer(cache_key, answer_result, cached["expires_at"])
+        elif cached:
+            # Expired: evict it so stale answers don't accumulate in state
+            await context.state.delete(cache_group, cache_key)
+    
+    if answer_result is not None:
+        context.logger.info("Answer served from cache", {"property_id": query_req.property_id})
+        return await _respond(context, query_req, answer_result)
+    
+    # Query embedding (already in flight)
+    query_embedding = await embedding_task
+    
+    # Paraphrases of an earlier question reuse its answer
+    answer_result = llm_service.find_similar_answer(cache_scope, query_embedding)
+    if answer_result is not None:
+        context.logger.info("Answer served from semantic cache", {"property_id": query_req.property_id})
+        llm_service.cache_answer(cache_key, answer_result)
+        return await _respond(context, query_req, answer_result)
+    
+    # Search for relevant documents
+    context.logger.info("Searching knowledge base", {
+        "property_id": query_req.property_id,
+        "doc_types": query_req.doc_types
+    })
+    
+    results = await asyncio.to_thread(
+        lancedb_service.search,
+        query_embedding=query_embedding,
+        property_id=query_req.property_id,
+        language=query_req.language,
+        doc_types=query_req.doc_types,
+        limit=5,
+        include_critical_boost=True
+    )
+    
+    if not results:
+        context.logger.warn("No documents found for property", {
+            "property_id": query_req.property_id
+        })
+        return {
+            "status": 404,
+            "body": {
+                "error": "No property documents found",
+                "details": {
+                    "message": f"No documents have been ingested for property {query_req.property_id}. Please ingest documents first."
+                }
+            }
+        }
+    
+    # Generate answer using LLM
+    context.logger.info("Generating answer with LLM", {
+        "context_chunks": len(results)
+    })
+    
+    answer_result = await llm_service.answer_question_async(
+        question=query_req.question,
+        context_chunks=results,
+        property_id=query_req.property_id,
+        language=query_req.language
+    )
+    
+    expires_at = llm_service.cache_answer(
+        cache_key, answer_result, scope=cache_scope, embedding=query_embedding
+    )
+    await context.state.set(cache_group, cache_key, {
+        "result": answer_result,
+        "expires_at": expires_at
+    })
+    
+    return await _respond(context, query_req, answer_result)
+
+
+async def _respond(context, query_req: QueryRequest, answer_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Email the answer if requested and build the API response."""
+    # Optionally email the answer to guest
+    if query_req.guest_email:
+        await context.emit({
+            "topic": "send-notification",
+            "data": {
+                "type": "guest_answer",
+                "guest_email": query_req.guest_email,
+                "property_id": query_req.property_id,
+                "question": query_req.question,
+                "answer": answer_result["answer"],
+                "sources": answer_result["sources"]
+            }
+        })
+    
+    context.logger.info("Query answered successfully", {
+        "property_id": query_req.property_id,
+        "confidence": answer_result["confidence"],
+        "sources_count": len(answer_result["sources"])
+    })
+    
+    return {
+        "status": 200,
+        "body": {
+            "answer": answer_result["answer"],
+            "confidence": answer_result["confidence"],
+            "sources": answer_result["sources"],
+            "property_id": query_req.property_id
+        }
+    }
+
@@ -7,10 +7,35 @@ This module contains the AI agents for:
 - Property valuation
 """
 
+import asyncio
+import json
 import os
+from functools import lru_cache
 from typing import Dict, List, Any, Optional
+import httpx
 from agno.agent import Agent
 from agno.models.openai import OpenAIChat
+from openai import AsyncOpenAI
+
+
+@lru_cache(maxsize=1)
+def _get_http_client() -> httpx.Client:
+    """Get the shared HTTP client (and connection pool) used by every agent model"""
+    return httpx.Client()
+
+
+def _create_openai_model(model_id: str) -> OpenAIChat:
+    """
+    Create an OpenAIChat model for a single agent
+    
+    OpenAIChat keeps per-run state, so each agent gets its own instance;
+    only the thread-safe HTTP connection pool is shared between them.
+    """
+    return OpenAIChat(
+        id=model_id,
+        api_key=os.getenv("OPENAI_API_KEY"),
+        http_client=_get_http_client()
+    )
 
 
 def create_property_search_agent(provider: str = "openai") -> Agent:
@@ -20,10 +45,7 @@ def create_property_search_agent(provider: str = "openai") -> Agent:
     Args:
         provider: AI provider - "openai" (default)
     """
-    model = OpenAIChat(
-        id="gpt-4o-mini",  # Fast and cost-effective
-        api_key=os.getenv("OPENAI_API_KEY")
-    )
+    model = _create_openai_model("gpt-4o-mini")  # Fast and cost-effective
     
     return Agent(
         name="Property Search Agent",
@@ -64,10 +86,7 @@ def create_market_analysis_agent(provider: str = "openai") -> Agent:
     Args:
         provider: AI provider - "openai" (default)
     """
-    model = OpenAIChat(
-        id="gpt-4o-mini",  # Fast and cost-effective
-        api_key=os.getenv("OPENAI_API_KEY")
-    )
+    model = _create_openai_model("gpt-4o-mini")  # Fast and cost-effective
     
     return Agent(
         name="Market Analysis Agent",
@@ -114,10 +133,7 @@ def create_property_valuation_agent(provider: str = "openai") -> Agent:
     Args:
         provider: AI provider - "openai" (default)
     """
-    model = OpenAIChat(
-        id="gpt-4o-mini",  # Fast and cost-effective
-        api_key=os.getenv("OPENAI_API_KEY")
-    )
+    model = _create_openai_model("gpt-4o-mini")  # Fast and cost-effective
     
     return Agent(
         name="Property Valuation Agent",
@@ -173,7 +189,8 @@ async def analyze_properties_with_agent(
         Dict with 'content' and 'metadata' keys
     """
     try:
-        result = agent.run(prompt)
+        # agent.run is blocking, keep it off the event loop
+        result = await asyncio.to_thread(agent.run, prompt)
         
         return {
             "content": result.content,
@@ -191,3 +208,87 @@ async def analyze_properties_with_agent(
             }
         }
 
+
+@lru_cache(maxsize=1)
+def _get_openai_client() -> AsyncOpenAI:
+    """Get the shared OpenAI client used for Batch API calls"""
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+
+async def submit_agent_batch(agent: Agent, prompts: List[str]) -> str:
+    """
+    Submit prompts for an agent through the OpenAI Batch API
+    
+    For non-realtime work (bulk valuation / market analysis): about half the
+    per-token cost of synchronous calls, with results within 24h (usually minutes).
+    
+    Args:
+        agent: The Agno agent whose model and instructions to use
+        prompts: Prompts to run, one chat completion each
+        
+    Returns:
+        The batch id, to pass to poll_batch
+    """
+    instructions = agent.instructions
+    if isinstance(instructions, list):
+        instructions = "\n".join(instructions)
+    
+    lines = [
+        json.dumps({
+            "custom_id": str(i),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": agent.model.id,
+                "messages": [
+                    {"role": "system", "content": instructions or ""},
+                    {"role": "user", "content": prompt}
+                ]
+            }
+        })
+        for i, prompt in enumerate(prompts)
+    ]
+    
+    client = _get_openai_client()
+    batch_file = await client.files.create(
+        file=("agent_batch.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+        metadata={"agent_name": agent.name or "agent"}
+    )
+    return batch.id
+
+
+async def poll_batch(batch_id: str) -> Dict[str, Any]:
+    """
+    Check a batch submitted with submit_agent_batch
+    
+    Args:
+        batch_id: Id returned by submit_agent_batch
+        
+    Returns:
+        Dict with 'status' and, once completed, 'results' mapping each
+        prompt index (as a string) to the response content
+    """
+    client = _get_openai_client()
+    batch = await client.batches.retrieve(batch_id)
+    
+    if batch.status != "completed" or not batch.output_file_id:
+        return {"status": batch.status, "results": None}
+    
+    output = await client.files.content(batch.output_file_id)
+    
+    results = {}
+    for line in output.text.splitlines():
+        if not line:
+            continue
+        item = json.loads(line)
+        body = (item.get("response") or {}).get("body") or {}
+        choices = body.get("choices") or []
+        results[item["custom_id"]] = choices[0]["message"]["content"] if choices else None
+    
+    return {"status": batch.status, "results": results}
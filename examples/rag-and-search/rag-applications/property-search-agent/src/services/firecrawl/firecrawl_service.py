@@ -5,45 +5,75 @@ Handles integration with Firecrawl API for extracting structured
 property data from real estate websites.
 """
 
+import asyncio
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Dict, List, Any, Optional
 from firecrawl import FirecrawlApp
+from tenacity import (
+    RetryCallState,
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential_jitter
+)
 
+# Native async client (newer firecrawl-py releases)
+try:
+    from firecrawl import AsyncFirecrawlApp
+except ImportError:
+    AsyncFirecrawlApp = None
+
+# Bounded pool for the sync SDK fallback (instead of the shared default executor)
+_FIRECRAWL_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="firecrawl")
+
+
+# Property listing schema is fully static, build it once
+_PROPERTY_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "properties": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "address": {"type": "string"},
+                    "price": {"type": "string"},
+                    "bedrooms": {"type": "string"},
+                    "bathrooms": {"type": "string"},
+                    "square_feet": {"type": "string"},
+                    "property_type": {"type": "string"},
+                    "description": {"type": "string"},
+                    "listing_url": {"type": "string"},
+                    "agent_contact": {"type": "string"},
+                    "features": {
+                        "type": "array",
+                        "items": {"type": "string"}
+                    }
+                },
+                "required": ["address", "price"]
+            }
+        },
+        "total_count": {"type": "integer"},
+        "source_website": {"type": "string"}
+    },
+    "required": ["properties", "total_count", "source_website"]
+}
 
-class PropertyExtractionService:
-    """Service for extracting property data using Firecrawl"""
-    
-    def __init__(self, api_key: Optional[str] = None):
-        """
-        Initialize Firecrawl service
-        
-        Args:
-            api_key: Firecrawl API key (defaults to env var)
-        """
-        self.api_key = api_key or os.getenv("FIRECRAWL_API_KEY")
-        if not self.api_key:
-            raise ValueError("FIRECRAWL_API_KEY is required")
-        
-        self.firecrawl = FirecrawlApp(api_key=self.api_key)
-    
-    def build_extraction_prompt(self, user_criteria: Dict[str, Any]) -> str:
-        """
-        Build a comprehensive prompt for property extraction
-        
-        Args:
-            user_criteria: User's search criteria
-            
-        Returns:
-            Formatted extraction prompt
-        """
-        budget = user_criteria.get('budget_range', 'Any')
-        prop_type = user_criteria.get('property_type', 'Any')
-        bedrooms = user_criteria.get('bedrooms', 'Any')
-        bathrooms = user_criteria.get('bathrooms', 'Any')
-        min_sqft = user_criteria.get('min_square_feet', 'Any')
-        features = user_criteria.get('special_features', 'Any')
-        
-        return f"""You are extracting property listings from real estate websites. Extract EVERY property listing you can find on the page.
+
+@lru_cache(maxsize=256)
+def _extraction_prompt(
+    budget: str,
+    prop_type: str,
+    bedrooms: str,
+    bathrooms: str,
+    min_sqft: str,
+    features: str
+) -> str:
+    """Render the extraction prompt, cached per distinct criteria"""
+    return f"""You are extracting property listings from real estate websites. Extract EVERY property listing you can find on the page.
 
 USER SEARCH CRITERIA:
 - Budget: {budget}
@@ -82,49 +112,140 @@ EXTRACTION INSTRUCTIONS:
 
 EXTRACT EVERY VISIBLE PROPERTY LISTING - DO NOT LIMIT TO JUST A FEW!
 """
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    """HTTP status carried by an SDK/HTTP exception, if any"""
+    response = getattr(exc, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def _is_transient_error(exc: BaseException) -> bool:
+    """Retry network errors, timeouts, 429s and 5xx responses"""
+    if isinstance(exc, (OSError, asyncio.TimeoutError)):
+        return True
+    status = _status_code(exc)
+    return status is not None and (status == 429 or status >= 500)
+
+
+_exponential_jitter = wait_exponential_jitter(initial=0.5, max=8)
+
+# Cap on a server-requested Retry-After wait (the retry holds a concurrency slot)
+_MAX_RETRY_AFTER = 30.0
+
+
+class _AbandonedExtractTimeout(Exception):
+    """An attempt on the sync SDK timed out; its thread keeps running, so it isn't retried"""
+
+
+def _wait_retry_after_or_backoff(retry_state: RetryCallState) -> float:
+    """Honor a Retry-After header when the server sends one, else exponential backoff with jitter"""
+    exc = retry_state.outcome.exception() if retry_state.outcome else None
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    retry_after = headers.get('Retry-After')
+    if retry_after:
+        try:
+            return min(float(retry_after), _MAX_RETRY_AFTER)
+        except ValueError:
+            pass
+    return _exponential_jitter(retry_state)
+
+
+def _response_to_dict(raw_response: Any) -> Dict[str, Any]:
+    """Normalize a Firecrawl SDK response (model, object, dict or raw JSON) to a dict"""
+    if isinstance(raw_response, dict):
+        return raw_response
+    if isinstance(raw_response, (bytes, str)):
+        return json.loads(raw_response)
+    if hasattr(raw_response, 'model_dump'):
+        return raw_response.model_dump()
+    return vars(raw_response)
+
+
+class PropertyExtractionService:
+    """Service for extracting property data using Firecrawl"""
+    
+    def __init__(self, api_key: Optional[str] = None):
+        """
+        Initialize Firecrawl service
+        
+        Args:
+            api_key: Firecrawl API key (defaults to env var)
+        """
+        self.api_key = api_key or os.getenv("FIRECRAWL_API_KEY")
+        if not self.api_key:
+            raise ValueError("FIRECRAWL_API_KEY is required")
+        
+        self.firecrawl = FirecrawlApp(api_key=self.api_key)
+        self.async_firecrawl = AsyncFirecrawlApp(api_key=self.api_key) if AsyncFirecrawlApp else None
+    
+    def build_extraction_prompt(self, user_criteria: Dict[str, Any]) -> str:
+        """
+        Build a comprehensive prompt for property extraction
+        
+        Args:
+            user_criteria: User's search criteria
+            
+        Returns:
+            Formatted extraction prompt (memoized per distinct criteria)
+        """
+        return _extraction_prompt(
+            str(user_criteria.get('budget_range', 'Any')),
+            str(user_criteria.get('property_type', 'Any')),
+            str(user_criteria.get('bedrooms', 'Any')),
+            str(user_criteria.get('bathrooms', 'Any')),
+            str(user_criteria.get('min_square_feet', 'Any')),
+            str(user_criteria.get('special_features', 'Any'))
+        )
     
     def build_property_schema(self) -> Dict[str, Any]:
         """
         Build JSON schema for property extraction
         
         Returns:
-            Property listing schema
+            Property listing schema (static, shared module constant)
         """
-        return {
-            "type": "object",
-            "properties": {
-                "properties": {
-                    "type": "array",
-                    "items": {
-                        "type": "object",
-                        "properties": {
-                            "address": {"type": "string"},
-                            "price": {"type": "string"},
-                            "bedrooms": {"type": "string"},
-                            "bathrooms": {"type": "string"},
-                            "square_feet": {"type": "string"},
-                            "property_type": {"type": "string"},
-                            "description": {"type": "string"},
-                            "listing_url": {"type": "string"},
-                            "agent_contact": {"type": "string"},
-                            "features": {
-                                "type": "array",
-                                "items": {"type": "string"}
-                            }
-                        },
-                        "required": ["address", "price"]
-                    }
-                },
-                "total_count": {"type": "integer"},
-                "source_website": {"type": "string"}
-            },
-            "required": ["properties", "total_count", "source_website"]
-        }
+        return _PROPERTY_SCHEMA
+    
+    @retry(
+        wait=_wait_retry_after_or_backoff,
+        stop=stop_after_attempt(4),
+        retry=retry_if_exception(_is_transient_error),
+        reraise=True
+    )
+    async def _extract_raw(
+        self,
+        urls: List[str],
+        prompt: str,
+        schema: Dict[str, Any],
+        timeout: Optional[float] = None
+    ) -> Any:
+        """Call the Firecrawl extract endpoint, retrying transient failures (timeout applies per attempt)"""
+        # Async client when available, otherwise the synchronous SDK on a dedicated thread pool
+        if self.async_firecrawl is not None:
+            return await asyncio.wait_for(
+                self.async_firecrawl.extract(urls, prompt=prompt, schema=schema),
+                timeout=timeout
+            )
+        
+        loop = asyncio.get_running_loop()
+        call = loop.run_in_executor(
+            _FIRECRAWL_EXECUTOR,
+            lambda: self.firecrawl.extract(urls, prompt=prompt, schema=schema)
+        )
+        try:
+            return await asyncio.wait_for(call, timeout=timeout)
+        except asyncio.TimeoutError:
+            # The thread can't be cancelled: a retry would start a second billed
+            # extract for the same URLs while the first is still running
+            raise _AbandonedExtractTimeout() from None
     
     async def extract_properties(
         self,
         urls: List[str],
-        user_criteria: Dict[str, Any]
+        user_criteria: Dict[str, Any],
+        timeout: Optional[float] = None
     ) -> Dict[str, Any]:
         """
         Extract property data from URLs using Firecrawl
@@ -132,6 +253,7 @@ EXTRACT EVERY VISIBLE PROPERTY LISTING - DO NOT LIMIT TO JUST A FEW!
         Args:
             urls: List of real estate website URLs to scrape
             user_criteria: User's search criteria
+            timeout: Seconds allowed per Firecrawl attempt (None for no limit)
             
         Returns:
             Dict with extracted properties or error
@@ -143,27 +265,13 @@ EXTRACT EVERY VISIBLE PROPERTY LISTING - DO NOT LIMIT TO JUST A FEW!
             prompt = self.build_extraction_prompt(user_criteria)
             schema = self.build_property_schema()
             
-            print(f"Extracting properties from {len(urls)} URLs...")
-            
-            # Call Firecrawl extract endpoint (synchronous, run in executor)
-            import asyncio
-            loop = asyncio.get_event_loop()
-            raw_response = await loop.run_in_executor(
-                None,
-                lambda: self.firecrawl.extract(urls, prompt=prompt, schema=schema)
-            )
+            raw_response = await self._extract_raw(urls, prompt, schema, timeout)
             
-            # Handle response
-            if hasattr(raw_response, 'success') and raw_response.success:
-                data = raw_response.data if hasattr(raw_response, 'data') else {}
-                properties = data.get('properties', [])
-                total_count = data.get('total_count', 0)
-            elif isinstance(raw_response, dict) and raw_response.get('success'):
-                properties = raw_response['data'].get('properties', [])
-                total_count = raw_response['data'].get('total_count', 0)
-            else:
-                properties = []
-                total_count = 0
+            # Handle response (normalized once to a plain dict)
+            response = _response_to_dict(raw_response)
+            data = (response.get('data') or {}) if response.get('success') else {}
+            properties = data.get('properties') or []
+            total_count = data.get('total_count', 0)
             
             if properties:
                 return {
@@ -179,8 +287,13 @@ EXTRACT EVERY VISIBLE PROPERTY LISTING - DO NOT LIMIT TO JUST A FEW!
                     'properties': []
                 }
                 
+        except (asyncio.TimeoutError, _AbandonedExtractTimeout):
+            return {
+                'success': False,
+                'error': f"Timeout after {timeout:.0f} seconds",
+                'properties': []
+            }
         except Exception as e:
-            print(f"Firecrawl extraction error: {str(e)}")
             return {
                 'success': False,
                 'error': f"Extraction failed: {str(e)}",
@@ -193,3 +306,14 @@ def create_firecrawl_service(api_key: Optional[str] = None) -> PropertyExtractio
     """Create a new Firecrawl service instance"""
     return PropertyExtractionService(api_key)
 
+
+# Singleton instance
+_firecrawl_service = None
+
+def get_firecrawl_service() -> PropertyExtractionService:
+    """Get or create the shared Firecrawl service instance"""
+    global _firecrawl_service
+    if _firecrawl_service is None:
+        _firecrawl_service = create_firecrawl_service()
+    return _firecrawl_service
+
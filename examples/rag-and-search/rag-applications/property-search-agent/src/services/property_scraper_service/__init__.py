@@ -5,10 +5,11 @@ This service handles FAST property scraping without AI agents.
 AI reasoning happens later, separately.
 """
 
-from .scrape_properties import scrape_properties
+from .scrape_properties import scrape_properties, properties_from_columns
 
 # Service constant with methods as properties (Motia DDD pattern)
 property_scraper_service = {
-    'scrape_properties': scrape_properties
+    'scrape_properties': scrape_properties,
+    'properties_from_columns': properties_from_columns
 }
 
@@ -6,24 +6,59 @@ No AI agents involved - just fast HTTP calls.
 """
 
 import asyncio
-from typing import Dict, Any, List
-from datetime import datetime
+import hashlib
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Tuple
+from datetime import datetime, timezone
+from urllib.parse import urlsplit, urlunsplit
+
+from ..firecrawl.firecrawl_service import get_firecrawl_service
+
+# Request coalescing for Firecrawl: in-flight calls and short-lived results,
+# keyed by normalized URL + search criteria
+_RESULT_TTL = 300  # seconds
+_RESULT_CACHE_SIZE = 1024
+_result_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_inflight: Dict[str, asyncio.Future] = {}
+
+# Fields kept per property in the columnar (struct-of-arrays) stream layout
+PROPERTY_COLUMNS = (
+    'address', 'price', 'bedrooms', 'bathrooms', 'square_feet',
+    'property_type', 'description', 'listing_url', 'agent_contact', 'features'
+)
+
+# propertyResults payload layout. Version 1 stored a 'properties' list of row
+# dicts; version 2 stores 'propertiesColumnar' (see properties_from_columns)
+PROPERTY_RESULTS_VERSION = 2
+
+# Per-attempt Firecrawl timeout (seconds); batched calls scale it by log2(#urls)
+SCRAPE_TIMEOUT = 15.0
+
+# Max concurrent Firecrawl requests (avoids 429s and wasted timeouts on bursts)
+_firecrawl_semaphore = asyncio.Semaphore(int(os.getenv('FIRECRAWL_MAX_CONCURRENCY', '8')))
 
 
 async def scrape_properties(
     search_id: str,
     search_data: Dict[str, Any],
     logger,
-    streams
+    streams,
+    progress_writer=None
 ) -> Dict[str, Any]:
     """
     Scrape properties FAST in parallel (no AI)
     
-    Returns immediately with raw property data for user review
+    Returns immediately with raw property data for user review.
+    progress_writer (e.g. the caller's progress batcher) receives progress
+    updates instead of the stream, so they are coalesced with the caller's own.
     """
     try:
         # Update progress
-        await _update_progress(streams, search_id, 'scraping', 0.2, 
+        await _update_progress(streams, progress_writer, search_id, 'scraping', 0.2, 
                                'Searching properties across multiple websites...')
         
         # Get search URLs
@@ -32,112 +67,233 @@ async def scrape_properties(
         if not urls:
             return {"success": False, "error": "No search URLs provided"}
         
-        logger.info(f"Starting parallel scraping from {len(urls)} URLs")
+        results = None
         
-        # Scrape ALL URLs in PARALLEL (much faster!)
-        scrape_tasks = [
-            _scrape_single_url(url, search_data, logger) 
-            for url in urls
-        ]
+        if len(urls) > 1:
+            # Try ONE Firecrawl extract call for all URLs first (server-side batching)
+            logger.info("Starting batched scraping", {"search_id": search_id, "num_urls": len(urls)})
+            user_criteria = _build_user_criteria(search_data)
+            batched = await _extract_urls(
+                urls, user_criteria, logger,
+                timeout=SCRAPE_TIMEOUT * max(1.0, math.log2(len(urls)))
+            )
+            if batched.get('success'):
+                results = [batched]
+            else:
+                logger.warn("Batched scraping failed, retrying per URL", {"search_id": search_id, "error": batched.get('error')})
         
-        # Wait for all scraping to complete (parallel!)
-        results = await asyncio.gather(*scrape_tasks, return_exceptions=True)
+        if results is None:
+            logger.info("Starting parallel scraping", {"search_id": search_id, "num_urls": len(urls)})
+            
+            # Scrape ALL URLs in PARALLEL (much faster!)
+            scrape_tasks = [
+                _scrape_single_url(url, search_data, logger) 
+                for url in urls
+            ]
+            
+            # Wait for all scraping to complete (parallel!)
+            results = await asyncio.gather(*scrape_tasks, return_exceptions=True)
         
-        # Collect all properties
+        # Collect all properties, skipping listings already seen from another source
         all_properties = []
+        seen_listings = set()
         errors = []
         
         for i, result in enumerate(results):
-            if isinstance(result, Exception):
+            if isinstance(result, BaseException):
                 errors.append(f"URL {i+1} failed: {str(result)}")
-                logger.error(f"Scraping failed for URL {urls[i]}: {str(result)}")
+                logger.error("Scraping failed for URL", {"url": urls[i], "error": str(result)})
             elif result.get('success'):
-                all_properties.extend(result.get('properties', []))
+                for prop in result.get('properties', []):
+                    listing_key = _listing_key(prop)
+                    if listing_key in seen_listings:
+                        continue
+                    seen_listings.add(listing_key)
+                    all_properties.append(prop)
             else:
                 errors.append(f"URL {i+1}: {result.get('error', 'Unknown error')}")
         
         if not all_properties and errors:
-            await _update_progress(streams, search_id, 'error', 0.0, 
+            await _update_progress(streams, progress_writer, search_id, 'error', 0.0, 
                                    f'All scraping failed: {errors[0]}')
             return {"success": False, "error": errors[0]}
         
-        logger.info(f"Found {len(all_properties)} properties from {len(urls)} sources")
+        logger.info("Scraping finished", {"search_id": search_id, "num_properties": len(all_properties), "num_sources": len(urls)})
         
         # Store raw results for USER REVIEW
-        await _update_progress(streams, search_id, 'properties_found', 0.8,
+        await _update_progress(streams, progress_writer, search_id, 'properties_found', 0.8,
                                f'Found {len(all_properties)} properties - ready for review')
         
-        # Store in propertyResults stream (user can review before AI analysis)
+        # Store in propertyResults stream (user can review before AI analysis).
+        # Properties are stored column-wise so each field name is written once.
         raw_results = {
             'searchId': search_id,
-            'properties': all_properties,
+            'payloadVersion': PROPERTY_RESULTS_VERSION,
+            'propertiesColumnar': properties_to_columns(all_properties),
             'totalCount': len(all_properties),
             'sourceWebsites': search_data.get('selectedWebsites', []),
             'searchCriteria': search_data,
             'scrapingErrors': errors if errors else None,
             'status': 'ready_for_review',
-            'createdAt': datetime.utcnow().isoformat(),
+            'createdAt': _now_iso(),
             'message': 'Properties found - trigger AI analysis when ready'
         }
         
         await streams.propertyResults.set('searches', search_id, raw_results)
         
-        await _update_progress(streams, search_id, 'completed', 1.0,
+        await _update_progress(streams, progress_writer, search_id, 'completed', 1.0,
                                f'Found {len(all_properties)} properties - review them before AI analysis')
         
         return {"success": True, "properties": all_properties, "searchId": search_id}
         
     except Exception as e:
         error_msg = str(e)
-        logger.error(f"Property scraping failed: {error_msg}")
-        await _update_progress(streams, search_id, 'error', 0.0, f'Scraping failed: {error_msg}')
+        logger.error("Property scraping failed", {"search_id": search_id, "error": error_msg})
+        await _update_progress(streams, progress_writer, search_id, 'error', 0.0, f'Scraping failed: {error_msg}')
         return {"success": False, "error": error_msg}
 
 
+def _listing_key(prop: Dict[str, Any]) -> Tuple[str, str]:
+    """Identity of a listing across sources: normalized address + price"""
+    address = ' '.join(str(prop.get('address', '')).lower().split())
+    price = str(prop.get('price', '')).strip()
+    return (address, price)
+
+
+def properties_to_columns(properties: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Convert a list of property dicts into one list per field"""
+    columns = {
+        key: [p.get(key) for p in properties]
+        for key in PROPERTY_COLUMNS
+        if key != 'features'
+    }
+    columns['features'] = [p.get('features') or [] for p in properties]
+    return columns
+
+
+def properties_from_columns(columns: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """Rebuild property dicts from the columnar layout (for consumers that need rows)"""
+    keys = list(columns)
+    return [dict(zip(keys, values)) for values in zip(*columns.values())]
+
+
 async def _scrape_single_url(url: str, search_data: Dict, logger) -> Dict[str, Any]:
     """
     Scrape a single URL (fast, no AI)
     
-    Uses Firecrawl's extract API with timeout protection
+    Identical (url, criteria) requests are coalesced: concurrent duplicates
+    share one in-flight Firecrawl call and successful results are reused
+    for a short TTL.
     """
-    from ..firecrawl.firecrawl_service import create_firecrawl_service
+    user_criteria = _build_user_criteria(search_data)
+    
+    key = hashlib.blake2b(
+        f"{_normalize_url(url)}|{json.dumps(user_criteria, sort_keys=True)}".encode(),
+        digest_size=16
+    ).hexdigest()
     
+    cached = _result_cache.get(key)
+    if cached and time.monotonic() - cached[0] < _RESULT_TTL:
+        logger.info("Using cached scrape result", {"url": url})
+        return cached[1]
+    
+    inflight = _inflight.get(key)
+    if inflight is not None:
+        logger.info("Joining in-flight scrape", {"url": url})
+        return await asyncio.shield(inflight)
+    
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
     try:
-        firecrawl_service = create_firecrawl_service()
-        
-        user_criteria = {
-            'budget_range': f"${search_data.get('budgetRange', {}).get('min', 0):,} - ${search_data.get('budgetRange', {}).get('max', 0):,}",
-            'property_type': search_data.get('propertyType', 'Any'),
-            'bedrooms': search_data.get('bedrooms', 'Any'),
-            'bathrooms': search_data.get('bathrooms', 'Any'),
-        }
+        result = await _extract_urls([url], user_criteria, logger)
+        future.set_result(result)
+    except BaseException:
+        # Only cancellation gets here (_extract_urls returns errors as results).
+        # Hand joiners an error result rather than cancelling their awaits too
+        future.set_result({"success": False, "error": "Scrape was cancelled"})
+        raise
+    finally:
+        _inflight.pop(key, None)
+    
+    if result.get('success'):
+        _result_cache[key] = (time.monotonic(), result)
+        _result_cache.move_to_end(key)
+        while len(_result_cache) > _RESULT_CACHE_SIZE:
+            _result_cache.popitem(last=False)
+    
+    return result
+
+
+async def _extract_urls(
+    urls: List[str],
+    user_criteria: Dict[str, Any],
+    logger,
+    timeout: float = None
+) -> Dict[str, Any]:
+    """
+    Extract properties from one or more URLs in a single Firecrawl call
+    
+    Uses Firecrawl's extract API with a timeout on each attempt
+    """
+    timeout = timeout or SCRAPE_TIMEOUT
+    target = urls[0] if len(urls) == 1 else f"{len(urls)} URLs"
+    
+    try:
+        firecrawl_service = get_firecrawl_service()
         
-        # Extract with TIMEOUT (prevent hanging)
-        result = await asyncio.wait_for(
-            firecrawl_service.extract_properties(
-                urls=[url],
-                user_criteria=user_criteria
-            ),
-            timeout=15.0  # 15 second timeout per URL
-        )
+        # Bound concurrent Firecrawl calls. The timeout applies to each attempt
+        # inside the service, so transient-error retries get their own budget
+        async with _firecrawl_semaphore:
+            result = await firecrawl_service.extract_properties(
+                urls=urls,
+                user_criteria=user_criteria,
+                timeout=timeout
+            )
         
         return result
         
-    except asyncio.TimeoutError:
-        logger.warn(f"Timeout scraping {url}")
-        return {"success": False, "error": f"Timeout after 15 seconds"}
     except Exception as e:
-        logger.error(f"Error scraping {url}: {str(e)}")
+        logger.error("Error scraping", {"target": target, "error": str(e)})
         return {"success": False, "error": str(e)}
 
 
-async def _update_progress(streams, search_id: str, stage: str, progress: float, message: str):
-    """Helper to update progress stream"""
+def _build_user_criteria(search_data: Dict) -> Dict[str, Any]:
+    """Map search input to the criteria used in the extraction prompt"""
+    return {
+        'budget_range': f"${search_data.get('budgetRange', {}).get('min', 0):,} - ${search_data.get('budgetRange', {}).get('max', 0):,}",
+        'property_type': search_data.get('propertyType', 'Any'),
+        'bedrooms': search_data.get('bedrooms', 'Any'),
+        'bathrooms': search_data.get('bathrooms', 'Any'),
+    }
+
+
+def _normalize_url(url: str) -> str:
+    """Normalize a URL for cache keys (case-insensitive scheme/host, no trailing slash)"""
+    parts = urlsplit(url.strip())
+    return urlunsplit((
+        parts.scheme.lower(),
+        parts.netloc.lower(),
+        parts.path.rstrip('/'),
+        parts.query,
+        ''
+    ))
+
+
+async def _update_progress(streams, progress_writer, search_id: str, stage: str, progress: float, message: str):
+    """Helper to update progress stream (through progress_writer when given)"""
+    if progress_writer is not None:
+        await progress_writer.update(search_id, stage, progress, message)
+        return
+    
     await streams.propertySearchProgress.set('searches', search_id, {
         'searchId': search_id,
         'stage': stage,
         'progress': progress,
         'message': message,
-        'timestamp': datetime.utcnow().isoformat()
+        'timestamp': _now_iso()
     })
 
+
+def _now_iso() -> str:
+    """Current UTC time as ISO-8601 with millisecond precision"""
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds')
@@ -0,0 +1,115 @@
+"""
+Market Batch Poller Cron Step
+
+Collects deferred market analyses submitted through the OpenAI Batch API.
+Pending batches are recorded in the 'market_batches' state group; each run
+polls the ones that are due and backs off on the rest.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../src'))
+
+from services.agents.property_agents import poll_batch
+
+config = {
+    "name": "MarketBatchPoller",
+    "type": "cron",
+    "description": "Collect deferred market analyses from the OpenAI Batch API",
+    "cron": "* * * * *",
+    "emits": [],
+    "flows": ["real-estate-search"]
+}
+
+# Poll delay doubles per attempt up to the max; give up after the batch window
+POLL_INITIAL_DELAY = 30  # seconds
+POLL_MAX_DELAY = 600  # seconds
+BATCH_WINDOW = 86400  # seconds, matches the 24h completion_window
+
+# Batch statuses that will never produce results
+_FAILED_STATUSES = {"failed", "expired", "cancelling", "cancelled"}
+
+
+async def handler(context):
+    """Poll every pending batch that is due"""
+    pending = await context.state.get_group('market_batches') or []
+    now = time.time()
+
+    due = []
+    for entry in pending:
+        entry = entry.get('data', entry) if isinstance(entry, dict) else entry
+        if isinstance(entry, dict) and entry.get('nextPollAt', 0) <= now:
+            due.append(entry)
+
+    if due:
+        await asyncio.gather(*(_poll_one(entry, context) for entry in due))
+
+
+async def _poll_one(entry, context):
+    """Poll one batch: store its result, give up on it, or schedule the next poll"""
+    search_id = entry['searchId']
+    batch_id = entry['batchId']
+    expired = time.time() - entry['submittedAt'] > BATCH_WINDOW
+
+    try:
+        batch = await poll_batch(batch_id)
+    except Exception as e:
+        # Transient (network, 5xx, rate limit): retry on a later run
+        context.logger.warn(f"Polling market analysis batch {batch_id} failed: {str(e)}")
+        batch = {'status': 'unknown', 'results': None}
+
+    status = batch['status']
+
+    if status == 'completed':
+        await _finish(entry, context, (batch['results'] or {}).get('0'))
+        context.logger.info(f"Market analysis batch {batch_id} completed for {search_id}")
+    elif status in _FAILED_STATUSES or expired:
+        await _finish(entry, context, None)
+        context.logger.error(f"Market analysis batch {batch_id} for {search_id} ended with status {status}")
+    else:
+        attempt = entry.get('attempt', 0)
+        await context.state.set('market_batches', batch_id, {
+            **entry,
+            'attempt': attempt + 1,
+            'nextPollAt': time.time() + min(POLL_INITIAL_DELAY * 2 ** attempt, POLL_MAX_DELAY)
+        })
+
+
+async def _finish(entry, context, content):
+    """Store the analysis (and cache successful results), publish it and drop the pending entry"""
+    analysis = content or 'Market analysis not available'
+    writes = [
+        context.state.set('market_analysis', entry['searchId'], {
+            'analysis': analysis,
+            'city': entry.get('city'),
+            'state': entry.get('state'),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+        }),
+        _publish_analysis(entry['searchId'], analysis, context)
+    ]
+    if content:
+        writes.append(context.state.set('market_cache', entry['cacheKey'], {
+            'analysis': content,
+            'ts': time.time()
+        }))
+    await asyncio.gather(*writes)
+    await context.state.delete('market_batches', entry['batchId'])
+
+
+async def _publish_analysis(search_id, analysis, context):
+    """Patch the finished analysis into the search results already shown to the user"""
+    results_item = await context.streams.propertyResults.get('searches', search_id)
+    if isinstance(results_item, dict):
+        results = results_item.get('data', results_item)
+    else:
+        results = getattr(results_item, 'data', results_item)
+    if not results:
+        # Results not published yet; the aggregator reads market_analysis itself
+        return
+
+    results['marketAnalysis'] = {'fullAnalysis': analysis}
+    await context.streams.propertyResults.set('searches', search_id, results)
@@ -5,14 +5,19 @@ Analyzes market trends using Agno AI agents.
 Runs in PARALLEL with property scraping!
 """
 
+import asyncio
+import hashlib
 import os
 import sys
+import time
+from datetime import datetime, timezone
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../src'))
 
 from services.agents.property_agents import (
     create_market_analysis_agent,
-    analyze_properties_with_agent
+    analyze_properties_with_agent,
+    submit_agent_batch
 )
 
 config = {
@@ -27,13 +32,27 @@ config = {
             "searchId": {"type": "string"},
             "city": {"type": "string"},
             "state": {"type": "string"},
-            "budgetRange": {"type": "object"}
+            "budgetRange": {"type": "object"},
+            "deferred": {"type": "boolean"}
         },
         "required": ["searchId", "city", "state"]
     },
     "flows": ["real-estate-search"]
 }
 
+# Analyses are reused across searches for the same city/state and a similar
+# budget (budget bounds are bucketed to this many dollars)
+MARKET_CACHE_TTL = 86400  # seconds
+MARKET_BUDGET_BUCKET = 50_000
+
+
+def _market_cache_key(city: str, state: str, budget_range: dict) -> str:
+    """Cache key for a market analysis: location plus bucketed budget bounds"""
+    budget_min = int(budget_range.get('min') or 0) // MARKET_BUDGET_BUCKET
+    budget_max = int(budget_range.get('max') or 0) // MARKET_BUDGET_BUCKET
+    raw = f"{city.strip().lower()}|{state.strip().lower()}|{budget_min}|{budget_max}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
 
 async def handler(input_data, context):
     """
@@ -49,20 +68,47 @@ async def handler(input_data, context):
     try:
         context.logger.info(f"Starting market analysis for {search_id} in {city}, {state}")
         
-        # Update progress
-        from datetime import datetime
-        await context.streams.propertySearchProgress.set('searches', search_id, {
+        # Update progress while the analysis runs, not before it
+        progress = context.streams.propertySearchProgress.set('searches', search_id, {
             'searchId': search_id,
             'stage': 'market_analyzing',
             'progress': 0.5,
             'message': f'AI analyzing {city} market trends...',
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='milliseconds')
         })
-        
-        # Use Agno agent for market analysis
-        market_agent = create_market_analysis_agent(provider='openai')
-        
-        prompt = f"""
+        await asyncio.gather(
+            progress,
+            _analyze_market(input_data, context, search_id, city, state, budget_range)
+        )
+    
+    except Exception as e:
+        context.logger.error(f"Market analysis failed: {str(e)}")
+
+
+async def _analyze_market(input_data, context, search_id, city, state, budget_range):
+    """Serve the analysis from cache, defer it to the Batch API, or run the agent"""
+    # Reuse a recent analysis of the same market instead of another LLM call
+    cache_key = _market_cache_key(city, state, budget_range)
+    cached = await context.state.get('market_cache', cache_key)
+    cached = cached.get('data', cached) if isinstance(cached, dict) else cached
+    if cached and time.time() - cached.get('ts', 0) >= MARKET_CACHE_TTL:
+        # Expired: evict it so stale analyses don't accumulate in state
+        await context.state.delete('market_cache', cache_key)
+        cached = None
+    if cached:
+        await context.state.set('market_analysis', search_id, {
+            'analysis': cached['analysis'],
+            'city': city,
+            'state': state,
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+        })
+        context.logger.info(f"Market analysis for {search_id} served from cache")
+        return
+    
+    # Use Agno agent for market analysis
+    market_agent = create_market_analysis_agent(provider='openai')
+    
+    prompt = f"""
 Analyze real estate market for: {city}, {state}
 
 BUDGET RANGE: ${budget_range.get('min', 0):,} - ${budget_range.get('max', 0):,}
@@ -75,21 +121,50 @@ Provide CONCISE analysis:
 
 Keep under 150 words total.
 """
-        
-        result = await analyze_properties_with_agent(market_agent, prompt)
-        market_analysis = result.get('content', 'Market analysis not available')
-        
-        # Store market analysis
-        from datetime import datetime
-        await context.state.set('market_analysis', search_id, {
+
+    if input_data.get('deferred'):
+        # Non-realtime request: route through the cheaper Batch API and
+        # record the batch id, MarketBatchPoller stores the result when ready
+        batch_id = await submit_agent_batch(market_agent, [prompt])
+        await asyncio.gather(
+            context.state.set('market_analysis', search_id, {
+                'status': 'pending',
+                'batchId': batch_id,
+                'city': city,
+                'state': state,
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+            }),
+            # Picked up by the MarketBatchPoller cron step
+            context.state.set('market_batches', batch_id, {
+                'searchId': search_id,
+                'batchId': batch_id,
+                'cacheKey': cache_key,
+                'city': city,
+                'state': state,
+                'submittedAt': time.time(),
+                'attempt': 0,
+                'nextPollAt': 0
+            })
+        )
+        context.logger.info(f"Market analysis batch {batch_id} submitted for {search_id}")
+        return
+    
+    result = await analyze_properties_with_agent(market_agent, prompt)
+    market_analysis = result.get('content', 'Market analysis not available')
+    
+    # Store market analysis (and cache it for other searches) in parallel
+    writes = [context.state.set('market_analysis', search_id, {
+        'analysis': market_analysis,
+        'city': city,
+        'state': state,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+    })]
+    if result.get('content'):
+        writes.append(context.state.set('market_cache', cache_key, {
             'analysis': market_analysis,
-            'city': city,
-            'state': state,
-            'timestamp': datetime.utcnow().isoformat()
-        })
-        
-        context.logger.info(f"Market analysis completed for {search_id}")
-        
-    except Exception as e:
-        context.logger.error(f"Market analysis failed: {str(e)}")
+            'ts': time.time()
+        }))
+    await asyncio.gather(*writes)
+    
+    context.logger.info(f"Market analysis completed for {search_id}")
 
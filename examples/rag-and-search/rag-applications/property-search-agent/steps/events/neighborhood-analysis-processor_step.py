@@ -5,8 +5,10 @@ Analyzes neighborhoods based on user preferences.
 Runs in PARALLEL with other processors!
 """
 
+import asyncio
 import os
 import sys
+from datetime import datetime, timezone
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../src'))
 
@@ -44,15 +46,15 @@ async def handler(input_data, context):
     try:
         context.logger.info(f"Starting neighborhood analysis for {search_id}")
         
-        # Update progress
-        from datetime import datetime
-        await context.streams.propertySearchProgress.set('searches', search_id, {
+        # Update progress while the analysis runs, not before it: the write is started
+        # now and awaited with the result
+        progress = asyncio.ensure_future(context.streams.propertySearchProgress.set('searches', search_id, {
             'searchId': search_id,
             'stage': 'neighborhood_analyzing',
             'progress': 0.6,
             'message': f'Analyzing neighborhoods in {city} for: {", ".join(preferences)}...',
-            'timestamp': datetime.utcnow().isoformat()
-        })
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+        }))
         
         # TODO: Analyze neighborhoods based on preferences
         # - Good schools
@@ -71,7 +73,10 @@ async def handler(input_data, context):
         }
         
         # Store neighborhood analysis
-        await context.state.set('neighborhood_analysis', search_id, neighborhood_analysis)
+        await asyncio.gather(
+            progress,
+            context.state.set('neighborhood_analysis', search_id, neighborhood_analysis)
+        )
         
         context.logger.info(f"Neighborhood analysis completed for {search_id}")
         
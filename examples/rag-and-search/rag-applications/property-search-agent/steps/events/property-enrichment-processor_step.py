@@ -5,8 +5,10 @@ Enriches properties with additional data (school ratings, crime stats, etc.)
 Runs in PARALLEL with other event processors.
 """
 
+import asyncio
 import os
 import sys
+from datetime import datetime, timezone
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../src'))
 
@@ -42,15 +44,15 @@ async def handler(input_data, context):
     try:
         context.logger.info(f"Starting property enrichment for {search_id} in {city}, {state}")
         
-        # Update progress
-        from datetime import datetime
-        await context.streams.propertySearchProgress.set('searches', search_id, {
+        # Update progress while the enrichment runs, not before it: the write is started
+        # now and awaited with the result
+        progress = asyncio.ensure_future(context.streams.propertySearchProgress.set('searches', search_id, {
             'searchId': search_id,
             'stage': 'enriching',
             'progress': 0.4,
             'message': f'Enriching properties with school ratings, crime stats for {city}...',
-            'timestamp': datetime.utcnow().isoformat()
-        })
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+        }))
         
         # TODO: Call enrichment APIs in parallel
         # - School ratings API
@@ -66,7 +68,10 @@ async def handler(input_data, context):
         }
         
         # Store enrichment data
-        await context.state.set('enrichment', search_id, enrichment_data)
+        await asyncio.gather(
+            progress,
+            context.state.set('enrichment', search_id, enrichment_data)
+        )
         
         context.logger.info(f"Property enrichment completed for {search_id}")
         
@@ -5,8 +5,11 @@ FAST property scraping (no AI).
 Thin controller following Motia DDD pattern.
 """
 
+import asyncio
 import os
 import sys
+from collections import OrderedDict
+from datetime import datetime, timezone
 
 # Add src to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../src'))
@@ -56,6 +59,84 @@ config = {
     "flows": ["real-estate-search"]
 }
 
+# Progress updates are coalesced per search for this long before hitting the stream
+PROGRESS_FLUSH_DELAY = 0.05  # seconds
+
+# Extra debug progress writes (e.g. "handler started"), off in production
+MOTIA_DEBUG = os.getenv('MOTIA_DEBUG', '').lower() in ('1', 'true', 'yes')
+
+# Last (stage, progress, message) written per search, shared across invocations
+# so retried or duplicate events don't rewrite the same update
+_LAST_WRITTEN_SIZE = 1024
+_last_written: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+class _ProgressBatcher:
+    """
+    Debounced, last-write-wins writer for the progress stream
+    
+    Updates for a search are buffered and written once per flush window;
+    terminal updates (progress >= 1.0 or stage 'error') are written immediately.
+    An update identical (stage, progress and message) to the last one written is skipped.
+    """
+    
+    def __init__(self, stream, delay: float = PROGRESS_FLUSH_DELAY):
+        self._stream = stream
+        self._delay = delay
+        self._pending = {}
+        self._timers = {}
+        self._lock = asyncio.Lock()
+    
+    async def update(self, search_id: str, stage: str, progress: float, message: str):
+        """Buffer an update, replacing any pending one for the same search"""
+        self._pending[search_id] = (stage, progress, message)
+        
+        if progress >= 1.0 or stage == 'error':
+            await self.flush(search_id)
+        elif search_id not in self._timers:
+            self._timers[search_id] = asyncio.create_task(self._flush_later(search_id))
+    
+    async def flush(self, search_id: str = None):
+        """Write pending updates now (all searches when search_id is None)"""
+        search_ids = [search_id] if search_id is not None else list(self._pending)
+        for sid in search_ids:
+            timer = self._timers.pop(sid, None)
+            if timer:
+                timer.cancel()
+            await self._write(sid)
+    
+    async def _flush_later(self, search_id: str):
+        await asyncio.sleep(self._delay)
+        self._timers.pop(search_id, None)
+        await self._write(search_id)
+    
+    async def _write(self, search_id: str):
+        async with self._lock:
+            update = self._pending.pop(search_id, None)
+            if update is None:
+                return
+            
+            stage, progress, message = update
+            # The message is part of the key: the scraper's and the aggregator's
+            # 'completed' updates share stage and progress but not the message
+            state = (stage, progress, message)
+            if _last_written.get(search_id) == state:
+                return
+            
+            # Payload built once per flush, not per call site
+            await self._stream.set('searches', search_id, {
+                'searchId': search_id,
+                'stage': stage,
+                'progress': progress,
+                'message': message,
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+            })
+            
+            _last_written[search_id] = state
+            _last_written.move_to_end(search_id)
+            if len(_last_written) > _LAST_WRITTEN_SIZE:
+                _last_written.popitem(last=False)
+
 
 async def handler(input_data, context):
     """
@@ -64,19 +145,17 @@ async def handler(input_data, context):
     Runs in PARALLEL with market analysis, enrichment, etc!
     """
     search_id = input_data.get('searchId')
+    progress = _ProgressBatcher(context.streams.propertySearchProgress)
     
     try:
         context.logger.info(f"🔵 EVENT HANDLER STARTED for {search_id}")
         
-        # IMMEDIATE debug write to confirm handler is running
-        from datetime import datetime
-        await context.streams.propertySearchProgress.set('searches', search_id, {
-            'searchId': search_id,
-            'stage': 'searching_properties',
-            'progress': 0.1,
-            'message': '🔵 Property scraper event handler started!',
-            'timestamp': datetime.utcnow().isoformat()
-        })
+        if MOTIA_DEBUG:
+            # IMMEDIATE debug write to confirm handler is running
+            await progress.update(search_id, 'searching_properties', 0.1, '🔵 Property scraper event handler started!')
+            
+            # Written right away rather than coalesced with the scraper's first update
+            await progress.flush(search_id)
         
         context.logger.info(f"Calling property scraper service...")
         
@@ -85,7 +164,8 @@ async def handler(input_data, context):
             search_id=search_id,
             search_data=input_data,
             logger=context.logger,
-            streams=context.streams
+            streams=context.streams,
+            progress_writer=progress
         )
         
         context.logger.info(f"Scraper result: success={result.get('success')}, error={result.get('error')}")
@@ -94,19 +174,13 @@ async def handler(input_data, context):
             context.logger.info(f"✅ Property scraping completed for {search_id}")
             
             # Aggregate with other parallel results (market, enrichment, neighborhoods)
-            await _aggregate_results(context, search_id)
+            await _aggregate_results(context, search_id, progress)
         else:
             error_msg = result.get('error', 'Unknown error')
             context.logger.error(f"❌ Property scraping failed: {error_msg}")
             
             # Write error to progress stream
-            await context.streams.propertySearchProgress.set('searches', search_id, {
-                'searchId': search_id,
-                'stage': 'error',
-                'progress': 0.0,
-                'message': f'Scraping failed: {error_msg}',
-                'timestamp': datetime.utcnow().isoformat()
-            })
+            await progress.update(search_id, 'error', 0.0, f'Scraping failed: {error_msg}')
             
     except Exception as e:
         import traceback
@@ -114,23 +188,32 @@ async def handler(input_data, context):
         context.logger.error(f"❌ Unexpected error in scraping handler: {str(e)}\n{error_details}")
         
         # Write error to stream
-        from datetime import datetime
-        await context.streams.propertySearchProgress.set('searches', search_id, {
-            'searchId': search_id,
-            'stage': 'error',
-            'progress': 0.0,
-            'message': f'Handler error: {str(e)}',
-            'timestamp': datetime.utcnow().isoformat()
-        })
+        await progress.update(search_id, 'error', 0.0, f'Handler error: {str(e)}')
+    finally:
+        # Step completion: nothing buffered may outlive the handler
+        await progress.flush()
 
 
-async def _aggregate_results(context, search_id):
+async def _aggregate_results(context, search_id, progress):
     """
     Aggregate results from all parallel processors
     """
     try:
-        # Get property results
-        results_item = await context.streams.propertyResults.get('searches', search_id)
+        # Property results and the parallel processors' outputs are independent reads
+        fetched = await asyncio.gather(
+            context.streams.propertyResults.get('searches', search_id),
+            context.state.get('market_analysis', search_id),
+            context.state.get('enrichment', search_id),
+            context.state.get('neighborhood_analysis', search_id),
+            return_exceptions=True
+        )
+        for name, value in zip(('results', 'market_analysis', 'enrichment', 'neighborhood_analysis'), fetched):
+            if isinstance(value, Exception):
+                context.logger.warn(f"Failed to fetch {name} for {search_id}: {str(value)}")
+        results_item, market_data, enrichment_data, neighborhood_data = (
+            None if isinstance(value, Exception) else value for value in fetched
+        )
+        
         if not results_item:
             context.logger.warn(f"No results found for {search_id}")
             return
@@ -145,18 +228,18 @@ async def _aggregate_results(context, search_id):
             context.logger.warn(f"Results data is empty for {search_id}")
             return
         
-        # Get market analysis (from parallel processor)
-        market_data = await context.state.get('market_analysis', search_id)
+        # Market analysis (from parallel processor)
         if market_data:
             results['marketAnalysis'] = {'fullAnalysis': market_data.get('analysis', '')}
+            if market_data.get('status') == 'pending':
+                # Deferred batch: MarketBatchPoller patches the analysis in when it finishes
+                results['marketAnalysis']['status'] = 'pending'
         
-        # Get enrichment data (from parallel processor)
-        enrichment_data = await context.state.get('enrichment', search_id)
+        # Enrichment data (from parallel processor)
         if enrichment_data:
             results['enrichmentData'] = enrichment_data
         
-        # Get neighborhood analysis (from parallel processor)
-        neighborhood_data = await context.state.get('neighborhood_analysis', search_id)
+        # Neighborhood analysis (from parallel processor)
         if neighborhood_data:
             results['neighborhoodAnalysis'] = neighborhood_data
         
@@ -166,14 +249,10 @@ async def _aggregate_results(context, search_id):
         await context.streams.propertyResults.set('searches', search_id, results)
         
         # Update progress
-        from datetime import datetime
-        await context.streams.propertySearchProgress.set('searches', search_id, {
-            'searchId': search_id,
-            'stage': 'completed',
-            'progress': 1.0,
-            'message': f'Complete! Found {results.get("totalCount", 0)} properties with full analysis.',
-            'timestamp': datetime.utcnow().isoformat()
-        })
+        await progress.update(
+            search_id, 'completed', 1.0,
+            f'Complete! Found {results.get("totalCount", 0)} properties with full analysis.'
+        )
         
     except Exception as e:
         context.logger.error(f"Result aggregation failed: {str(e)}")
@@ -2,13 +2,79 @@
 """
 Script to split a large JSON file containing knowledge items into smaller files.
 Each output file will contain 5 items from the original array.
+
+With ijson installed (pip install ijson) the input is streamed, so only one
+output file's worth of items is held in memory at a time.
 """
 
 import json
 import os
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+    JSON_ERRORS = (json.JSONDecodeError, ijson.JSONError)
+except ImportError:
+    IJSON_AVAILABLE = False
+    JSON_ERRORS = (json.JSONDecodeError,)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Output files are independent, so they are written by a small thread pool
+WRITE_WORKERS = min(8, os.cpu_count() or 1)
+
+def iter_items(input_file):
+    """
+    Yield the entries of the input file's top-level 'item' array one at a time.
+    
+    Args:
+        input_file (str): Path to the input JSON file
+    """
+    if IJSON_AVAILABLE:
+        with open(input_file, 'rb') as f:
+            yield from ijson.items(f, 'item.item', use_float=True)
+        return
+    
+    # Fallback: load the whole document
+    if ORJSON_AVAILABLE:
+        with open(input_file, 'rb') as f:
+            data = orjson.loads(f.read())
+    else:
+        with open(input_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    
+    if 'item' not in data or not isinstance(data['item'], list):
+        raise ValueError("Input file must contain an 'item' array.")
+    yield from data['item']
+
+def write_part(chunk_items, output_dir, base_name, part_number):
+    """Write one output file holding a slice of the items and return its name."""
+    # Create output data structure
+    output_data = {
+        "item": chunk_items
+    }
+    
+    # Generate output filename
+    output_filename = f"{base_name}_part_{part_number:03d}.md"
+    output_path = output_dir / output_filename
+    
+    # Serialize in memory and write the file in one call (orjson writes UTF-8
+    # directly, like ensure_ascii=False; json.dump would issue a write per token)
+    if ORJSON_AVAILABLE:
+        output_path.write_bytes(orjson.dumps(output_data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    else:
+        output_path.write_text(json.dumps(output_data, ensure_ascii=False, indent=2), encoding='utf-8')
+    
+    return output_filename
+
 def split_json_file(input_file, items_per_file=20, output_dir=None):
     """
     Split a JSON file with an 'item' array into smaller files.
@@ -31,57 +97,60 @@ def split_json_file(input_file, items_per_file=20, output_dir=None):
             output_dir = "."
     
     # Create output directory if it doesn't exist
-    os.makedirs(output_dir, exist_ok=True)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
     
     try:
         # Read the input JSON file
         print(f"Reading input file: {input_file}")
-        with open(input_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        # Validate structure
-        if 'item' not in data or not isinstance(data['item'], list):
-            print("Error: Input file must contain an 'item' array.")
-            return False
-        
-        items = data['item']
-        total_items = len(items)
-        print(f"Found {total_items} items in the input file.")
-        
-        # Calculate number of output files needed
-        num_files = (total_items + items_per_file - 1) // items_per_file
-        print(f"Will create {num_files} output files with {items_per_file} items each.")
+        print(f"Writing output files with {items_per_file} items each.")
         
         # Get base filename without extension
         base_name = Path(input_file).stem
         
-        # Split items into chunks and create output files
-        for i in range(num_files):
-            start_idx = i * items_per_file
-            end_idx = min(start_idx + items_per_file, total_items)
-            
-            # Create chunk of items
-            chunk_items = items[start_idx:end_idx]
-            
-            # Create output data structure
-            output_data = {
-                "item": chunk_items
-            }
+        # Collect items into chunks and hand each one to the writer pool as soon
+        # as it is full; at most two parts per worker are held in memory
+        total_items = 0
+        num_files = 0
+        pending = deque()
+        
+        def finish_oldest():
+            """Wait for the oldest queued part and report it, in file order."""
+            future, start_idx, count = pending.popleft()
+            print(f"Created: {future.result()} (items {start_idx+1}-{start_idx+count})")
+        
+        with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as executor:
+            def submit(chunk_items):
+                nonlocal total_items, num_files
+                num_files += 1
+                future = executor.submit(write_part, chunk_items, output_dir, base_name, num_files)
+                pending.append((future, total_items, len(chunk_items)))
+                total_items += len(chunk_items)
+                if len(pending) >= 2 * WRITE_WORKERS:
+                    finish_oldest()
             
-            # Generate output filename
-            output_filename = f"{base_name}_part_{i+1:03d}.md"
-            output_path = os.path.join(output_dir, output_filename)
+            chunk_items = []
+            for item in iter_items(input_file):
+                chunk_items.append(item)
+                if len(chunk_items) == items_per_file:
+                    submit(chunk_items)
+                    chunk_items = []
             
-            # Write output file
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(output_data, f, ensure_ascii=False, indent=2)
+            if chunk_items:
+                submit(chunk_items)
             
-            print(f"Created: {output_filename} (items {start_idx+1}-{end_idx})")
+            while pending:
+                finish_oldest()
+        
+        # Validate structure (a streamed file without an 'item' array yields nothing)
+        if total_items == 0:
+            print("Error: Input file must contain a non-empty 'item' array.")
+            return False
         
         print(f"\nSuccessfully split {total_items} items into {num_files} files.")
         return True
         
-    except json.JSONDecodeError as e:
+    except JSON_ERRORS as e:
         print(f"Error: Invalid JSON in input file: {e}")
         return False
     except Exception as e:
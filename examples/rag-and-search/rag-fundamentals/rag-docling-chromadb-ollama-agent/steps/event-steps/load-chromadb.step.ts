@@ -180,16 +180,29 @@ export const handler: Handlers['load-chromadb'] = async (
         continue;
       }
       
+      // State keys are unique per file and batch, so ids don't collide across events
+      const batchIds = batch.map((_, index) => `${input.stateKey}_${i + index}`);
+      
+      // Unchanged re-uploads re-announce stored batches; skip chunks already in the
+      // collection instead of paying to embed them again
+      const existing = await collection.get({ ids: batchIds, include: [] });
+      const existingIds = new Set(existing.ids);
+      const ids = batchIds.filter((id) => !existingIds.has(id));
+      if (ids.length === 0) {
+        logger.info(`Batch ${i / batchSize + 1} already loaded, skipping`);
+        continue;
+      }
+      const pending = batch.filter((_, index) => !existingIds.has(batchIds[index]));
+      
       // Prepare data for ChromaDB
-      const texts = batch.map((chunk: DocumentChunkType) => chunk.text);
+      const texts = pending.map((chunk: DocumentChunkType) => chunk.text);
       
       // Generate embeddings with memory monitoring
       logger.info(`Generating embeddings for ${texts.length} texts...`);
       const embeddings = await getEmbeddings(texts, embeddingService);
       logger.info(`Generated ${embeddings.length} embeddings`);
       
-      const ids = batch.map((_, index) => `chunk_${i + index}`);
-      const metadatas = batch.map((chunk: DocumentChunkType) => ({
+      const metadatas = pending.map((chunk: DocumentChunkType) => ({
         title: chunk.title,
         source: chunk.metadata.source,
         page: chunk.metadata.page ? chunk.metadata.page.toString() : '1',
@@ -212,12 +225,12 @@ export const handler: Handlers['load-chromadb'] = async (
             documents,
           });
           success = true;
-          logger.info(`Inserted batch ${i / batchSize + 1}`, { count: batch.length });
+          logger.info(`Inserted batch ${i / batchSize + 1}`, { count: pending.length });
         } catch (error) {
           retryCount++;
           logger.warn(`Failed to insert batch ${i / batchSize + 1}, attempt ${retryCount}/${maxRetries}`, { 
             error: error.message,
-            batchSize: batch.length 
+            batchSize: pending.length 
           });
           
           if (retryCount >= maxRetries) {
@@ -1,13 +1,46 @@
+import asyncio
+import gc
+import hashlib
 import os
 import time
 import re
+import threading
+import codecs
 import json
+import unicodedata
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
+from pathlib import Path
 from typing import Dict, Any
 
-from docling.document_converter import DocumentConverter
+from docling.datamodel.base_models import InputFormat
+from docling.datamodel.pipeline_options import (
+    AcceleratorDevice,
+    AcceleratorOptions,
+    PdfPipelineOptions,
+    TableFormerMode,
+)
+from docling.document_converter import DocumentConverter, PdfFormatOption
 from docling.chunking import HybridChunker
 from transformers import AutoTokenizer
 
+try:
+    import pymupdf
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    # PyMuPDF not installed, every PDF goes through Docling
+    PYMUPDF_AVAILABLE = False
+
+try:
+    import psutil
+    # Handle on this process and the machine's total memory, reused for every memory check
+    _PROCESS = psutil.Process()
+    _TOTAL_MEMORY = psutil.virtual_memory().total
+except ImportError:
+    # psutil not available, skip memory logging
+    _PROCESS = None
+
 # Set environment variable to avoid tokenizer parallelism warning
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
@@ -20,57 +53,142 @@ config = {
     "input": None # No schema validation for Python right now
 }
 
+EMBED_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+MAX_TOKENS = 512  # Reduced to match model's maximum sequence length
+
+@lru_cache(maxsize=1)
+def _get_chunker() -> HybridChunker:
+    """Load the tokenizer and build the chunker once per process."""
+    tokenizer = AutoTokenizer.from_pretrained(EMBED_MODEL_ID, use_fast=True)
+    return HybridChunker(
+        tokenizer=tokenizer,
+        max_tokens=MAX_TOKENS,
+    )
+
+# Docling PDF pipeline settings: OCR on/off ("true"/"false") and TableFormer mode ("fast"/"accurate")
+DOCLING_DO_OCR = os.getenv("DOCLING_DO_OCR", "true").lower() == "true"
+# Parsed here so a bad value fails at step load, not on the first document
+_table_mode = os.getenv("DOCLING_TABLE_MODE", "fast").lower()
+try:
+    DOCLING_TABLE_MODE = TableFormerMode(_table_mode)
+except ValueError:
+    raise ValueError(
+        f"Invalid DOCLING_TABLE_MODE {_table_mode!r}, expected one of: "
+        + ", ".join(mode.value for mode in TableFormerMode)
+    ) from None
+
+@lru_cache(maxsize=1)
+def _get_converter() -> DocumentConverter:
+    """Create the Docling converter (and load its models) once per process."""
+    pipeline_options = PdfPipelineOptions(
+        do_ocr=DOCLING_DO_OCR,
+        # Run layout/table models on a GPU when one is available
+        accelerator_options=AcceleratorOptions(
+            # One conversion at a time (see _CONVERT_LOCK), so its models get every core
+            num_threads=os.cpu_count() or 1,
+            device=AcceleratorDevice.AUTO,
+        ),
+    )
+    pipeline_options.table_structure_options.mode = DOCLING_TABLE_MODE
+    return DocumentConverter(
+        format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)}
+    )
+
+# The shared converter isn't documented as thread-safe, and concurrent calls
+# would oversubscribe the cores its models already use; serialize conversions
+_CONVERT_LOCK = threading.Lock()
+
+# Characters replaced with '_' when building state keys from filenames
+_UNSAFE_KEY_CHARS_RE = re.compile(r'[^a-zA-Z0-9]')
+
+# Sentence boundaries for token-limited chunking: terminal punctuation plus whitespace
+_SENTENCE_END_RE = re.compile(r'[.!?]\s+')
+
+# IPC text sanitization patterns and replacements, built once
+_CONTROL_CHARS_RE = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]')
+# Control characters plus HTML tags, for JSON knowledge item fields
+_HTML_OR_CONTROL_RE = re.compile(r'<[^>]+>|[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]')
+_UNICODE_SPACES_RE = re.compile(r'[\u2000-\u200F\u2028-\u202F\u205F-\u206F\u3000]')
+_WHITESPACE_RE = re.compile(r'\s+')
+_IPC_REPLACEMENTS = {
+    'å': 'a', 'ä': 'a', 'ö': 'o',
+    'Å': 'A', 'Ä': 'A', 'Ö': 'O',
+    'é': 'e', 'è': 'e', 'ê': 'e', 'ë': 'e',
+    'É': 'E', 'È': 'E', 'Ê': 'E', 'Ë': 'E',
+    'ü': 'u', 'Ü': 'U',
+    'ç': 'c', 'Ç': 'C',
+    'ñ': 'n', 'Ñ': 'N',
+    'ß': 'ss',
+    '–': '-', '—': '-', '…': '...',
+    '\u201c': '"', '\u201d': '"', '\u2018': "'", '\u2019': "'",
+    '«': '"', '»': '"', '‹': "'", '›': "'"
+}
+_IPC_REPLACEMENTS_RE = re.compile('[' + ''.join(_IPC_REPLACEMENTS) + ']')
+
+# Files processed at once in worker threads; Docling conversion itself is serialized
+PROCESS_CONCURRENCY = min(8, os.cpu_count() or 1)
+
+# Chunks per state entry (and chunks-ready event), keeps each state write bounded
+STATE_BATCH_SIZE = 500
+
 async def handler(input, context):
-    for file in input['files']:
-        # Get file info from input
-        file_path = file['filePath']
-        filename = file['fileName']
-        file_type = file['fileType']
-        
+    # Shared tokenizer/chunker, loaded on first use
+    chunker = _get_chunker()
+    semaphore = asyncio.Semaphore(PROCESS_CONCURRENCY)
+
+    await asyncio.gather(*[
+        _process_one(file, chunker, semaphore, context) for file in input['files']
+    ])
+
+async def _process_one(file, chunker, semaphore, context):
+    """Convert, chunk, store and announce a single file."""
+    # Get file info from input
+    file_path = file['filePath']
+    filename = file['fileName']
+    file_type = file['fileType']
+    # Remove any non-alphanumeric characters and replace spaces with underscores
+    safe_name = _UNSAFE_KEY_CHARS_RE.sub('_', filename)
+    
+    async with semaphore:
         context.logger.info(f"Processing document for ChromaDB: {filename} (type: {file_type})")
         
+        # A re-uploaded document with the same name and content reuses its stored chunks;
+        # the loader skips chunk ids already in the collection, so nothing is re-embedded
+        cache_key = f"chunkcache_{safe_name}_{await asyncio.to_thread(_chunk_cache_digest, file_path)}"
+        cached = await context.state.get('rag-workflow', cache_key)
+        cached = cached.get('data', cached) if isinstance(cached, dict) else cached
+        if isinstance(cached, dict) and cached.get('stateKeys'):
+            context.logger.info(f"Reusing {len(cached['stateKeys'])} stored chunk batches for unchanged {filename}")
+            for batch_state_key in cached['stateKeys']:
+                await _emit_chunks_ready(batch_state_key, context)
+            return
+        
         # Check memory usage before processing
-        try:
-            import psutil
-            process = psutil.Process()
-            memory_info = process.memory_info()
-            memory_percent = process.memory_percent()
+        if _PROCESS is not None:
+            memory_info = _PROCESS.memory_info()
+            # Same as memory_percent(), without reading the process stats a second time
+            memory_percent = memory_info.rss / _TOTAL_MEMORY * 100
             context.logger.info(f"Memory usage before processing {filename}: RSS={memory_info.rss / 1024 / 1024:.1f}MB, VMS={memory_info.vms / 1024 / 1024:.1f}MB, Percent={memory_percent:.1f}%")
             
             # Skip processing if memory usage is too high
             if memory_percent > 90:
                 context.logger.warning(f"Skipping {filename} due to high memory usage: {memory_percent:.1f}%")
                 # Force garbage collection
-                import gc
                 gc.collect()
                 # Wait a bit for memory cleanup
-                import asyncio
                 await asyncio.sleep(2)
-                continue
+                return
             elif memory_percent > 80:
                 context.logger.warning(f"High memory usage detected: {memory_percent:.1f}% - processing may be slow or fail")
-        except ImportError:
-            # psutil not available, skip memory logging
-            pass
-
-        # Initialize components
-        EMBED_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
-        MAX_TOKENS = 512  # Reduced to match model's maximum sequence length
-
-        tokenizer = AutoTokenizer.from_pretrained(EMBED_MODEL_ID)
-        chunker = HybridChunker(
-            tokenizer=tokenizer,
-            max_tokens=MAX_TOKENS,
-        )
 
         chunks = []
         try:
             if file_type == '.txt':
                 # Handle TXT files with custom processing
                 chunks = await process_txt_file(file_path, filename, chunker, context)
-            elif file_type == '.md' and is_json_file(file_path):
-                # Handle JSON files with .md extension
-                chunks = await process_json_file(file_path, filename, chunker, context)
+            elif file_type == '.md' and (data := await asyncio.to_thread(load_json_file, file_path)) is not None:
+                # Handle JSON files with .md extension (read and parsed once, off the event loop)
+                chunks = await process_json_file(data, filename, chunker, context)
             else:
                 # Handle other formats with Docling
                 chunks = await process_docling_file(file_path, filename, file_type, chunker, context)
@@ -81,81 +199,120 @@ async def handler(input, context):
             context.logger.error(f"File path: {file_path}, File type: {file_type}")
             raise e
 
-        context.logger.info(f"Processed {len(chunks)} chunks from {filename} for ChromaDB")
-        
-        # Log memory usage after processing
-        try:
-            import psutil
-            process = psutil.Process()
-            memory_info = process.memory_info()
-            context.logger.info(f"Memory usage after processing {filename}: RSS={memory_info.rss / 1024 / 1024:.1f}MB, VMS={memory_info.vms / 1024 / 1024:.1f}MB")
-        except ImportError:
-            # psutil not available, skip memory logging
-            pass
-
-        # Generate a unique state key using the filename (without extension) and timestamp
-        base_name = os.path.splitext(filename)[0]
-        # Remove any non-alphanumeric characters and replace spaces with underscores
-        safe_name = re.sub(r'[^a-zA-Z0-9]', '_', base_name)
-        chunks_state_key = f"chunks_{safe_name}_{int(time.time())}"
-
-        # Save chunks to state
+    context.logger.info(f"Processed {len(chunks)} chunks from {filename} for ChromaDB")
+    
+    # Log memory usage after processing
+    if _PROCESS is not None:
+        memory_info = _PROCESS.memory_info()
+        context.logger.info(f"Memory usage after processing {filename}: RSS={memory_info.rss / 1024 / 1024:.1f}MB, VMS={memory_info.vms / 1024 / 1024:.1f}MB")
+
+    # Generate a unique state key using the filename and timestamp; the extension
+    # is kept so files sharing a base name in the same batch don't collide
+    chunks_state_key = f"chunks_{safe_name}_{int(time.time())}"
+
+    # Save chunks to state in batches under numbered keys, announcing each batch as
+    # soon as it is stored so the loader can start on it while the rest are written
+    state_keys = []
+    for batch_number, start in enumerate(range(0, len(chunks), STATE_BATCH_SIZE)):
+        batch_state_key = f"{chunks_state_key}_{batch_number}"
         try:
-            # Final sanitization of all chunks before saving to state
-            sanitized_chunks = [sanitize_chunk_for_ipc(chunk) for chunk in chunks]
-            await context.state.set('rag-workflow', chunks_state_key, sanitized_chunks)
-            context.logger.info(f"Saved {len(sanitized_chunks)} sanitized chunks to state with key: {chunks_state_key}")
+            # Every process_* function returns chunks already sanitized for IPC
+            await context.state.set('rag-workflow', batch_state_key, chunks[start:start + STATE_BATCH_SIZE])
         except Exception as e:
             context.logger.error(f"Error saving chunks to state: {str(e)}", exc_info=True)
             raise e
+        
+        await _emit_chunks_ready(batch_state_key, context)
+        state_keys.append(batch_state_key)
+    
+    context.logger.info(f"Saved {len(chunks)} sanitized chunks to state in {len(state_keys)} batches with key prefix: {chunks_state_key}")
 
-        try:
-            await context.emit({
-                "topic": "rag.chunks.ready.chromadb",
-                "data": {
-                    "stateKey": chunks_state_key
-                }
-            })
-            context.logger.info(f"Successfully emitted chunks ready event for {len(sanitized_chunks)} chunks")
-            
-            # Add a small delay between files to allow system recovery
-            import asyncio
-            await asyncio.sleep(1)
-            
-        except Exception as e:
-            context.logger.error(f"Error emitting chunks ready event: {str(e)}", exc_info=True)
-            # Don't raise the error for EPIPE issues - they're often transient
-            if "EPIPE" in str(e) or "broken pipe" in str(e).lower():
-                context.logger.warning("EPIPE error detected - this is often transient and may resolve on retry")
-            else:
-                raise e
+    if state_keys:
+        await context.state.set('rag-workflow', cache_key, {'stateKeys': state_keys})
+
+def _chunk_cache_digest(file_path: str) -> str:
+    """SHA-256 of the chunking settings and the file's content, read in blocks (blocking)."""
+    digest = hashlib.sha256(f"{EMBED_MODEL_ID}|{MAX_TOKENS}|".encode())
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+async def _emit_chunks_ready(chunks_state_key: str, context):
+    """Announce stored chunks to the ChromaDB loader."""
+    try:
+        await context.emit({
+            "topic": "rag.chunks.ready.chromadb",
+            "data": {
+                "stateKey": chunks_state_key
+            }
+        })
+        context.logger.info(f"Successfully emitted chunks ready event for state key: {chunks_state_key}")
+        
+    except Exception as e:
+        context.logger.error(f"Error emitting chunks ready event: {str(e)}", exc_info=True)
+        # Don't raise the error for EPIPE issues - they're often transient
+        if "EPIPE" in str(e) or "broken pipe" in str(e).lower():
+            context.logger.warning("EPIPE error detected - this is often transient and may resolve on retry")
+        else:
+            raise e
 
 async def process_txt_file(file_path: str, filename: str, chunker, context):
     """Process TXT files with custom text processing."""
     context.logger.info(f"Processing TXT file with custom text processor: {filename}")
     
-    # Read the text file
-    with open(file_path, 'r', encoding='utf-8') as f:
-        text_content = f.read()
+    # Reading, tokenizing and packing run in a worker thread so other files keep progressing
+    return await asyncio.to_thread(_txt_chunks, file_path, filename, chunker)
+
+def _txt_chunks(file_path: str, filename: str, chunker) -> list:
+    """Pack a text file's paragraphs into token-limited, sanitized chunks (blocking)."""
+    text_content = Path(file_path).read_text(encoding='utf-8')
     
-    # Create a simple document-like object for chunking
-    # We'll split the text into paragraphs and process each as a chunk
-    paragraphs = [p.strip() for p in text_content.split('\n\n') if p.strip()]
+    # Split the text into paragraphs (each stripped once); only paragraphs with real
+    # content are kept, but numbering still counts every non-empty paragraph
+    numbered = [
+        (i + 1, paragraph)
+        for i, paragraph in enumerate(p for p in map(str.strip, text_content.split('\n\n')) if p)
+        if len(paragraph) > 10
+    ]
+    if not numbered:
+        return []
+    numbers, paragraphs = zip(*numbered)
+    
+    # One batched tokenizer call for all paragraphs; the blank lines joining
+    # adjacent paragraphs add no tokens, so counts can be summed
+    paragraph_tokens, scale, overhead = _sentence_token_counts(list(paragraphs), chunker)
+    prefix = [0, *accumulate(paragraph_tokens)]
+    budget = _token_budget(chunker.max_tokens, scale, overhead)
+    # Title and source are the same for every chunk, sanitize them once
+    title = sanitize_text_for_ipc(os.path.splitext(filename)[0])
+    source = sanitize_text_for_ipc(filename)
     
     chunks = []
-    for i, paragraph in enumerate(paragraphs):
-        if len(paragraph) > 10:  # Only process non-empty paragraphs
-            # Use the chunker to split long paragraphs if needed
-            # For simplicity, we'll create chunks directly
-            chunks.append({
-                "text": paragraph,
-                "title": os.path.splitext(filename)[0],
+    start = 0
+    while start < len(paragraphs):
+        # Merge as many adjacent paragraphs as fit the token limit; a paragraph
+        # over the limit on its own is split on sentence boundaries instead
+        end = max(bisect_right(prefix, prefix[start] + budget, lo=start + 1) - 1, start + 1)
+        if paragraph_tokens[start] > budget:
+            texts = chunk_text_by_tokens(paragraphs[start], chunker)
+        else:
+            texts = ["\n\n".join(paragraphs[start:end])]
+        
+        chunks.extend(
+            {
+                "text": sanitize_text_for_ipc(text),
+                "title": title,
                 "metadata": {
-                    "source": filename,
+                    "source": source,
                     "file_type": "txt",
-                    "paragraph": i + 1
+                    # First paragraph in the chunk
+                    "paragraph": numbers[start]
                 }
-            })
+            }
+            for text in texts
+        )
+        start = end
     
     return chunks
 
@@ -163,207 +320,261 @@ async def process_docling_file(file_path: str, filename: str, file_type: str, ch
     """Process files using Docling DocumentConverter."""
     context.logger.info(f"Processing {file_type} file with Docling: {filename}")
     
-    # Initialize Docling converter
-    converter = DocumentConverter()
+    # Conversion and chunking are blocking, run them in a worker thread
+    return await asyncio.to_thread(_docling_chunks, file_path, filename, file_type, chunker)
+
+def _docling_chunks(file_path: str, filename: str, file_type: str, chunker) -> list:
+    """Convert a document with Docling and build sanitized chunks (blocking)."""
+    # Text-only PDFs skip Docling's layout and OCR models
+    if file_type == '.pdf' and (pages := _pdf_text_layer(file_path)) is not None:
+        return _pdf_text_chunks(pages, filename, chunker)
+    
+    # Shared Docling converter, models are loaded on first use
+    converter = _get_converter()
     
     # Convert document to Docling document
-    result = converter.convert(file_path)
+    with _CONVERT_LOCK:
+        result = converter.convert(file_path)
     doc = result.document
 
-    # Get chunks using the chunker
-    chunks = []
-    for chunk in chunker.chunk(dl_doc=doc):
-        chunks.append({
-            "text": chunk.text,
-            "title": os.path.splitext(filename)[0],
+    # Get chunks using the chunker; only the text differs per chunk, so the
+    # shared fields are sanitized once
+    title = sanitize_text_for_ipc(os.path.splitext(filename)[0])
+    source = sanitize_text_for_ipc(filename)
+    file_type = sanitize_text_for_ipc(file_type)
+    return [
+        {
+            "text": sanitize_text_for_ipc(chunk.text),
+            "title": title,
             "metadata": {
-                "source": filename,
+                "source": source,
                 "file_type": file_type,
-                "page": chunk.page_number if hasattr(chunk, 'page_number') else 1
+                "page": getattr(chunk, 'page_number', 1)
             }
-        })
+        }
+        for chunk in chunker.chunk(dl_doc=doc)
+    ]
+
+# Minimum embedded text per page for a PDF to be read without Docling
+FAST_PDF_MIN_CHARS_PER_PAGE = 200
+
+def _pdf_text_layer(file_path: str):
+    """
+    Return each page's embedded text for text-only PDFs, or None when the PDF
+    needs Docling (PyMuPDF missing, unreadable file, images/scans, or too
+    little text to trust the text layer).
+    """
+    if not PYMUPDF_AVAILABLE:
+        return None
     
+    try:
+        with pymupdf.open(file_path) as doc:
+            pages = []
+            for page in doc:
+                if page.get_images():
+                    return None
+                pages.append(page.get_text())
+    except Exception:
+        # Let Docling open (and report on) the file
+        return None
+    
+    if not pages or sum(map(len, pages)) < FAST_PDF_MIN_CHARS_PER_PAGE * len(pages):
+        return None
+    return pages
+
+def _pdf_text_chunks(pages: list, filename: str, chunker) -> list:
+    """Build sanitized, token-limited chunks from a PDF's page texts."""
+    title = sanitize_text_for_ipc(os.path.splitext(filename)[0])
+    source = sanitize_text_for_ipc(filename)
+    chunks = []
+    for page_number, page_text in enumerate(pages, 1):
+        chunks.extend(
+            {
+                "text": sanitize_text_for_ipc(chunk_text),
+                "title": title,
+                "metadata": {
+                    "source": source,
+                    "file_type": ".pdf",
+                    "page": page_number
+                }
+            }
+            for chunk_text in chunk_text_by_tokens(page_text, chunker)
+            if chunk_text.strip()
+        )
     return chunks
 
-def is_json_file(file_path: str) -> bool:
-    """Check if a file contains valid JSON content."""
+# Bytes read to decide whether a .md file holds JSON
+JSON_SNIFF_BYTES = 4096
+
+def decode_text(raw: bytes) -> str:
+    """Decode file content: UTF-8 (with or without BOM), else Latin-1."""
+    if raw.startswith(codecs.BOM_UTF8):
+        raw = raw[len(codecs.BOM_UTF8):]
     try:
-        # Try multiple encodings to handle various file encodings
-        encodings_to_try = ['utf-8', 'utf-8-sig', 'latin1', 'cp1252', 'iso-8859-1']
-        
-        for encoding in encodings_to_try:
-            try:
-                with open(file_path, 'r', encoding=encoding) as f:
-                    content = f.read().strip()
-                # Try to parse as JSON
-                json.loads(content)
-                return True
-            except (UnicodeDecodeError, json.JSONDecodeError):
-                continue
-        
-        return False
-    except FileNotFoundError:
-        return False
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        # Latin-1 maps every byte, so this always succeeds
+        return raw.decode('latin1')
+
+def load_json_file(file_path: str):
+    """Parse a file as a JSON object or array, returning None if it is missing or not valid JSON."""
+    try:
+        with open(file_path, 'rb') as f:
+            head = f.read(JSON_SNIFF_BYTES)
+            # Markdown is rejected from its first bytes, without reading or parsing the rest
+            if head.removeprefix(codecs.BOM_UTF8).lstrip()[:1] not in (b'{', b'['):
+                return None
+            raw = head + f.read()
+        return json.loads(decode_text(raw).strip())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
 
-async def process_json_file(file_path: str, filename: str, chunker, context):
-    """Process JSON files with proper encoding and chunking."""
+async def process_json_file(data, filename: str, chunker, context):
+    """Process parsed JSON content with chunking."""
     context.logger.info(f"Processing JSON file: {filename}")
     
     try:
-        # Try multiple encodings to handle various file encodings
-        content = None
-        encodings_to_try = ['utf-8', 'utf-8-sig', 'latin1', 'cp1252', 'iso-8859-1']
-        
-        for encoding in encodings_to_try:
-            try:
-                with open(file_path, 'r', encoding=encoding) as f:
-                    content = f.read().strip()
-                context.logger.debug(f"Successfully read file with encoding: {encoding}")
-                break
-            except UnicodeDecodeError as e:
-                context.logger.debug(f"Failed to read with encoding {encoding}: {e}")
-                continue
-        
-        if content is None:
-            raise ValueError(f"Could not read file {filename} with any of the attempted encodings: {encodings_to_try}")
+        # Structure walk and tokenization are CPU-bound, run them off the event loop
+        return await asyncio.to_thread(_json_chunks, data, filename, chunker)
         
-        # Parse JSON
-        data = json.loads(content)
-        
-        chunks = []
-        
-        # Handle different JSON structures
-        if isinstance(data, dict):
-            if 'item' in data and isinstance(data['item'], list):
-                # Handle knowledge items structure
-                for i, item in enumerate(data['item']):
-                    if isinstance(item, dict):
-                        # Extract relevant text content
-                        text_parts = []
+    except Exception as e:
+        context.logger.error(f"Error processing JSON file {filename}: {str(e)}")
+        raise e
+
+def _json_chunks(data, filename: str, chunker) -> list:
+    """Build sanitized chunks from parsed JSON content (blocking)."""
+    chunks = []
+    
+    # Fields shared by many chunks are sanitized once, not per chunk;
+    # only each chunk's text is sanitized as it is built
+    source = sanitize_text_for_ipc(filename)
+    base_title = os.path.splitext(filename)[0]
+    
+    # Handle different JSON structures
+    if isinstance(data, dict):
+        if 'item' in data and isinstance(data['item'], list):
+            # Handle knowledge items structure
+            for i, item in enumerate(data['item']):
+                if isinstance(item, dict):
+                    # Extract relevant text content
+                    text_parts = []
+                    
+                    # Add title if available
+                    if 'translation' in item and 'content' in item['translation']:
+                        content_obj = item['translation']['content']
+                        if 'title' in content_obj and content_obj['title']:
+                            title = sanitize_text_for_ipc(content_obj['title'])
+                            text_parts.append(f"Title: {title}")
                         
-                        # Add title if available
-                        if 'translation' in item and 'content' in item['translation']:
-                            content_obj = item['translation']['content']
-                            if 'title' in content_obj and content_obj['title']:
-                                title = sanitize_text_for_ipc(content_obj['title'])
-                                text_parts.append(f"Title: {title}")
-                            
-                            # Add description if available
-                            if 'description' in content_obj and content_obj['description']:
-                                # Clean HTML tags for better text processing
-                                description = re.sub(r'<[^>]+>', '', content_obj['description'])
-                                # Sanitize text for IPC compatibility
-                                description = sanitize_text_for_ipc(description)
-                                if description.strip():
-                                    text_parts.append(f"Description: {description.strip()}")
-                            
-                            # Add main content if available
-                            if 'content' in content_obj and content_obj['content']:
-                                # Clean HTML tags for better text processing
-                                main_content = re.sub(r'<[^>]+>', '', content_obj['content'])
-                                # Sanitize text for IPC compatibility
-                                main_content = sanitize_text_for_ipc(main_content)
-                                if main_content.strip():
-                                    text_parts.append(f"Content: {main_content.strip()}")
+                        # Add description if available
+                        if 'description' in content_obj and content_obj['description']:
+                            # Clean HTML tags and sanitize for IPC compatibility (result is stripped)
+                            description = sanitize_text_for_ipc(content_obj['description'], strip_html=True)
+                            if description:
+                                text_parts.append(f"Description: {description}")
                         
-                        # Combine all text parts
-                        combined_text = "\n\n".join(text_parts)
+                        # Add main content if available
+                        if 'content' in content_obj and content_obj['content']:
+                            # Clean HTML tags and sanitize for IPC compatibility (result is stripped)
+                            main_content = sanitize_text_for_ipc(content_obj['content'], strip_html=True)
+                            if main_content:
+                                text_parts.append(f"Content: {main_content}")
+                    
+                    # Combine all text parts
+                    combined_text = "\n\n".join(text_parts)
+                    
+                    if combined_text.strip():
+                        # Use chunker to ensure proper token limits
+                        chunk_texts = chunk_text_by_tokens(combined_text, chunker)
+                        total_chunks = len(chunk_texts)
+                        title = sanitize_text_for_ipc(f"{base_title} - Item {i+1}")
+                        item_id = _sanitize_value(item.get('id', f'item_{i+1}'))
+                        item_number = _sanitize_value(item.get('number', ''))
                         
-                        if combined_text.strip():
-                            # Use chunker to ensure proper token limits
-                            chunk_texts = chunk_text_by_tokens(combined_text, chunker)
-                            
-                            for j, chunk_text in enumerate(chunk_texts):
-                                chunk = {
-                                    "text": chunk_text,
-                                    "title": f"{os.path.splitext(filename)[0]} - Item {i+1}",
-                                    "metadata": {
-                                        "source": filename,
-                                        "file_type": "json",
-                                        "item_id": item.get('id', f'item_{i+1}'),
-                                        "item_number": item.get('number', ''),
-                                        "chunk_index": j + 1,
-                                        "total_chunks": len(chunk_texts)
-                                    }
+                        chunks.extend(
+                            {
+                                "text": sanitize_text_for_ipc(chunk_text),
+                                "title": title,
+                                "metadata": {
+                                    "source": source,
+                                    "file_type": "json",
+                                    "item_id": item_id,
+                                    "item_number": item_number,
+                                    "chunk_index": j + 1,
+                                    "total_chunks": total_chunks
                                 }
-                                chunks.append(sanitize_chunk_for_ipc(chunk))
-            else:
-                # Handle other JSON structures
-                text_content = json.dumps(data, ensure_ascii=False, indent=2)
+                            }
+                            for j, chunk_text in enumerate(chunk_texts)
+                        )
+        else:
+            # Handle other JSON structures
+            text_content = json.dumps(data, ensure_ascii=False, indent=2)
+            chunk_texts = chunk_text_by_tokens(text_content, chunker)
+            total_chunks = len(chunk_texts)
+            title = sanitize_text_for_ipc(base_title)
+            
+            chunks.extend(
+                {
+                    "text": sanitize_text_for_ipc(chunk_text),
+                    "title": title,
+                    "metadata": {
+                        "source": source,
+                        "file_type": "json",
+                        "chunk_index": i + 1,
+                        "total_chunks": total_chunks
+                    }
+                }
+                for i, chunk_text in enumerate(chunk_texts)
+            )
+    elif isinstance(data, list):
+        # Handle JSON arrays
+        for i, item in enumerate(data):
+            if isinstance(item, (dict, str)):
+                text_content = json.dumps(item, ensure_ascii=False, indent=2)
                 chunk_texts = chunk_text_by_tokens(text_content, chunker)
+                total_chunks = len(chunk_texts)
+                title = sanitize_text_for_ipc(f"{base_title} - Item {i+1}")
                 
-                for i, chunk_text in enumerate(chunk_texts):
-                    chunk = {
-                        "text": chunk_text,
-                        "title": os.path.splitext(filename)[0],
+                chunks.extend(
+                    {
+                        "text": sanitize_text_for_ipc(chunk_text),
+                        "title": title,
                         "metadata": {
-                            "source": filename,
+                            "source": source,
                             "file_type": "json",
-                            "chunk_index": i + 1,
-                            "total_chunks": len(chunk_texts)
+                            "item_index": i + 1,
+                            "chunk_index": j + 1,
+                            "total_chunks": total_chunks
                         }
                     }
-                    chunks.append(sanitize_chunk_for_ipc(chunk))
-        elif isinstance(data, list):
-            # Handle JSON arrays
-            for i, item in enumerate(data):
-                if isinstance(item, (dict, str)):
-                    text_content = json.dumps(item, ensure_ascii=False, indent=2)
-                    chunk_texts = chunk_text_by_tokens(text_content, chunker)
-                    
-                    for j, chunk_text in enumerate(chunk_texts):
-                        chunk = {
-                            "text": chunk_text,
-                            "title": f"{os.path.splitext(filename)[0]} - Item {i+1}",
-                            "metadata": {
-                                "source": filename,
-                                "file_type": "json",
-                                "item_index": i + 1,
-                                "chunk_index": j + 1,
-                                "total_chunks": len(chunk_texts)
-                            }
-                        }
-                        chunks.append(sanitize_chunk_for_ipc(chunk))
-        
-        return chunks
-        
-    except Exception as e:
-        context.logger.error(f"Error processing JSON file {filename}: {str(e)}")
-        raise e
+                    for j, chunk_text in enumerate(chunk_texts)
+                )
+    
+    return chunks
 
 def chunk_text_by_tokens(text: str, chunker) -> list:
     """Split text into chunks that respect token limits."""
-    # Simple chunking by splitting on sentences and ensuring token limits
-    sentences = re.split(r'[.!?]\s+', text)
+    # Simple chunking on sentence boundaries; sentences are tracked as offsets
+    # into text and each chunk is sliced out of it once
+    bounds = [0, *(match.end() for match in _SENTENCE_END_RE.finditer(text)), len(text)]
+    sentences = [text[start:end] for start, end in zip(bounds, bounds[1:])]
     chunks = []
-    current_chunk = ""
     
-    for sentence in sentences:
-        # Add sentence to current chunk
-        test_chunk = current_chunk + (" " if current_chunk else "") + sentence
-        
-        # Check if adding this sentence would exceed token limit
-        # Use the tokenizer's tokenize method instead of encode
-        try:
-            tokens = chunker.tokenizer.tokenize(test_chunk)
-            # Add 2 for special tokens (CLS and SEP)
-            token_count = len(tokens) + 2
-        except AttributeError:
-            # Fallback: estimate tokens by word count (rough approximation)
-            token_count = len(test_chunk.split()) * 1.3  # Rough estimate
-        
-        if token_count > chunker.max_tokens:
-            # If current chunk is not empty, save it
-            if current_chunk.strip():
-                chunks.append(current_chunk.strip())
-            # Start new chunk with current sentence
-            current_chunk = sentence
-        else:
-            current_chunk = test_chunk
+    # Each sentence is tokenized once; prefix[k] is the token count of the first k sentences
+    sentence_tokens, scale, overhead = _sentence_token_counts(sentences, chunker)
+    prefix = [0, *accumulate(sentence_tokens)]
+    budget = _token_budget(chunker.max_tokens, scale, overhead)
     
-    # Add the last chunk if it's not empty
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
+    start = 0
+    while start < len(sentences):
+        # Binary search for the most sentences that fit the token limit;
+        # a single sentence over the limit still becomes its own chunk
+        end = max(bisect_right(prefix, prefix[start] + budget, lo=start + 1) - 1, start + 1)
+        # Skip chunks that are empty after stripping
+        current_chunk = text[bounds[start]:bounds[end]].strip()
+        if current_chunk:
+            chunks.append(current_chunk)
+        start = end
     
     # If no chunks were created (text is very short), return the original text
     if not chunks:
@@ -371,8 +582,44 @@ def chunk_text_by_tokens(text: str, chunker) -> list:
     
     return chunks
 
-def sanitize_text_for_ipc(text: str) -> str:
-    """Sanitize text to ensure IPC compatibility by handling problematic characters."""
+def _token_budget(max_tokens: int, scale, overhead: int) -> int:
+    """Largest summed sentence count n for which n * scale + overhead stays within max_tokens."""
+    budget = int((max_tokens - overhead) / scale)
+    # Settle float rounding so the bound matches the direct comparison exactly
+    while (budget + 1) * scale + overhead <= max_tokens:
+        budget += 1
+    while budget * scale + overhead > max_tokens:
+        budget -= 1
+    return budget
+
+def _sentence_token_counts(sentences: list, chunker) -> tuple:
+    """
+    Count each sentence's tokens once.
+    
+    Returns (counts, scale, overhead): a chunk's token count is
+    sum(counts) * scale + overhead.
+    
+    The tokenizer splits on whitespace before WordPiece, so the count for
+    sentences joined with spaces is the sum of their individual counts.
+    """
+    tokenizer = getattr(chunker, 'tokenizer', None)
+    if not hasattr(tokenizer, 'tokenize'):
+        # Fallback: estimate tokens by word count (rough approximation)
+        return [len(sentence.split()) for sentence in sentences], 1.3, 0
+    
+    # One batched call into the fast (Rust) tokenizer for all sentences;
+    # special tokens are left out here and added once per chunk below
+    input_ids = tokenizer(sentences, add_special_tokens=False)['input_ids']
+    
+    # Add 2 for special tokens (CLS and SEP)
+    return [len(ids) for ids in input_ids], 1, 2
+
+def sanitize_text_for_ipc(text: str, strip_html: bool = False) -> str:
+    """
+    Sanitize text to ensure IPC compatibility by handling problematic characters.
+    
+    With strip_html, HTML tags are removed in the same pass as control characters.
+    """
     if not text:
         return text
     
@@ -381,84 +628,34 @@ def sanitize_text_for_ipc(text: str) -> str:
         if isinstance(text, bytes):
             text = text.decode('utf-8', errors='replace')
         
-        # More aggressive sanitization for IPC compatibility
-        # Replace all non-ASCII characters that might cause issues
-        import unicodedata
-        
-        # Normalize the text first
-        text = unicodedata.normalize('NFKD', text)
-        
-        # Replace problematic characters that can cause IPC issues
-        # Replace non-printable characters except common whitespace
-        text = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', text)
-        
-        # Replace problematic Unicode characters that can cause encoding issues
-        text = re.sub(r'[\u2000-\u200F\u2028-\u202F\u205F-\u206F\u3000]', ' ', text)
+        # Replace non-printable characters except common whitespace (and HTML tags when asked);
+        # the passes below never introduce either, so this can run first on the full text
+        text = (_HTML_OR_CONTROL_RE if strip_html else _CONTROL_CHARS_RE).sub('', text)
         
-        # Replace Swedish characters with ASCII equivalents to avoid IPC issues
-        replacements = {
-            'å': 'a', 'ä': 'a', 'ö': 'o',
-            'Å': 'A', 'Ä': 'A', 'Ö': 'O',
-            'é': 'e', 'è': 'e', 'ê': 'e', 'ë': 'e',
-            'É': 'E', 'È': 'E', 'Ê': 'E', 'Ë': 'E',
-            'ü': 'u', 'Ü': 'U',
-            'ç': 'c', 'Ç': 'C',
-            'ñ': 'n', 'Ñ': 'N',
-            'ß': 'ss',
-            '–': '-', '—': '-', '…': '...',
-            '"': '"', '"': '"', ''': "'", ''': "'",
-            '«': '"', '»': '"', '‹': "'", '›': "'"
-        }
-        
-        for old, new in replacements.items():
-            text = text.replace(old, new)
-        
-        # Remove any remaining non-ASCII characters
-        text = ''.join(c for c in text if ord(c) < 128)
+        # More aggressive sanitization for IPC compatibility
+        # (pure ASCII text only needs the whitespace pass)
+        if not text.isascii():
+            # Normalize the text first (splits accented letters into base + combining mark)
+            text = unicodedata.normalize('NFKD', text)
+            
+            # Replace problematic Unicode characters that can cause encoding issues
+            text = _UNICODE_SPACES_RE.sub(' ', text)
+            
+            # Replace Swedish characters and typographic punctuation with ASCII equivalents
+            text = _IPC_REPLACEMENTS_RE.sub(lambda match: _IPC_REPLACEMENTS[match.group()], text)
+            
+            # Remove any remaining non-ASCII characters
+            text = text.encode('ascii', 'ignore').decode('ascii')
         
         # Normalize whitespace
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Ensure the text can be encoded as UTF-8
-        text.encode('utf-8')
-        
-        return text.strip()
+        return ' '.join(text.split())
         
     except (UnicodeEncodeError, UnicodeDecodeError) as e:
         # Final fallback: replace everything with safe characters
         text = ''.join(c if c.isalnum() or c.isspace() or c in '.,!?;:-()[]{}' else ' ' for c in str(text))
-        text = re.sub(r'\s+', ' ', text)
+        text = _WHITESPACE_RE.sub(' ', text)
         return text.strip()
 
-def sanitize_chunk_for_ipc(chunk: dict) -> dict:
-    """Sanitize an entire chunk object for IPC compatibility."""
-    try:
-        # Create a deep copy to avoid modifying the original
-        import copy
-        sanitized_chunk = copy.deepcopy(chunk)
-        
-        # Sanitize all string fields
-        if 'text' in sanitized_chunk:
-            sanitized_chunk['text'] = sanitize_text_for_ipc(sanitized_chunk['text'])
-        
-        if 'title' in sanitized_chunk:
-            sanitized_chunk['title'] = sanitize_text_for_ipc(sanitized_chunk['title'])
-        
-        if 'metadata' in sanitized_chunk and isinstance(sanitized_chunk['metadata'], dict):
-            for key, value in sanitized_chunk['metadata'].items():
-                if isinstance(value, str):
-                    sanitized_chunk['metadata'][key] = sanitize_text_for_ipc(value)
-        
-        return sanitized_chunk
-        
-    except Exception as e:
-        # If sanitization fails, return a minimal safe chunk
-        return {
-            "text": "Content processing error",
-            "title": "Error",
-            "metadata": {
-                "source": "unknown",
-                "file_type": "error",
-                "error": "sanitization_failed"
-            }
-        }
+def _sanitize_value(value):
+    """Sanitize a metadata value for IPC if it is a string; other values pass through."""
+    return sanitize_text_for_ipc(value) if isinstance(value, str) else value
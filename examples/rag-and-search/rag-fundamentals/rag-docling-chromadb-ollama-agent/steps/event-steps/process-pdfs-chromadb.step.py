@@ -1,9 +1,19 @@
+import asyncio
 import os
 import time
 import re
+import threading
+from functools import lru_cache
 from typing import Dict, Any
 
-from docling.document_converter import DocumentConverter
+from docling.datamodel.base_models import InputFormat
+from docling.datamodel.pipeline_options import (
+    AcceleratorDevice,
+    AcceleratorOptions,
+    PdfPipelineOptions,
+    TableFormerMode,
+)
+from docling.document_converter import DocumentConverter, PdfFormatOption
 from docling.chunking import HybridChunker
 from transformers import AutoTokenizer
 
@@ -20,67 +30,126 @@ config = {
     # input.stateKey: str
 }
 
+EMBED_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+MAX_TOKENS = 1024
+
+# Characters replaced with '_' when building state keys from filenames
+_UNSAFE_KEY_CHARS_RE = re.compile(r'[^a-zA-Z0-9]')
+
+@lru_cache(maxsize=1)
+def _get_chunker() -> HybridChunker:
+    """Load the tokenizer and build the chunker once per process."""
+    tokenizer = AutoTokenizer.from_pretrained(EMBED_MODEL_ID)
+    return HybridChunker(
+        tokenizer=tokenizer,
+        max_tokens=MAX_TOKENS,
+    )
+
+# Docling PDF pipeline settings: OCR on/off ("true"/"false") and TableFormer mode ("fast"/"accurate")
+DOCLING_DO_OCR = os.getenv("DOCLING_DO_OCR", "true").lower() == "true"
+# Parsed here so a bad value fails at step load, not on the first document
+_table_mode = os.getenv("DOCLING_TABLE_MODE", "fast").lower()
+try:
+    DOCLING_TABLE_MODE = TableFormerMode(_table_mode)
+except ValueError:
+    raise ValueError(
+        f"Invalid DOCLING_TABLE_MODE {_table_mode!r}, expected one of: "
+        + ", ".join(mode.value for mode in TableFormerMode)
+    ) from None
+
+@lru_cache(maxsize=1)
+def _get_converter() -> DocumentConverter:
+    """Create the Docling converter (and load its models) once per process."""
+    pipeline_options = PdfPipelineOptions(
+        do_ocr=DOCLING_DO_OCR,
+        # Run layout/table models on a GPU when one is available
+        accelerator_options=AcceleratorOptions(
+            # One conversion at a time (see _CONVERT_LOCK), so its models get every core
+            num_threads=os.cpu_count() or 1,
+            device=AcceleratorDevice.AUTO,
+        ),
+    )
+    pipeline_options.table_structure_options.mode = DOCLING_TABLE_MODE
+    return DocumentConverter(
+        format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)}
+    )
+
+# The shared converter isn't documented as thread-safe, and concurrent calls
+# would oversubscribe the cores its models already use; serialize conversions
+_CONVERT_LOCK = threading.Lock()
+
+# PDFs processed at once in worker threads; Docling conversion itself is serialized
+PROCESS_CONCURRENCY = min(8, os.cpu_count() or 1)
+
 async def handler(input, context):
-    for file in input['files']:
-        # Get file info from input
-        file_path = file['filePath']
-        filename = file['fileName']
-        
-        context.logger.info(f"Processing PDF file for ChromaDB: {filename}")
+    # Shared tokenizer/chunker, loaded on first use
+    chunker = _get_chunker()
+    semaphore = asyncio.Semaphore(PROCESS_CONCURRENCY)
+
+    await asyncio.gather(*[
+        _process_one(file, chunker, semaphore, context) for file in input['files']
+    ])
 
-        # Initialize Docling converter and chunker
-        converter = DocumentConverter()
-        EMBED_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
-        MAX_TOKENS = 1024
+async def _process_one(file, chunker, semaphore, context):
+    """Convert, chunk, store and announce a single PDF."""
+    # Get file info from input
+    file_path = file['filePath']
+    filename = file['fileName']
 
-        tokenizer = AutoTokenizer.from_pretrained(EMBED_MODEL_ID)
-        chunker = HybridChunker(
-            tokenizer=tokenizer,
-            max_tokens=MAX_TOKENS,
-        )
+    async with semaphore:
+        context.logger.info(f"Processing PDF file for ChromaDB: {filename}")
 
         # In case of the warning:
         #  Token indices sequence length is longer than the specified maximum sequence length for this model (554 > 512).
         #  Running this sequence through the model will result in indexing errors
         #  https://docling-project.github.io/docling/faq/#hybridchunker-triggers-warning-token-indices-sequence-length-is-longer-than-the-specified-maximum-sequence-length-for-this-model
 
-        # Process the PDF
-        chunks = []
+        # Process the PDF; conversion and chunking are blocking, run them in a worker thread
         try:
-            # Convert PDF to Docling document
-            result = converter.convert(file_path)
-            doc = result.document
-
-            # Get chunks using the chunker
-            for chunk in chunker.chunk(dl_doc=doc):
-                chunks.append({
-                    "text": chunk.text,
-                    "title": os.path.splitext(filename)[0],
-                    "metadata": {
-                        "source": filename,
-                        "page": chunk.page_number if hasattr(chunk, 'page_number') else 1
-                    }
-                })
-
+            chunks = await asyncio.to_thread(_pdf_chunks, file_path, filename, chunker)
         except Exception as e:
             context.logger.error(f"Error processing {filename} for ChromaDB: {str(e)}")
             raise e
 
-        context.logger.info(f"Processed {len(chunks)} chunks from PDF for ChromaDB")
+    context.logger.info(f"Processed {len(chunks)} chunks from PDF for ChromaDB")
+
+    # Generate a unique state key using the filename (without extension) and timestamp
+    base_name = os.path.splitext(filename)[0]
+    # Remove any non-alphanumeric characters and replace spaces with underscores
+    safe_name = _UNSAFE_KEY_CHARS_RE.sub('_', base_name)
+    chunks_state_key = f"chunks_chromadb_{safe_name}_{int(time.time())}"
+
+    # Save chunks to state
+    await context.state.set('rag-workflow', chunks_state_key, chunks)
+    context.logger.info(f"Saved chunks to state with key: {chunks_state_key}")
+
+    await context.emit({
+        "topic": "rag.chunks.ready.chromadb",
+        "data": {
+            "stateKey": chunks_state_key
+        }
+    })
 
-        # Generate a unique state key using the filename (without extension) and timestamp
-        base_name = os.path.splitext(filename)[0]
-        # Remove any non-alphanumeric characters and replace spaces with underscores
-        safe_name = re.sub(r'[^a-zA-Z0-9]', '_', base_name)
-        chunks_state_key = f"chunks_chromadb_{safe_name}_{int(time.time())}"
+def _pdf_chunks(file_path: str, filename: str, chunker) -> list:
+    """Convert a PDF with Docling and chunk it (blocking)."""
+    # Shared Docling converter, models are loaded on first use
+    converter = _get_converter()
 
-        # Save chunks to state
-        await context.state.set('rag-workflow', chunks_state_key, chunks)
-        context.logger.info(f"Saved chunks to state with key: {chunks_state_key}")
+    # Convert PDF to Docling document
+    with _CONVERT_LOCK:
+        result = converter.convert(file_path)
+    doc = result.document
 
-        await context.emit({
-            "topic": "rag.chunks.ready.chromadb",
-            "data": {
-                "stateKey": chunks_state_key
+    # Get chunks using the chunker
+    title = os.path.splitext(filename)[0]
+    return [
+        {
+            "text": chunk.text,
+            "title": title,
+            "metadata": {
+                "source": filename,
+                "page": getattr(chunk, 'page_number', 1)
             }
-        })
+        }
+        for chunk in chunker.chunk(dl_doc=doc)
+    ]